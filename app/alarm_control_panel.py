@@ -2,43 +2,68 @@ import json
 import time
 from datetime import datetime
 from sensors import sensor
+import json_codec
 
 alarm_topic = "alarm_control_panel/tydom/#"
-alarm_config_topic = "homeassistant/alarm_control_panel/tydom/{id}/config"
-alarm_state_topic = "alarm_control_panel/tydom/{id}/state"
-alarm_command_topic = "alarm_control_panel/tydom/{id}/set_alarm_state"
-alarm_attributes_topic = "alarm_control_panel/tydom/{id}/attributes"
+alarm_config_topic = "homeassistant/alarm_control_panel/{namespace}/{id}/config"
+alarm_state_topic = "alarm_control_panel/{namespace}/{id}/state"
+alarm_command_topic = "alarm_control_panel/{namespace}/{id}/set_alarm_state"
+alarm_attributes_topic = "alarm_control_panel/{namespace}/{id}/attributes"
 
 
 class Alarm:
+    # Created once per alarm, later frames go through apply()
+    __slots__ = ('attributes', 'device_id', 'endpoint_id', 'id', 'name',
+                 'current_state', 'mqtt', 'namespace', 'unique_id',
+                 'alarm_pin', 'config_alarm_topic', 'state_topic', 'device',
+                 'config', 'sensors', 'states')
 
     def __init__(self, current_state, alarm_pin=None,
-                 tydom_attributes=None, mqtt=None):
+                 tydom_attributes=None, mqtt=None, namespace='tydom',
+                 states=None):
         self.attributes = tydom_attributes
         self.device_id = self.attributes['device_id']
         self.endpoint_id = self.attributes['endpoint_id']
         self.id = self.attributes['id']
-        self.name = self.attributes['name']
-        self.current_state = current_state
         self.mqtt = mqtt
+        self.namespace = namespace
+        self.states = states
+        # Entities of other hubs than the default one get their own unique ids
+        self.unique_id = self.id if namespace == 'tydom' else namespace + '_' + self.id
         self.alarm_pin = alarm_pin
+        self.config_alarm_topic = alarm_config_topic.format(namespace=self.namespace, id=self.id)
+        self.state_topic = alarm_state_topic.format(namespace=self.namespace, id=self.id)
+        self.name = None
+        self.config = None
+        self.sensors = dict()
+        self.apply(tydom_attributes, current_state)
+
+    # Attributes of a new frame, merged into the known ones
+    def apply(self, tydom_attributes, current_state):
+        if tydom_attributes is not self.attributes:
+            self.attributes.update(tydom_attributes)
+        if self.attributes['name'] != self.name:
+            self.name = self.attributes['name']
+            self.config = None
+        self.current_state = current_state
 
     async def setup(self):
+        # Built once, again only if the name changed
+        if self.config is not None:
+            return
         self.device = {}
         self.device['manufacturer'] = 'Delta Dore'
         self.device['model'] = 'Tyxal'
         self.device['name'] = self.name
-        self.device['identifiers'] = self.id
-
-        self.config_alarm_topic = alarm_config_topic.format(id=self.id)
+        self.device['identifiers'] = self.unique_id
 
         self.config = {}
         self.config['name'] = self.name
-        self.config['unique_id'] = self.id
+        self.config['unique_id'] = self.unique_id
         self.config['device'] = self.device
         # self.config['attributes'] = self.attributes
-        self.config['command_topic'] = alarm_command_topic.format(id=self.id)
-        self.config['state_topic'] = alarm_state_topic.format(id=self.id)
+        self.config['command_topic'] = alarm_command_topic.format(namespace=self.namespace, id=self.id)
+        self.config['state_topic'] = self.state_topic
         #self.config['code'] = self.alarm_pin
 
         self.config['code_arm_required'] = 'false'
@@ -48,12 +73,11 @@ class Alarm:
             self.config['code_arm_required'] = 'true'
 
         self.config['json_attributes_topic'] = alarm_attributes_topic.format(
+            namespace=self.namespace,
             id=self.id)
 
         if (self.mqtt is not None):
-            self.mqtt.mqtt_client.publish(
-                self.config_alarm_topic, json.dumps(
-                    self.config), qos=0)  # Alarm Config
+            self.mqtt.publish_config(self.config_alarm_topic, self.config)  # Alarm Config
 
     async def update(self):
         await self.setup()
@@ -64,16 +88,16 @@ class Alarm:
             print("Alarm sensors Error :")
             print(e)
 
-        self.state_topic = alarm_state_topic.format(
-            id=self.id, state=self.current_state)
         if (self.mqtt is not None):
-            self.mqtt.mqtt_client.publish(
+            self.mqtt.publish(
                 self.state_topic,
                 self.current_state,
                 qos=0,
-                retain=True)  # Alarm State
-            self.mqtt.mqtt_client.publish(
-                self.config['json_attributes_topic'], self.attributes, qos=0)
+                retain=True,
+                immediate=True)  # Alarm State
+            self.mqtt.publish(
+                self.config['json_attributes_topic'], json_codec.dumps(self.attributes), qos=0,
+                immediate=True)
         print(
             "Alarm created / updated : ",
             self.name,
@@ -90,12 +114,17 @@ class Alarm:
             # sensor_name = "tydom_alarm_sensor_"+i
             # print("name "+sensor_name, "elem_name "+i, "attributes_topic_from_device ",self.config['json_attributes_topic'], "mqtt",self.mqtt)
             if not i == 'device_type' or not i == 'id':
-                new_sensor = None
-                new_sensor = sensor(
-                    elem_name=i,
-                    tydom_attributes_payload=self.attributes,
-                    attributes_topic_from_device=self.config['json_attributes_topic'],
-                    mqtt=self.mqtt)
+                new_sensor = self.sensors.get(i)
+                if new_sensor is None:
+                    new_sensor = self.sensors[i] = sensor(
+                        elem_name=i,
+                        tydom_attributes_payload=self.attributes,
+                        attributes_topic_from_device=self.config['json_attributes_topic'],
+                        mqtt=self.mqtt,
+                        namespace=self.namespace,
+                        states=self.states)
+                else:
+                    new_sensor.apply(self.attributes)
                 await new_sensor.update()
     # def __init__(self, name, elem_name, tydom_attributes_payload,
     # attributes_topic_from_device, mqtt=None):
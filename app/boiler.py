@@ -3,18 +3,18 @@ import time
 from datetime import datetime
 from sensors import sensor
 
-climate_config_topic = "homeassistant/climate/tydom/{id}/config"
-sensor_config_topic = "homeassistant/sensor/tydom/{id}/config"
-climate_json_attributes_topic = "climate/tydom/{id}/state"
-
-temperature_command_topic = "climate/tydom/{id}/set_setpoint"
-temperature_state_topic = "climate/tydom/{id}/setpoint"
-current_temperature_topic = "climate/tydom/{id}/temperature"
-mode_state_topic = "climate/tydom/{id}/hvacMode"
-mode_command_topic = "climate/tydom/{id}/set_hvacMode"
-hold_state_topic = "climate/tydom/{id}/thermicLevel"
-hold_command_topic = "climate/tydom/{id}/set_thermicLevel"
-out_temperature_state_topic = "sensor/tydom/{id}/temperature"
+climate_config_topic = "homeassistant/climate/{namespace}/{id}/config"
+sensor_config_topic = "homeassistant/sensor/{namespace}/{id}/config"
+climate_json_attributes_topic = "climate/{namespace}/{id}/state"
+
+temperature_command_topic = "climate/{namespace}/{id}/set_setpoint"
+temperature_state_topic = "climate/{namespace}/{id}/setpoint"
+current_temperature_topic = "climate/{namespace}/{id}/temperature"
+mode_state_topic = "climate/{namespace}/{id}/hvacMode"
+mode_command_topic = "climate/{namespace}/{id}/set_hvacMode"
+hold_state_topic = "climate/{namespace}/{id}/thermicLevel"
+hold_command_topic = "climate/{namespace}/{id}/set_thermicLevel"
+out_temperature_state_topic = "sensor/{namespace}/{id}/temperature"
 
 #temperature = current_temperature_topic
 #setpoint= temperature_command_topic
@@ -44,31 +44,59 @@ out_temperature_state_topic = "sensor/tydom/{id}/temperature"
 
 
 class Boiler:
+    # Created once per boiler, later frames go through apply()
+    __slots__ = ('attributes', 'device_id', 'endpoint_id', 'id', 'name',
+                 'mqtt', 'namespace', 'unique_id', 'tydom_client',
+                 'out_sensor', 'config_topic', 'device', 'config',
+                 'topic_to_func')
 
-    def __init__(self, tydom_attributes, tydom_client=None, mqtt=None):
+    def __init__(self, tydom_attributes, tydom_client=None, mqtt=None,
+                 namespace='tydom'):
 
         self.attributes = tydom_attributes
         self.device_id = self.attributes['device_id']
         self.endpoint_id = self.attributes['endpoint_id']
         self.id = self.attributes['id']
-        self.name = self.attributes['name']
         self.mqtt = mqtt
+        self.namespace = namespace
+        # Entities of other hubs than the default one get their own unique ids
+        self.unique_id = self.id if namespace == 'tydom' else namespace + '_' + self.id
         self.tydom_client = tydom_client
+        self.name = None
+        self.out_sensor = None
+        self.config = None
+        self.apply(tydom_attributes)
+
+    # Attributes of a new frame, merged into the known ones
+    def apply(self, tydom_attributes):
+        if tydom_attributes is not self.attributes:
+            self.attributes.update(tydom_attributes)
+        if self.attributes['name'] != self.name:
+            self.name = self.attributes['name']
+            self.config = None
+        out_sensor = 'outTemperature' in self.attributes
+        if out_sensor != self.out_sensor:
+            self.out_sensor = out_sensor
+            self.config = None
 
     async def setup(self):
+        # Built once, again only if the name or the kind of device changed
+        if self.config is not None:
+            return
         self.device = {}
         self.config = {}
         self.device['manufacturer'] = 'Delta Dore'
         self.device['name'] = self.name
-        self.device['identifiers'] = self.id
+        self.device['identifiers'] = self.unique_id
         # Check if device is an outer temperature sensor
         if 'outTemperature' in self.attributes:
             self.config['name'] = 'Out Temperature'
             self.device['model'] = 'Sensor'
             self.config['device_class'] = 'temperature'
             self.config['unit_of_measurement'] = 'C'
-            self.config_topic = sensor_config_topic.format(id=self.id)
+            self.config_topic = sensor_config_topic.format(namespace=self.namespace, id=self.id)
             self.config['state_topic'] = out_temperature_state_topic.format(
+                namespace=self.namespace,
                 id=self.id)
             self.topic_to_func = {}
         # Check if device is a heater with thermostat sensor
@@ -76,23 +104,30 @@ class Boiler:
             #        elif 'setpoint' in self.attributes:
             self.config['name'] = self.name
             self.device['model'] = 'Climate'
-            self.config_topic = climate_config_topic.format(id=self.id)
+            self.config_topic = climate_config_topic.format(namespace=self.namespace, id=self.id)
             self.config['temperature_command_topic'] = temperature_command_topic.format(
+                namespace=self.namespace,
                 id=self.id)
             self.config['temperature_state_topic'] = temperature_state_topic.format(
+                namespace=self.namespace,
                 id=self.id)
             self.config['current_temperature_topic'] = current_temperature_topic.format(
+                namespace=self.namespace,
                 id=self.id)
             self.config['modes'] = ["off", "heat"]
             self.config['mode_state_topic'] = mode_state_topic.format(
+                namespace=self.namespace,
                 id=self.id)
             self.config['mode_command_topic'] = mode_command_topic.format(
+                namespace=self.namespace,
                 id=self.id)
             self.config['hold_modes'] = [
                 "STOP", "ANTI_FROST", "ECO", "COMFORT", "AUTO"]
             self.config['hold_state_topic'] = hold_state_topic.format(
+                namespace=self.namespace,
                 id=self.id)
             self.config['hold_command_topic'] = hold_command_topic.format(
+                namespace=self.namespace,
                 id=self.id)
         # Electrical heater without thermostat
 #        else:
@@ -107,25 +142,23 @@ class Boiler:
 #            self.config['hold_state_topic'] = hold_state_topic.format(id=self.id)
 #            self.config['hold_command_topic'] = hold_command_topic.format(id=self.id)
 
-        self.config['unique_id'] = self.id
+        self.config['unique_id'] = self.unique_id
 
         if (self.mqtt is not None):
-            self.mqtt.mqtt_client.publish(
-                self.config_topic, json.dumps(
-                    self.config), qos=0)
+            self.mqtt.publish_config(self.config_topic, self.config)
 
     async def update(self):
         await self.setup()
 
         if (self.mqtt is not None):
             if 'temperature' in self.attributes:
-                self.mqtt.mqtt_client.publish(
+                self.mqtt.publish(
                     self.config['current_temperature_topic'],
                     '0' if self.attributes['temperature'] == 'None' else self.attributes['temperature'],
                     qos=0)
             if 'setpoint' in self.attributes:
                 #                self.mqtt.mqtt_client.publish(self.config['temperature_command_topic'], self.attributes['setpoint'], qos=0)
-                self.mqtt.mqtt_client.publish(
+                self.mqtt.publish(
                     self.config['temperature_state_topic'],
                     '10' if self.attributes['setpoint'] == 'None' else self.attributes['setpoint'],
                     qos=0)
@@ -134,16 +167,16 @@ class Boiler:
 #            if 'authorization' in self.attributes:
 #                self.mqtt.mqtt_client.publish(self.config['mode_state_topic'], "off" if self.attributes['authorization'] == "STOP" else "heat", qos=0)
             if 'thermicLevel' in self.attributes:
-                self.mqtt.mqtt_client.publish(
+                self.mqtt.publish(
                     self.config['mode_state_topic'],
                     "off" if self.attributes['thermicLevel'] == "STOP" else "heat",
                     qos=0)
-                self.mqtt.mqtt_client.publish(
+                self.mqtt.publish(
                     self.config['hold_state_topic'],
                     self.attributes['thermicLevel'],
                     qos=0)
             if 'outTemperature' in self.attributes:
-                self.mqtt.mqtt_client.publish(
+                self.mqtt.publish(
                     self.config['state_topic'],
                     self.attributes['outTemperature'],
                     qos=0)
@@ -2,25 +2,50 @@ import json
 import time
 from datetime import datetime
 from sensors import sensor
+import json_codec
 
-cover_command_topic = "cover/tydom/{id}/set_positionCmd"
-cover_config_topic = "homeassistant/cover/tydom/{id}/config"
-cover_position_topic = "cover/tydom/{id}/current_position"
-cover_set_postion_topic = "cover/tydom/{id}/set_position"
-cover_attributes_topic = "cover/tydom/{id}/attributes"
+cover_command_topic = "cover/{namespace}/{id}/set_positionCmd"
+cover_config_topic = "homeassistant/cover/{namespace}/{id}/config"
+cover_position_topic = "cover/{namespace}/{id}/current_position"
+cover_set_postion_topic = "cover/{namespace}/{id}/set_position"
+cover_attributes_topic = "cover/{namespace}/{id}/attributes"
 
 
 class Cover:
-    def __init__(self, tydom_attributes, set_position=None, mqtt=None):
+    # Created once per cover, later frames go through apply()
+    __slots__ = ('attributes', 'device_id', 'endpoint_id', 'id', 'name',
+                 'current_position', 'set_position', 'mqtt', 'namespace',
+                 'unique_id', 'config_topic', 'position_topic', 'device',
+                 'config', 'sensors', 'states')
+
+    def __init__(self, tydom_attributes, set_position=None, mqtt=None,
+                 namespace='tydom', states=None):
 
         self.attributes = tydom_attributes
         self.device_id = self.attributes['device_id']
         self.endpoint_id = self.attributes['endpoint_id']
         self.id = self.attributes['id']
-        self.name = self.attributes['cover_name']
-        self.current_position = self.attributes['position']
         self.set_position = set_position
         self.mqtt = mqtt
+        self.namespace = namespace
+        self.states = states
+        # Entities of other hubs than the default one get their own unique ids
+        self.unique_id = self.id if namespace == 'tydom' else namespace + '_' + self.id
+        self.config_topic = cover_config_topic.format(namespace=self.namespace, id=self.id)
+        self.position_topic = cover_position_topic.format(namespace=self.namespace, id=self.id)
+        self.name = None
+        self.config = None
+        self.sensors = dict()
+        self.apply(tydom_attributes)
+
+    # Attributes of a new frame, merged into the known ones
+    def apply(self, tydom_attributes):
+        if tydom_attributes is not self.attributes:
+            self.attributes.update(tydom_attributes)
+        if self.attributes['cover_name'] != self.name:
+            self.name = self.attributes['cover_name']
+            self.config = None
+        self.current_position = self.attributes['position']
 
     # def id(self):
     #     return self.id
@@ -38,22 +63,26 @@ class Cover:
     #     return self.attributes
 
     async def setup(self):
+        # Built once, again only if the name changed
+        if self.config is not None:
+            return
         self.device = {}
         self.device['manufacturer'] = 'Delta Dore'
         self.device['model'] = 'Volet'
         self.device['name'] = self.name
-        self.device['identifiers'] = self.id
+        self.device['identifiers'] = self.unique_id
 
-        self.config_topic = cover_config_topic.format(id=self.id)
         self.config = {}
         self.config['name'] = self.name
-        self.config['unique_id'] = self.id
+        self.config['unique_id'] = self.unique_id
         # self.config['attributes'] = self.attributes
-        self.config['command_topic'] = cover_command_topic.format(id=self.id)
+        self.config['command_topic'] = cover_command_topic.format(namespace=self.namespace, id=self.id)
         self.config['set_position_topic'] = cover_set_postion_topic.format(
+            namespace=self.namespace,
             id=self.id)
-        self.config['position_topic'] = cover_position_topic.format(id=self.id)
+        self.config['position_topic'] = self.position_topic
         self.config['json_attributes_topic'] = cover_attributes_topic.format(
+            namespace=self.namespace,
             id=self.id)
 
         self.config['payload_open'] = "UP"
@@ -64,9 +93,7 @@ class Cover:
         # print(self.config)
 
         if (self.mqtt is not None):
-            self.mqtt.mqtt_client.publish(
-                self.config_topic, json.dumps(
-                    self.config), qos=0)
+            self.mqtt.publish_config(self.config_topic, self.config)
         # setup_pub = '(self.config_topic, json.dumps(self.config), qos=0)'
         # return(setup_pub)
 
@@ -79,18 +106,15 @@ class Cover:
             print("Cover sensors Error :")
             print(e)
 
-        self.position_topic = cover_position_topic.format(
-            id=self.id, current_position=self.current_position)
-
         if (self.mqtt is not None):
-            self.mqtt.mqtt_client.publish(
+            self.mqtt.publish(
                 self.position_topic,
                 self.current_position,
                 qos=0,
                 retain=True)
             # self.mqtt.mqtt_client.publish('homeassistant/sensor/tydom/last_update', str(datetime.fromtimestamp(time.time())), qos=1, retain=True)
-            self.mqtt.mqtt_client.publish(
-                self.config['json_attributes_topic'], self.attributes, qos=0)
+            self.mqtt.publish(
+                self.config['json_attributes_topic'], json_codec.dumps(self.attributes), qos=0)
         print(
             "Cover created / updated : ",
             self.name,
@@ -106,12 +130,17 @@ class Cover:
             # sensor_name = "tydom_alarm_sensor_"+i
             # print("name "+sensor_name, "elem_name "+i, "attributes_topic_from_device ",self.config['json_attributes_topic'], "mqtt",self.mqtt)
             if not i == 'device_type' or not i == 'id':
-                new_sensor = None
-                new_sensor = sensor(
-                    elem_name=i,
-                    tydom_attributes_payload=self.attributes,
-                    attributes_topic_from_device=self.config['json_attributes_topic'],
-                    mqtt=self.mqtt)
+                new_sensor = self.sensors.get(i)
+                if new_sensor is None:
+                    new_sensor = self.sensors[i] = sensor(
+                        elem_name=i,
+                        tydom_attributes_payload=self.attributes,
+                        attributes_topic_from_device=self.config['json_attributes_topic'],
+                        mqtt=self.mqtt,
+                        namespace=self.namespace,
+                        states=self.states)
+                else:
+                    new_sensor.apply(self.attributes)
                 await new_sensor.update()
     # def __init__(self, name, elem_name, tydom_attributes_payload,
     # attributes_topic_from_device, mqtt=None):
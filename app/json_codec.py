@@ -0,0 +1,169 @@
+import codecs
+import json
+import os
+import re
+
+# JSON backend of the message pipeline : hub payloads decoding and MQTT
+# payloads encoding. The fastest installed backend is used, stdlib json
+# otherwise. TYDOM_JSON_BACKEND=json (or orjson, ujson) forces one.
+#
+# dumps() returns compact utf-8 bytes, handed as is to gmqtt publish()
+# (a dict payload would be encoded again by gmqtt with stdlib json).
+
+
+def json_loads(data):
+    return json.loads(data)
+
+
+def json_dumps(obj):
+    return json.dumps(obj, ensure_ascii=False,
+                      separators=(',', ':')).encode('utf-8')
+
+
+def orjson_codec():
+    import orjson
+    options = orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        try:
+            return orjson.dumps(obj, option=options)
+        except TypeError:
+            # Integers over 64 bits, subclasses orjson refuses...
+            return json_dumps(obj)
+    return orjson.loads, dumps
+
+
+def ujson_codec():
+    import ujson
+
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=False).encode('utf-8')
+    return ujson.loads, dumps
+
+
+def json_codec():
+    return json_loads, json_dumps
+
+
+# Preference order
+backends = {
+    'orjson': orjson_codec,
+    'ujson': ujson_codec,
+    'json': json_codec,
+}
+
+
+def select_backend(name=None):
+    names = [name] if name else list(backends)
+    for backend in names:
+        try:
+            return (backend,) + backends[backend]()
+        except ImportError:
+            continue
+        except KeyError:
+            print('Unknown json backend', backend, ', using json')
+            break
+    return ('json',) + json_codec()
+
+
+# Stdlib decoder, the only one able to read a value in the middle of a text
+decoder = json.JSONDecoder()
+whitespace = re.compile(r'[ \t\n\r]*')
+
+
+class JsonStream():
+    '''
+        Reads a json document (bytes) one value at a time. The text is
+        decoded chunk by chunk, only the chunk and the value being read are
+        held in memory, never the whole text or the whole object tree.
+    '''
+
+    def __init__(self, data, chunk_size=16384):
+        self.data = data
+        self.chunk_size = chunk_size
+        self.offset = 0
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.text = ''
+        self.position = 0
+
+    # Appends the next chunk (larger ones for values larger than a chunk)
+    # to the text left to read
+    def fill(self):
+        if self.offset >= len(self.data):
+            return False
+        size = max(self.chunk_size, len(self.text) - self.position)
+        chunk = self.data[self.offset:self.offset + size]
+        self.offset += size
+        self.text = self.text[self.position:] + self.utf8.decode(
+            chunk, self.offset >= len(self.data))
+        self.position = 0
+        return True
+
+    # Next significant character, not consumed
+    def peek(self):
+        while True:
+            self.position = whitespace.match(self.text, self.position).end()
+            if self.position < len(self.text):
+                return self.text[self.position]
+            if not self.fill():
+                raise ValueError('Unexpected end of json document')
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError('Expecting {}, got {}'.format(chars, char))
+        self.position += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.text, self.position)
+            except json.JSONDecodeError:
+                # Value cut by the end of the chunk
+                if self.fill():
+                    continue
+                raise
+            # A number can be cut too, and still be valid
+            if end == len(self.text) and self.fill():
+                continue
+            self.position = end
+            return value
+
+    # Moves to the value of key in the object starting here
+    def find(self, key):
+        self.expect('{')
+        if self.peek() == '}':
+            return False
+        while True:
+            name = self.value()
+            self.expect(':')
+            if name == key:
+                return True
+            self.value()
+            if self.expect(',}') == '}':
+                return False
+
+    # Values of the array starting here
+    def items(self):
+        self.expect('[')
+        if self.peek() == ']':
+            return
+        while True:
+            yield self.value()
+            if self.expect(',]') == ']':
+                return
+
+
+def iter_items(data, key=None):
+    '''
+        Items of the top level array of data, or of the array under key in
+        the top level object, decoded one at a time
+    '''
+    stream = JsonStream(data)
+    if key is None or stream.find(key):
+        yield from stream.items()
+
+
+backend, loads, dumps = select_backend(os.getenv('TYDOM_JSON_BACKEND'))
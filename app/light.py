@@ -2,29 +2,54 @@ import json
 import time
 from datetime import datetime
 from sensors import sensor
+import json_codec
 
-light_command_topic = "light/tydom/{id}/set_levelCmd"
-light_config_topic = "homeassistant/light/tydom/{id}/config"
-light_level_topic = "light/tydom/{id}/current_level"
-light_set_level_topic = "light/tydom/{id}/set_level"
-light_attributes_topic = "light/tydom/{id}/attributes"
+light_command_topic = "light/{namespace}/{id}/set_levelCmd"
+light_config_topic = "homeassistant/light/{namespace}/{id}/config"
+light_level_topic = "light/{namespace}/{id}/current_level"
+light_set_level_topic = "light/{namespace}/{id}/set_level"
+light_attributes_topic = "light/{namespace}/{id}/attributes"
 
 
 class Light:
-    def __init__(self, tydom_attributes, set_level=None, mqtt=None):
+    # Created once per light, later frames go through apply()
+    __slots__ = ('attributes', 'device_id', 'endpoint_id', 'id', 'name',
+                 'current_level', 'set_level', 'mqtt', 'namespace',
+                 'unique_id', 'config_topic', 'level_topic', 'device',
+                 'config', 'sensors', 'states')
+
+    def __init__(self, tydom_attributes, set_level=None, mqtt=None,
+                 namespace='tydom', states=None):
 
         self.attributes = tydom_attributes
         self.device_id = self.attributes['device_id']
         self.endpoint_id = self.attributes['endpoint_id']
         self.id = self.attributes['id']
-        self.name = self.attributes['light_name']
+        self.set_level = set_level
+        self.mqtt = mqtt
+        self.namespace = namespace
+        self.states = states
+        # Entities of other hubs than the default one get their own unique ids
+        self.unique_id = self.id if namespace == 'tydom' else namespace + '_' + self.id
+        self.config_topic = light_config_topic.format(namespace=self.namespace, id=self.id)
+        self.level_topic = light_level_topic.format(namespace=self.namespace, id=self.id)
+        self.name = None
+        self.config = None
+        self.sensors = dict()
+        self.apply(tydom_attributes)
+
+    # Attributes of a new frame, merged into the known ones
+    def apply(self, tydom_attributes):
+        if tydom_attributes is not self.attributes:
+            self.attributes.update(tydom_attributes)
+        if self.attributes['light_name'] != self.name:
+            self.name = self.attributes['light_name']
+            self.config = None
         try:
             self.current_level = self.attributes['level']
         except Exception as e:
             print(e)
             self.current_level = None
-        self.set_level = set_level
-        self.mqtt = mqtt
 
     # def id(self):
     #     return self.id
@@ -42,26 +67,29 @@ class Light:
     #     return self.attributes
 
     async def setup(self):
+        # Built once, again only if the name changed
+        if self.config is not None:
+            return
         self.device = {}
         self.device['manufacturer'] = 'Delta Dore'
         self.device['model'] = 'Lumiere'
         self.device['name'] = self.name
-        self.device['identifiers'] = self.id
+        self.device['identifiers'] = self.unique_id
 
-        self.config_topic = light_config_topic.format(id=self.id)
         self.config = {}
         self.config['name'] = self.name
         self.config['brightness_scale'] = 100
-        self.config['unique_id'] = self.id
+        self.config['unique_id'] = self.unique_id
         self.config['optimistic'] = True
-        self.config['brightness_state_topic'] = light_level_topic.format(
-            id=self.id)
+        self.config['brightness_state_topic'] = self.level_topic
         self.config['brightness_command_topic'] = light_set_level_topic.format(
+            namespace=self.namespace,
             id=self.id)
-        self.config['command_topic'] = light_command_topic.format(id=self.id)
+        self.config['command_topic'] = light_command_topic.format(namespace=self.namespace, id=self.id)
         # self.config['set_level_topic'] = light_set_level_topic.format(id=self.id)
-        self.config['state_topic'] = light_level_topic.format(id=self.id)
+        self.config['state_topic'] = self.level_topic
         self.config['json_attributes_topic'] = light_attributes_topic.format(
+            namespace=self.namespace,
             id=self.id)
 
         self.config['payload_on'] = "ON"
@@ -72,9 +100,7 @@ class Light:
         # print(self.config)
 
         if (self.mqtt is not None):
-            self.mqtt.mqtt_client.publish(
-                self.config_topic, json.dumps(
-                    self.config), qos=0)
+            self.mqtt.publish_config(self.config_topic, self.config)
         # setup_pub = '(self.config_topic, json.dumps(self.config), qos=0)'
         # return(setup_pub)
 
@@ -87,15 +113,12 @@ class Light:
             print("light sensors Error :")
             print(e)
 
-        self.level_topic = light_level_topic.format(
-            id=self.id, current_level=self.current_level)
-
         if (self.mqtt is not None):
-            self.mqtt.mqtt_client.publish(
+            self.mqtt.publish(
                 self.level_topic, self.current_level, qos=0, retain=True)
             # self.mqtt.mqtt_client.publish('homeassistant/sensor/tydom/last_update', str(datetime.fromtimestamp(time.time())), qos=1, retain=True)
-            self.mqtt.mqtt_client.publish(
-                self.config['json_attributes_topic'], self.attributes, qos=0)
+            self.mqtt.publish(
+                self.config['json_attributes_topic'], json_codec.dumps(self.attributes), qos=0)
         print(
             "light created / updated : ",
             self.name,
@@ -111,12 +134,17 @@ class Light:
             # sensor_name = "tydom_alarm_sensor_"+i
             # print("name "+sensor_name, "elem_name "+i, "attributes_topic_from_device ",self.config['json_attributes_topic'], "mqtt",self.mqtt)
             if not i == 'device_type' or not i == 'id':
-                new_sensor = None
-                new_sensor = sensor(
-                    elem_name=i,
-                    tydom_attributes_payload=self.attributes,
-                    attributes_topic_from_device=self.config['json_attributes_topic'],
-                    mqtt=self.mqtt)
+                new_sensor = self.sensors.get(i)
+                if new_sensor is None:
+                    new_sensor = self.sensors[i] = sensor(
+                        elem_name=i,
+                        tydom_attributes_payload=self.attributes,
+                        attributes_topic_from_device=self.config['json_attributes_topic'],
+                        mqtt=self.mqtt,
+                        namespace=self.namespace,
+                        states=self.states)
+                else:
+                    new_sensor.apply(self.attributes)
                 await new_sensor.update()
     # def __init__(self, name, elem_name, tydom_attributes_payload,
     # attributes_topic_from_device, mqtt=None):
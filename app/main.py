@@ -9,9 +9,11 @@ import socket
 import websockets
 #import uvloop
 
+import json_codec
 from mqtt_client import MQTT_Hassio
 from tydomConnector import TydomWebSocketClient
-from tydomMessagehandler import TydomMessageHandler
+from tydomMessagehandler import TydomMessageHandler, load_cached_config
+from tydomReceiveQueue import TydomReceiveQueue
 
 # HASSIO ADDON
 print('~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
@@ -21,6 +23,7 @@ print('~~~~~~~~~~~~~~~~~~~~~~~~~~~~')
 print('STARTING TYDOM2MQTT')
 
 print('Dectecting environnement......')
+print('Json backend :', json_codec.backend)
 
 # uvloop.install()
 #print('uvloop init OK')
@@ -33,9 +36,19 @@ MQTT_PORT = 1883
 MQTT_USER = ""
 MQTT_PASSWORD = ""
 MQTT_SSL = False
+# States waiting at most this many seconds to be published, the latest per
+# topic (0 to publish right away)
+MQTT_FLUSH_INTERVAL = 0.1
+# Seconds our retained topics are read back at startup, to only publish
+# what changed since (0 to skip)
+MQTT_SEED_TIMEOUT = 0
 TYDOM_ALARM_PIN = None
 TYDOM_ALARM_HOME_ZONE = 1
 TYDOM_ALARM_NIGHT_ZONE = 2
+# Keep a remote connection through mediation.tydom.com as fallback of TYDOM_IP
+TYDOM_REMOTE_FALLBACK = False
+# Additional hubs driven by the same process : [{"TYDOM_MAC": ..., "TYDOM_PASSWORD": ..., "TYDOM_IP": ..., "TYDOM_ALARM_PIN": ...}]
+TYDOM_HUBS = []
 
 
 try:
@@ -57,6 +70,12 @@ try:
             TYDOM_ALARM_HOME_ZONE = data['TYDOM_ALARM_HOME_ZONE']
             TYDOM_ALARM_NIGHT_ZONE = data['TYDOM_ALARM_NIGHT_ZONE']
 
+            if 'TYDOM_REMOTE_FALLBACK' in data and data['TYDOM_REMOTE_FALLBACK']:
+                TYDOM_REMOTE_FALLBACK = True
+
+            if 'TYDOM_HUBS' in data:
+                TYDOM_HUBS = data['TYDOM_HUBS']
+
             # CREDENTIALS MQTT
             if data['MQTT_HOST'] != '':
                 MQTT_HOST = data['MQTT_HOST']
@@ -73,6 +92,12 @@ try:
             if (data['MQTT_SSL'] == 'true') or (data['MQTT_SSL']):
                 MQTT_SSL = True
 
+            if 'MQTT_FLUSH_INTERVAL' in data:
+                MQTT_FLUSH_INTERVAL = float(data['MQTT_FLUSH_INTERVAL'])
+
+            if 'MQTT_SEED_TIMEOUT' in data:
+                MQTT_SEED_TIMEOUT = float(data['MQTT_SEED_TIMEOUT'])
+
         except Exception as e:
             print('Parsing error', e)
 
@@ -87,6 +112,9 @@ except FileNotFoundError:
     TYDOM_ALARM_PIN = os.getenv('TYDOM_ALARM_PIN')
     TYDOM_ALARM_HOME_ZONE = os.getenv('TYDOM_ALARM_HOME_ZONE', 1)
     TYDOM_ALARM_NIGHT_ZONE = os.getenv('TYDOM_ALARM_NIGHT_ZONE', 2)
+    TYDOM_REMOTE_FALLBACK = os.getenv(
+        'TYDOM_REMOTE_FALLBACK', 'false').lower() == 'true'
+    TYDOM_HUBS = json.loads(os.getenv('TYDOM_HUBS', '[]'))
 
     # CREDENTIALS MQTT
     MQTT_HOST = os.getenv('MQTT_HOST', 'localhost')
@@ -96,13 +124,16 @@ except FileNotFoundError:
     # 1883 #1884 for websocket without SSL
     MQTT_PORT = os.getenv('MQTT_PORT', 1883)
     MQTT_SSL = os.getenv('MQTT_SSL', False)
+    MQTT_FLUSH_INTERVAL = float(os.getenv('MQTT_FLUSH_INTERVAL', 0.1))
+    MQTT_SEED_TIMEOUT = float(os.getenv('MQTT_SEED_TIMEOUT', 0))
 
 
 tydom_client = TydomWebSocketClient(
     mac=TYDOM_MAC,
     host=TYDOM_IP,
     password=TYDOM_PASSWORD,
-    alarm_pin=TYDOM_ALARM_PIN)
+    alarm_pin=TYDOM_ALARM_PIN,
+    remote_fallback=TYDOM_REMOTE_FALLBACK)
 hassio = MQTT_Hassio(
     broker_host=MQTT_HOST,
     port=MQTT_PORT,
@@ -111,79 +142,121 @@ hassio = MQTT_Hassio(
     mqtt_ssl=MQTT_SSL,
     home_zone=TYDOM_ALARM_HOME_ZONE,
     night_zone=TYDOM_ALARM_NIGHT_ZONE,
-    tydom=tydom_client)
+    tydom=tydom_client,
+    flush_interval=MQTT_FLUSH_INTERVAL,
+    seed_timeout=MQTT_SEED_TIMEOUT)
+
+# Every hub has its own topics namespace, the main one keeps "tydom"
+tydom_clients = [tydom_client]
+for hub in TYDOM_HUBS:
+    hub_client = TydomWebSocketClient(
+        mac=hub['TYDOM_MAC'],
+        host=hub.get('TYDOM_IP') or 'mediation.tydom.com',
+        password=hub['TYDOM_PASSWORD'],
+        alarm_pin=hub.get('TYDOM_ALARM_PIN'),
+        remote_fallback=TYDOM_REMOTE_FALLBACK,
+        namespace='tydom_' + str(hub['TYDOM_MAC']).lower())
+    tydom_clients.append(hub_client)
+    hassio.add_tydom(hub_client)
+
+for client in tydom_clients:
+    load_cached_config(client)
+
+
+def setup_done(task):
+    if not task.cancelled() and task.exception() is not None:
+        print('Tydom setup error :', task.exception())
 
 
 def loop_task():
     print('Starting main loop_task')
     loop = asyncio.get_event_loop()
-    loop.run_until_complete(hassio.connect())
+    loop.run_until_complete(start())
+
 
-    # tasks = [
-    #     listen_tydom_forever(tydom_client)
-    # ]
+async def start():
+    # Broker and hubs are connected at the same time
+    mqtt_connected = asyncio.ensure_future(hassio.connect())
 
-    loop.run_until_complete(listen_tydom_forever(tydom_client))
+    # One listener per hub, all sharing the same MQTT connection
+    tasks = [
+        listen_tydom_forever(client, mqtt_connected) for client in tydom_clients
+    ]
 
+    await asyncio.gather(mqtt_connected, *tasks)
 
-async def listen_tydom_forever(tydom_client):
+
+async def listen_tydom_forever(tydom_client, mqtt_connected):
     '''
-        Connect, then receive all server messages and pipe them to the handler, and reconnects if needed
+        Connect, then receive all server messages and pipe them to the handler through the receive queue, and reconnects if needed
     '''
+    supervisor = tydom_client.supervisor
+    handler = TydomMessageHandler(
+        tydom_client=tydom_client,
+        mqtt_client=hassio)
+    supervisor.on_change = lambda metrics: hassio.publish_metrics(
+        'reconnect_' + tydom_client.namespace, metrics)
+    # Frames are only read here, handled by the queue consumers
+    receive_queue = TydomReceiveQueue(
+        'Tydom ' + tydom_client.namespace,
+        handler.incomingTriage,
+        on_overflow=tydom_client.get_devices_data,
+        on_metrics=lambda metrics: hassio.publish_metrics(
+            'queue_' + tydom_client.namespace, metrics),
+        on_priority=hassio.flush)
+    receive_queue.start()
 
     while True:
         await asyncio.sleep(0)
+        setup = None
         # # outer loop restarted every time the connection fails
         try:
             await tydom_client.connect()
             print("Tydom Client is connected to websocket and ready !")
-            await tydom_client.setup()
+            supervisor.success()
+            # Setup waits for the answers handled below, so it runs aside
+            setup = asyncio.ensure_future(tydom_client.setup())
+            setup.add_done_callback(setup_done)
+            # Hub frames stay queued until the broker is there
+            await mqtt_connected
 
             while True:
                 # listener loop
                 try:
-                    incoming_bytes_str = await asyncio.wait_for(tydom_client.connection.recv(), timeout=tydom_client.refresh_timeout)
+                    incoming_bytes_str = await asyncio.wait_for(tydom_client.recv(), timeout=tydom_client.refresh_timeout)
                     print('<<<<<<<<<< Receiving from tydom_client...')
                     # print(incoming_bytes_str)
 
-                except (asyncio.TimeoutError, websockets.exceptions.ConnectionClosed) as e:
+                except (asyncio.TimeoutError, websockets.exceptions.ConnectionClosed, ConnectionError) as e:
                     print(e)
+                    if tydom_client.reconnect_requested:
+                        # Not a failure, connected again right away
+                        break
                     try:
                         pong = tydom_client.post_refresh()
                         await asyncio.wait_for(pong, timeout=tydom_client.refresh_timeout)
                         # print('Ping OK, keeping connection alive...')
                         continue
                     except Exception as e:
-                        print(
-                            'TimeoutError or websocket error - retrying connection in {} seconds...'.format(
-                                tydom_client.sleep_time))
-                        print('Error:', e)
-                        await asyncio.sleep(tydom_client.sleep_time)
+                        print('TimeoutError or websocket error - reconnecting...')
+                        supervisor.failure(e)
                         break
                 # print('Server said > {}'.format(incoming_bytes_str))
-                incoming_bytes_str
+                receive_queue.put(incoming_bytes_str)
 
-                handler = TydomMessageHandler(
-                    incoming_bytes=incoming_bytes_str,
-                    tydom_client=tydom_client,
-                    mqtt_client=hassio)
-                try:
-                    await handler.incomingTriage()
-                except Exception as e:
-                    print('Tydom Message Handler exception :', e)
-
-        except socket.gaierror:
-            print(
-                'Socket error - retrying connection in {} sec (Ctrl-C to quit)'.format(
-                    tydom_client.sleep_time))
-            await asyncio.sleep(tydom_client.sleep_time)
-            continue
-        except ConnectionRefusedError:
+        except socket.gaierror as e:
+            print('Socket error (Ctrl-C to quit)')
+            supervisor.failure(e)
+        except ConnectionRefusedError as e:
             print('Nobody seems to listen to this endpoint. Please check the URL.')
-            print(
-                'Retrying connection in {} sec (Ctrl-C to quit)'.format(tydom_client.sleep_time))
-            await asyncio.sleep(tydom_client.sleep_time)
-            continue
+            supervisor.failure(e)
+        except Exception as e:
+            print('Tydom connection error :', e)
+            supervisor.failure(e)
+
+        if setup is not None:
+            setup.cancel()
+        await supervisor.wait()
 
 
 if __name__ == '__main__':
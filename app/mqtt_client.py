@@ -1,10 +1,14 @@
 import asyncio
 import time
-import json
 import socket
 import sys
 from datetime import datetime
 from gmqtt import Client as MQTTClient
+from gmqtt import Subscription
+from gmqtt.mqtt.constants import MQTTv50
+
+from reconnect_supervisor import ReconnectSupervisor
+import json_codec
 
 from cover import Cover
 from alarm_control_panel import Alarm
@@ -15,28 +19,187 @@ from light import Light
 from boiler import Boiler
 from switch import Switch
 
-tydom_topic = "+/tydom/#"
-refresh_topic = "homeassistant/requests/tydom/refresh"
+# Only the topics on_message acts on are subscribed, not the states we
+# publish under the same namespace
+command_topic = "+/{namespace}/+/{command}"
+request_topics = [
+    "+/{namespace}/update",
+    "+/{namespace}/kill",
+    "homeassistant/requests/{namespace}/+",
+    "/{namespace}/init",
+]
+# Our retained states and discovery configs, read back at startup
+seed_topics = [
+    "+/{namespace}/+/+",
+    "homeassistant/+/{namespace}/+/config",
+]
+metrics_topic = "tydom2mqtt/metrics/{name}"
 hostname = socket.gethostname()
 
 
+# Command payloads decoders
+def text_payload(payload):
+    return payload.decode()
+
+
+def json_payload(payload):
+    return str(json_codec.loads(payload))
+
+
+# Payload bytes as gmqtt sends them, to compare with what the broker holds
+def encode_payload(payload):
+    if isinstance(payload, bytes):
+        return payload
+    if isinstance(payload, str):
+        return payload.encode('utf-8', errors='replace')
+    if payload is None:
+        return b''
+    return str(payload).encode('ascii')
+
+
+class SupervisedClient(MQTTClient):
+    '''
+        gmqtt client leaving reconnections to the ReconnectSupervisor of
+        MQTT_Hassio once connect() is over (until then gmqtt reconnects by
+        itself to fall back to MQTT 3.1.1). reconnect_retries=0 alone still
+        lets gmqtt make one attempt after a connection loss.
+    '''
+    supervised = False
+
+    async def reconnect(self, delay=False):
+        if not self.supervised:
+            await super().reconnect(delay=delay)
+
+
 # STOP = asyncio.Event()
 class MQTT_Hassio():
 
     def __init__(self, broker_host, port, user, password, mqtt_ssl,
-                 home_zone=1, night_zone=2, tydom=None, tydom_alarm_pin=None):
+                 home_zone=1, night_zone=2, tydom=None, tydom_alarm_pin=None,
+                 flush_interval=0.1, flush_size=500, seed_timeout=0,
+                 birth_max_age=3600):
         self.broker_host = broker_host
         self.port = port
         self.user = user
         self.password = password
         self.ssl = mqtt_ssl
         self.tydom = tydom
+        # Hubs driven through this MQTT connection, by topic namespace
+        self.tydoms = dict()
+        if tydom is not None:
+            self.add_tydom(tydom)
         self.tydom_alarm_pin = tydom_alarm_pin
         self.mqtt_client = None
+        # Discovery config topic -> (payload, retain) last published
+        self.discovery = dict()
+        # State topic -> (payload, qos) last published, not retained ones
+        # (the broker keeps those), sent again when Home Assistant comes
+        # back. Hubs without data since birth_max_age seconds are asked
+        # for it instead.
+        self.last_states = dict()
+        self.birth_max_age = birth_max_age
+        # Topic -> (payload, qos, retain) waiting for the next flush, sent
+        # every flush_interval (0 to publish right away) or once flush_size
+        # topics wait
+        self.buffer = dict()
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.flush_handle = None
+        # Counters, published every metrics_interval
+        self.buffered = 0
+        self.coalesced = 0
+        self.sent = 0
+        self.metrics_interval = 60
+        self.metrics_at = time.monotonic() + self.metrics_interval
+        # Retained payloads read back from the broker at startup during
+        # seed_timeout seconds (0 to skip), topic -> payload bytes. The
+        # first publication of a topic is skipped if the broker already
+        # holds the same payload. Discovery configs nobody publishes again
+        # are left in seeded_configs, orphans once a full devices data
+        # response is handled and their id is not in the hub configuration.
+        self.seed_timeout = seed_timeout
+        self.seeding = False
+        self.seeded = False
+        self.retained = dict()
+        self.seeded_configs = dict()
+        self.seed_skipped = 0
+        # Namespace -> <device>_<endpoint> ids of the hub configuration, set
+        # after a full devices data response (until then nothing is orphan)
+        self.known_ids = dict()
         self.home_zone = home_zone
         self.night_zone = night_zone
+        # Reconnection task after a broker connection loss
+        self.reconnection = None
+        self.supervisor = ReconnectSupervisor(
+            'MQTT',
+            on_change=lambda metrics: self.publish_metrics(
+                'reconnect_mqtt', metrics))
+
+        # Command topic last level -> (payload decoder, handler)
+        self.commands = dict()
+        self.register('set_positionCmd', text_payload, self.set_positionCmd)
+        self.register('set_position', json_payload, self.set_position)
+        self.register('set_levelCmd', text_payload, self.set_levelCmd)
+        self.register('set_level', json_payload, self.set_level)
+        self.register('set_alarm_state', text_payload, self.set_alarm_state)
+        self.register('set_setpoint', json_payload, self.set_setpoint)
+        self.register('set_hvacMode', text_payload, self.set_hvacMode)
+        self.register('set_thermicLevel', text_payload, self.set_thermicLevel)
+        self.register('set_levelCmdGate', text_payload, self.set_levelCmdGate)
+        self.register('set_levelGate', json_payload, self.set_levelGate)
+        self.requests = {
+            'update': self.request_update,
+            'kill': self.request_kill,
+            'refresh': self.request_refresh,
+            'scenarii': self.request_scenarii,
+            'init': self.request_init,
+            'cleanup': self.request_cleanup,
+        }
+
+    def add_tydom(self, tydom):
+        if self.tydom is None:
+            self.tydom = tydom
+        self.tydoms[tydom.namespace] = tydom
 
     async def connect(self):
+        # Retried with backoff until the broker answers
+        client = await self.supervisor.run(self.connect_once)
+        if self.seed_timeout > 0 and not self.seeded:
+            await self.seed()
+        return client
+
+    async def seed(self):
+        '''
+            Subscribes to our own retained topics for seed_timeout seconds,
+            what the broker sends back is what survived our restart
+        '''
+        topics = [topic.format(namespace=namespace)
+                  for namespace in self.tydoms for topic in seed_topics]
+        print('Reading retained topics back for', self.seed_timeout, 's :', topics)
+        self.seeding = True
+        self.mqtt_client.subscribe([Subscription(topic, qos=0) for topic in topics])
+        await asyncio.sleep(self.seed_timeout)
+        self.seeding = False
+        self.seeded = True
+        self.mqtt_client.unsubscribe(topics)
+        print('Seeded', len(self.retained), 'retained states and',
+              len(self.seeded_configs), 'discovery configs')
+
+    # Returns False for the retained messages that are not ours
+    # (homeassistant/status, commands)
+    def on_seed(self, topic, payload):
+        parts = topic.split('/')
+        if parts[0] == 'homeassistant':
+            if len(parts) != 5 or parts[4] != 'config':
+                return False
+            self.seeded_configs[topic] = payload
+        elif len(parts) != 4 or parts[3] in self.commands:
+            return False
+        elif len(payload) > 0:
+            self.retained[topic] = payload
+        return True
+
+    async def connect_once(self):
 
         try:
             print('""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""')
@@ -46,7 +209,7 @@ class MQTT_Hassio():
             adress = hostname + str(datetime.fromtimestamp(time.time()))
             # print(adress)
 
-            client = MQTTClient(adress)
+            client = SupervisedClient(adress)
             # print(client)
 
             client.on_connect = self.on_connect
@@ -55,208 +218,289 @@ class MQTT_Hassio():
             # client.on_subscribe = self.on_subscribe
 
             client.set_auth_credentials(self.user, self.password)
-            await client.connect(self.broker_host, self.port, self.ssl)
+            try:
+                await client.connect(self.broker_host, self.port, self.ssl)
+            finally:
+                # Reconnections are ours from now on, with backoff
+                client.supervised = True
+                client.reconnect_retries = 0
 
             self.mqtt_client = client
             return self.mqtt_client
 
         except Exception as e:
             print("MQTT connection Error : ", e)
-            print('MQTT error, restarting in 8s...')
-            await asyncio.sleep(8)
-            await self.connect()
+            raise
+
+    def publish(self, topic, payload, qos=0, retain=False, immediate=False):
+        '''
+            Publishes through the buffer, where a newer payload replaces the
+            one waiting for the same topic. Immediate ones (alarm) flush
+            what waits first, to keep the order.
+        '''
+        if retain and self.retained:
+            seeded = self.retained.pop(topic, None)
+            if seeded is not None and seeded == encode_payload(payload):
+                self.seed_skipped += 1
+                return
+        if not retain and topic not in self.discovery:
+            self.last_states[topic] = (payload, qos)
+        if immediate or self.flush_interval <= 0:
+            self.flush()
+            self.mqtt_client.publish(topic, payload, qos=qos, retain=retain)
+            self.sent += 1
+            return
+        self.buffered += 1
+        if topic in self.buffer:
+            self.coalesced += 1
+        self.buffer[topic] = (payload, qos, retain)
+        if len(self.buffer) >= self.flush_size:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = asyncio.get_event_loop().call_later(
+                self.flush_interval, self.flush)
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if len(self.buffer) == 0 or self.mqtt_client is None:
+            return
+        buffer, self.buffer = self.buffer, dict()
+        for topic, (payload, qos, retain) in buffer.items():
+            self.mqtt_client.publish(topic, payload, qos=qos, retain=retain)
+        self.sent += len(buffer)
+        if time.monotonic() > self.metrics_at:
+            self.metrics_at = time.monotonic() + self.metrics_interval
+            self.publish_metrics('publish', self.metrics())
+
+    def metrics(self):
+        return {
+            'buffered': self.buffered,
+            'coalesced': self.coalesced,
+            'sent': self.sent,
+            'waiting': len(self.buffer),
+            'seed_skipped': self.seed_skipped}
+
+    # Retained json metrics (reconnections, queues...) under tydom2mqtt/metrics/
+    def publish_metrics(self, name, metrics):
+        if self.mqtt_client is not None and self.mqtt_client.is_connected:
+            self.mqtt_client.publish(
+                metrics_topic.format(name=name),
+                json_codec.dumps(metrics),
+                qos=0,
+                retain=True)
+
+    # Home Assistant discovery config, only published when it changed
+    def publish_config(self, topic, config, retain=False):
+        payload = json_codec.dumps(config)
+        published = self.discovery.get(topic)
+        if published is not None and published[0] == payload:
+            return False
+        self.discovery[topic] = (payload, retain)
+        # Retained and unchanged since before our restart
+        if self.seeded_configs.pop(topic, None) == payload and retain:
+            self.seed_skipped += 1
+            return False
+        self.publish(topic, payload, qos=0, retain=retain)
+        return True
+
+    # Retained discovery configs of a hub no entity published again since
+    # startup, for no device of its configuration, removed by the cleanup
+    # request. Config ids end with <device>_<endpoint> (entities) or are
+    # prefixed with the data name and namespace (sensors).
+    def orphaned_configs(self, namespace):
+        known_ids = self.known_ids.get(namespace)
+        if known_ids is None:
+            return []
+        orphans = []
+        for topic in self.seeded_configs:
+            parts = topic.split('/')
+            if parts[2] == namespace and \
+                    '_'.join(parts[3].rsplit('_', 2)[-2:]) not in known_ids:
+                orphans.append(topic)
+        return orphans
+
+    # Called with the ids of the hub configuration after a full devices
+    # data response
+    def report_orphans(self, namespace, known_ids=None):
+        if known_ids is not None:
+            self.known_ids[namespace] = set(known_ids)
+        orphans = self.orphaned_configs(namespace)
+        if self.seeded:
+            self.publish_metrics('orphans_' + namespace,
+                                 {'count': len(orphans), 'topics': orphans})
+        if len(orphans) > 0:
+            print(len(orphans), 'retained discovery configs without entity, '
+                  'publish to homeassistant/requests/' + namespace +
+                  '/cleanup to remove them :', orphans)
+
+    # Home Assistant came back, it needs every discovery config again
+    def republish_discovery(self):
+        print('Publishing', len(self.discovery), 'discovery configs again')
+        for topic, (payload, retain) in self.discovery.items():
+            self.publish(topic, payload, qos=0, retain=retain)
+
+    # Home Assistant birth message, answered from memory
+    async def on_birth(self):
+        self.republish_discovery()
+        print('Publishing', len(self.last_states), 'states again')
+        for topic, (payload, qos) in self.last_states.items():
+            self.publish(topic, payload, qos=qos)
+        for tydom in self.tydoms.values():
+            if not tydom.states.fresh(self.birth_max_age):
+                print('No recent data from', tydom.namespace, ', asking the hub')
+                tydom.states.force()
+                await tydom.get_devices_data()
 
     def on_connect(self, client, flags, rc, properties):
         print("##################################")
         try:
-            print("Subscribing to : ", tydom_topic)
             # client.subscribe('homeassistant/#', qos=0)
-            client.subscribe('homeassistant/status', qos=0)
-            client.subscribe(tydom_topic, qos=0)
+            topics = ['homeassistant/status']
+            # States are not retained, a new broker session gets them all again
+            for tydom in self.tydoms.values():
+                tydom.states.force()
+            for namespace in self.tydoms:
+                topics += [command_topic.format(namespace=namespace, command=command)
+                           for command in self.commands]
+                topics += [topic.format(namespace=namespace)
+                           for topic in request_topics]
+            # With MQTT 5, the broker never sends back what we publish
+            no_local = self.mqtt5(client)
+            print("Subscribing to : ", topics, '(no local)' if no_local else '')
+            client.subscribe([Subscription(topic, qos=0, no_local=no_local)
+                              for topic in topics])
         except Exception as e:
             print("Error on connect : ", e)
 
+    # gmqtt falls back to MQTT 3.1.1 with older brokers, which reject the
+    # MQTT 5 subscription options
+    def mqtt5(self, client):
+        connection = getattr(client, '_connection', None)
+        protocol = getattr(connection, '_protocol', None)
+        return getattr(protocol, 'proto_ver', None) == MQTTv50
+
+    def register(self, command, decode, handler):
+        self.commands[command] = (decode, handler)
+
     async def on_message(self, client, topic, payload, qos, properties):
         # print('Incoming MQTT message : ', topic, payload)
-        if ('update' in str(topic)):
-            #        if "update" in topic:
-            print('Incoming MQTT update request : ', topic, payload)
-            await self.tydom.get_data()
-        elif ('kill' in str(topic)):
-            #        if "update" in topic:
-            print('Incoming MQTT kill request : ', topic, payload)
-            print('Exiting...')
-            sys.exit()
-        elif (topic == "homeassistant/requests/tydom/refresh"):
-            print('Incoming MQTT refresh request : ', topic, payload)
-            await self.tydom.post_refresh()
-        elif (topic == "homeassistant/requests/tydom/scenarii"):
-            print('Incoming MQTT scenarii request : ', topic, payload)
-            await self.tydom.get_scenarii()
-        elif (topic == "homeassistant/status" and payload.decode() == 'online'):
-            await self.tydom.get_devices_data()
-        elif (topic == "/tydom/init"):
-            print('Incoming MQTT init request : ', topic, payload)
-            await self.tydom.connect()
-
-        # elif ('set_scenario' in str(topic)):
-        #     print('Incoming MQTT set_scenario request : ', topic, payload)
-        #     get_id = (topic.split("/"))[3] #extract id from mqtt
-        #     # print(tydom, str(get_id), 'position', json.loads(payload))
-        #     if not self.tydom.connection.open:
-        #         print('Websocket not opened, reconnect...')
-        #         await self.tydom.connect()
-        # await self.tydom.put_devices_data(str(get_id), 'position',
-        # str(json.loads(payload)))
-
-        #     else:
-        # await self.tydom.put_devices_data(str(get_id), 'position',
-        # str(json.loads(payload)))
-
-        elif 'set_positionCmd' in str(topic):
-            print('Incoming MQTT set_positionCmd request : ', topic, payload)
-            value = str(payload).strip('b').strip("'")
-
-            get_id = (topic.split("/"))[2]  # extract ids from mqtt
-            device_id = (get_id.split("_"))[0]  # extract id from mqtt
-            endpoint_id = (get_id.split("_"))[1]  # extract id from mqtt
-
-            print(str(get_id), 'positionCmd', value)
-            await Cover.put_positionCmd(tydom_client=self.tydom, device_id=device_id, cover_id=endpoint_id, positionCmd=str(value))
-
-        elif ('set_position' in str(topic)) and not ('set_positionCmd' in str(topic)):
-
-            print(
-                'Incoming MQTT set_position request : ',
-                topic,
-                json.loads(payload))
-            value = json.loads(payload)
-            # print(value)
-            get_id = (topic.split("/"))[2]  # extract ids from mqtt
-            device_id = (get_id.split("_"))[0]  # extract id from mqtt
-            endpoint_id = (get_id.split("_"))[1]  # extract id from mqtt
-
-            await Cover.put_position(tydom_client=self.tydom, device_id=device_id, cover_id=endpoint_id, position=str(value))
-
-        elif 'set_levelCmd' in str(topic):
-            print('Incoming MQTT set_levelCmd request : ', topic, payload)
-            value = str(payload).strip('b').strip("'")
-
-            get_id = (topic.split("/"))[2]  # extract ids from mqtt
-            device_id = (get_id.split("_"))[0]  # extract id from mqtt
-            endpoint_id = (get_id.split("_"))[1]  # extract id from mqtt
-
-            print(str(get_id), 'levelCmd', value)
-            await Light.put_levelCmd(tydom_client=self.tydom, device_id=device_id, light_id=endpoint_id,
-                                     levelCmd=str(value))
-
-        elif ('set_level' in str(topic)) and not ('set_levelCmd' in str(topic)):
-
-            print(
-                'Incoming MQTT set_level request : ',
-                topic,
-                json.loads(payload))
-            value = json.loads(payload)
-            # print(value)
-            get_id = (topic.split("/"))[2]  # extract ids from mqtt
-            device_id = (get_id.split("_"))[0]  # extract id from mqtt
-            endpoint_id = (get_id.split("_"))[1]  # extract id from mqtt
-
-            await Light.put_level(tydom_client=self.tydom, device_id=device_id, light_id=endpoint_id,
-                                  level=str(value))
-
-        elif ('set_alarm_state' in str(topic)) and not ('homeassistant' in str(topic)):
-            # print(topic, payload, qos, properties)
-            command = str(payload).strip('b').strip("'")
-
-            get_id = (topic.split("/"))[2]  # extract ids from mqtt
-            device_id = (get_id.split("_"))[0]  # extract id from mqtt
-            endpoint_id = (get_id.split("_"))[1]  # extract id from mqtt
-
-            await Alarm.put_alarm_state(tydom_client=self.tydom, device_id=device_id, alarm_id=endpoint_id, asked_state=command, home_zone=self.home_zone, night_zone=self.night_zone)
-
-        elif ('set_setpoint' in str(topic)):
-
-            value = str(payload).strip('b').strip("'")
-            print('Incoming MQTT setpoint request : ', topic, value)
-            value = json.loads(payload)
-            # print(value)
-            get_id = (topic.split("/"))[2]  # extract ids from mqtt
-            device_id = (get_id.split("_"))[0]  # extract id from mqtt
-            endpoint_id = (get_id.split("_"))[1]  # extract id from mqtt
-
-            await Boiler.put_temperature(tydom_client=self.tydom, device_id=device_id, boiler_id=endpoint_id,
-                                         set_setpoint=str(value))
-
-        elif ('set_hvacMode' in str(topic)):
-
-            value = str(payload).strip('b').strip("'")
-            print('Incoming MQTT set_hvacMode request : ', topic, value)
-            # print(value)
-            get_id = (topic.split("/"))[2]  # extract ids from mqtt
-            device_id = (get_id.split("_"))[0]  # extract id from mqtt
-            endpoint_id = (get_id.split("_"))[1]  # extract id from mqtt
-
-            await Boiler.put_hvacMode(tydom_client=self.tydom, device_id=device_id, boiler_id=endpoint_id,
-                                      set_hvacMode=str(value))
-
-        elif ('set_thermicLevel' in str(topic)):
-
-            value = str(payload).strip('b').strip("'")
-            print('Incoming MQTT set_thermicLevel request : ', topic, value)
-            # print(value)
-            get_id = (topic.split("/"))[2]  # extract ids from mqtt
-            device_id = (get_id.split("_"))[0]  # extract id from mqtt
-            endpoint_id = (get_id.split("_"))[1]  # extract id from mqtt
-
-            await Boiler.put_thermicLevel(tydom_client=self.tydom, device_id=device_id, boiler_id=endpoint_id,
-                                          set_thermicLevel=str(value))
-        elif ('set_switch_state' in str(topic)) and not ('homeassistant' in str(topic)):
-            # print(topic, payload, qos, properties)
-            command = str(payload).strip('b').strip("'")
-
-            get_id = (topic.split("/"))[2]  # extract ids from mqtt
-            device_id = (get_id.split("_"))[0]  # extract id from mqtt
-            endpoint_id = (get_id.split("_"))[1]  # extract id from mqtt
-
-            await Switch.put_switch_state(tydom_client=self.tydom, device_id=device_id, switch_id=endpoint_id, state=command)
-
-        elif 'set_levelCmdGate' in str(topic):
-            print('Incoming MQTT set_levelCmdGate request : ', topic, payload)
-            value = str(payload).strip('b').strip("'")
-
-            get_id = (topic.split("/"))[2]  # extract ids from mqtt
-            device_id = (get_id.split("_"))[0]  # extract id from mqtt
-            endpoint_id = (get_id.split("_"))[1]  # extract id from mqtt
-
-            print(str(get_id), 'levelCmd', value)
-            await Light.put_levelCmdGate(tydom_client=self.tydom, device_id=device_id, switch_id=endpoint_id,
-                                         levelCmd=str(value))
-
-        elif ('set_levelGate' in str(topic)) and not ('set_levelCmd' in str(topic)):
+        if self.seeding and properties.get('retain') and self.on_seed(topic, payload):
+            return
+        if (topic == "homeassistant/status" and payload.decode() == 'online'):
+            await self.on_birth()
+            return
+
+        parts = topic.split('/')
+        if len(parts) == 4 and parts[0] != 'homeassistant':
+            # <domain>/<namespace>/<device>_<endpoint>/<command>
+            tydom = self.tydoms.get(parts[1])
+            command = self.commands.get(parts[3])
+            ids = parts[2].split('_')
+            if tydom is None or command is None or len(ids) < 2:
+                return
+            decode, handler = command
+            value = decode(payload)
+            print('Incoming MQTT', parts[3], 'request : ', topic, value)
+            await handler(tydom, ids[0], ids[1], value)
+            return
+
+        # homeassistant/requests/<namespace>/<request>, +/<namespace>/<request>
+        if len(parts) == 4 and parts[:2] == ['homeassistant', 'requests']:
+            namespace, request = parts[2], parts[3]
+        elif len(parts) == 3:
+            namespace, request = parts[1], parts[2]
+        else:
+            return
+        tydom = self.tydoms.get(namespace)
+        handler = self.requests.get(request)
+        if tydom is None or handler is None:
+            return
+        print('Incoming MQTT', request, 'request : ', topic, payload)
+        await handler(tydom)
 
-            print(
-                'Incoming MQTT set_levelGate request : ',
-                topic,
-                json.loads(payload))
-            value = json.loads(payload)
-            # print(value)
-            get_id = (topic.split("/"))[2]  # extract ids from mqtt
-            device_id = (get_id.split("_"))[0]  # extract id from mqtt
-            endpoint_id = (get_id.split("_"))[1]  # extract id from mqtt
-
-            await Light.put_levelGate(tydom_client=self.tydom, device_id=device_id, switch_id=endpoint_id,
-                                      level=str(value))
+    # Commands, called with the ids from the topic and the decoded payload
 
-        else:
-            pass
-            # print(">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>")
-            # print('MQTT incoming : ', topic, payload.decode())
+    async def set_positionCmd(self, tydom, device_id, endpoint_id, value):
+        await Cover.put_positionCmd(tydom_client=tydom, device_id=device_id, cover_id=endpoint_id, positionCmd=value)
+
+    async def set_position(self, tydom, device_id, endpoint_id, value):
+        await Cover.put_position(tydom_client=tydom, device_id=device_id, cover_id=endpoint_id, position=value)
+
+    async def set_levelCmd(self, tydom, device_id, endpoint_id, value):
+        await Light.put_levelCmd(tydom_client=tydom, device_id=device_id, light_id=endpoint_id, levelCmd=value)
+
+    async def set_level(self, tydom, device_id, endpoint_id, value):
+        await Light.put_level(tydom_client=tydom, device_id=device_id, light_id=endpoint_id, level=value)
+
+    async def set_alarm_state(self, tydom, device_id, endpoint_id, value):
+        await Alarm.put_alarm_state(tydom_client=tydom, device_id=device_id, alarm_id=endpoint_id, asked_state=value, home_zone=self.home_zone, night_zone=self.night_zone)
+
+    async def set_setpoint(self, tydom, device_id, endpoint_id, value):
+        await Boiler.put_temperature(tydom_client=tydom, device_id=device_id, boiler_id=endpoint_id, set_setpoint=value)
+
+    async def set_hvacMode(self, tydom, device_id, endpoint_id, value):
+        await Boiler.put_hvacMode(tydom_client=tydom, device_id=device_id, boiler_id=endpoint_id, set_hvacMode=value)
+
+    async def set_thermicLevel(self, tydom, device_id, endpoint_id, value):
+        await Boiler.put_thermicLevel(tydom_client=tydom, device_id=device_id, boiler_id=endpoint_id, set_thermicLevel=value)
+
+    async def set_levelCmdGate(self, tydom, device_id, endpoint_id, value):
+        await Switch.put_levelCmdGate(tydom_client=tydom, device_id=device_id, switch_id=endpoint_id, levelCmd=value)
+
+    async def set_levelGate(self, tydom, device_id, endpoint_id, value):
+        await Switch.put_levelGate(tydom_client=tydom, device_id=device_id, switch_id=endpoint_id, level=value)
+
+    # Requests, called with the hub
+
+    async def request_update(self, tydom):
+        await tydom.get_data()
+
+    async def request_kill(self, tydom):
+        print('Exiting...')
+        sys.exit()
+
+    async def request_refresh(self, tydom):
+        await tydom.post_refresh()
+
+    async def request_scenarii(self, tydom):
+        await tydom.get_scenarii()
+
+    # Through the listener of the hub, which runs setup once connected
+    async def request_init(self, tydom):
+        tydom.request_reconnect()
+
+    async def request_cleanup(self, tydom):
+        if tydom.namespace not in self.known_ids:
+            print('No devices data from', tydom.namespace, 'yet, orphaned '
+                  'discovery configs are not known')
+            return
+        orphans = self.orphaned_configs(tydom.namespace)
+        print('Removing', len(orphans), 'retained discovery configs')
+        for topic in orphans:
+            del self.seeded_configs[topic]
+            self.publish(topic, b'', qos=0, retain=True, immediate=True)
+        self.report_orphans(tydom.namespace)
 
     def on_disconnect(self, client, packet, exc=None):
         print('MQTT Disconnected !')
         print("##################################")
-        # self.connect()
+        if client is self.mqtt_client and self.reconnection is None:
+            self.supervisor.failure(exc or 'connection lost')
+            self.reconnection = asyncio.ensure_future(self.reconnect(client))
+
+    # A new client once the backoff delay is over, the lost one is closed
+    async def reconnect(self, client):
+        try:
+            await self.supervisor.wait()
+            try:
+                await client.disconnect()
+            except Exception:
+                pass
+            await self.connect()
+        finally:
+            self.reconnection = None
 
     def on_subscribe(self, client, mid, qos):
         print("MQTT is connected and suscribed ! =)", client)
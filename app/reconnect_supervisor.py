@@ -0,0 +1,110 @@
+import asyncio
+import random
+import time
+
+# Circuit breaker states
+CLOSED = 'closed'  # connected, or still retrying quickly
+OPEN = 'open'  # too many failures in a row, waiting for the cool down
+HALF_OPEN = 'half_open'  # cool down over, one attempt allowed
+
+
+class ReconnectSupervisor():
+    '''
+        Reconnection policy shared by the hub and the broker connections :
+        capped exponential backoff with jitter, and a circuit breaker opening
+        after failure_threshold failures in a row.
+    '''
+
+    def __init__(self, name, base_delay=1, max_delay=120, factor=2,
+                 jitter=0.5, failure_threshold=6, cool_down=300,
+                 on_change=None):
+        self.name = name
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.jitter = jitter
+        self.failure_threshold = failure_threshold
+        self.cool_down = cool_down
+        # Called with metrics() every time the state changes
+        self.on_change = on_change
+
+        self.state = CLOSED
+        self.failures = 0
+        self.total_failures = 0
+        self.last_error = None
+        self.last_delay = 0
+        self.retry_at = 0
+
+    def next_delay(self):
+        if self.state == OPEN:
+            delay = self.cool_down
+        else:
+            delay = min(self.max_delay,
+                        self.base_delay * self.factor ** max(self.failures - 1, 0))
+        # Spread the retries of every client hitting the same outage
+        return delay * (1 - self.jitter * random.random())
+
+    def success(self):
+        if self.failures > 0 or self.state != CLOSED:
+            print(self.name, 'connection is back after', self.failures,
+                  'failure(s)')
+            self.failures = 0
+            self.state = CLOSED
+            self.changed()
+
+    def failure(self, error=None):
+        self.failures += 1
+        self.total_failures += 1
+        self.last_error = str(error) if error is not None else None
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = OPEN
+        self.last_delay = self.next_delay()
+        self.retry_at = time.monotonic() + self.last_delay
+        print(self.name, 'connection failed ({}), retrying in {:.1f}s ({})'.format(
+            self.last_error, self.last_delay, self.state))
+        self.changed()
+
+    # For pollers : True once the retry delay is over
+    def ready(self):
+        if time.monotonic() < self.retry_at:
+            return False
+        if self.state == OPEN:
+            self.state = HALF_OPEN
+            self.changed()
+        return True
+
+    async def wait(self):
+        await asyncio.sleep(max(self.retry_at - time.monotonic(), 0))
+        self.ready()
+
+    async def run(self, connect):
+        '''
+            Awaits connect() until it succeeds, backing off between attempts
+        '''
+        while True:
+            try:
+                result = await connect()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failure(e)
+                await self.wait()
+                continue
+            self.success()
+            return result
+
+    def metrics(self):
+        return {
+            'name': self.name,
+            'state': self.state,
+            'failures': self.failures,
+            'total_failures': self.total_failures,
+            'last_delay': round(self.last_delay, 1),
+            'last_error': self.last_error}
+
+    def changed(self):
+        if self.on_change is not None:
+            try:
+                self.on_change(self.metrics())
+            except Exception as e:
+                print('Reconnect metrics error :', e)
@@ -3,53 +3,77 @@ import time
 from datetime import datetime
 
 sensor_topic = "sensor/tydom/#"
-sensor_config_topic = "homeassistant/sensor/tydom/{id}/config"
-sensor_json_attributes_topic = "sensor/tydom/{id}/state"
+sensor_config_topic = "homeassistant/sensor/{namespace}/{id}/config"
+sensor_json_attributes_topic = "sensor/{namespace}/{id}/state"
 
 binary_sensor_topic = "binary_sensor/tydom/#"
-binary_sensor_config_topic = "homeassistant/binary_sensor/tydom/{id}/config"
-binary_sensor_json_attributes_topic = "binary_sensor/tydom/{id}/state"
+binary_sensor_config_topic = "homeassistant/binary_sensor/{namespace}/{id}/config"
+binary_sensor_json_attributes_topic = "binary_sensor/{namespace}/{id}/state"
 
 # sensor_json_attributes_topic = "sensor/tydom/{id}/state"
 # State topic can be the same as the original device attributes topic !
 
 
 class sensor:
+    # Sensors are kept by their parent entity and updated in place
+    __slots__ = ('elem_name', 'elem_value', 'attributes', 'parent_device_id',
+                 'namespace', 'id', 'name', 'device_class',
+                 'unit_of_measurement', 'mqtt', 'binary', 'config_topic',
+                 'json_attributes_topic', 'device', 'config', 'states')
 
     def __init__(self, elem_name, tydom_attributes_payload,
-                 attributes_topic_from_device, mqtt=None):
+                 attributes_topic_from_device, mqtt=None, namespace='tydom',
+                 states=None):
         self.elem_name = elem_name
-        self.elem_value = tydom_attributes_payload[self.elem_name]
-
-        # init a state json
-        state_dict = {}
-        state_dict[elem_name] = self.elem_value
-        self.attributes = state_dict
-        # print(self.attributes)
 
         # self.json_attributes_topic = attributes_topic_from_device #State
         # extracted from json, but it will make sensor not in payload to be
         # considerd offline....
         self.parent_device_id = str(tydom_attributes_payload['id'])
-        self.id = elem_name + '_tydom_' + str(tydom_attributes_payload['id'])
-        self.name = elem_name + '_tydom_' + '_' + \
+        if namespace != 'tydom':
+            self.parent_device_id = namespace + '_' + self.parent_device_id
+        self.namespace = namespace
+        self.id = elem_name + '_' + namespace + '_' + \
+            str(tydom_attributes_payload['id'])
+        self.mqtt = mqtt
+        # Sensors of an entity only publish the values that changed
+        self.states = states
+        self.name = None
+        self.binary = None
+        self.config = None
+        self.apply(tydom_attributes_payload)
+
+    # Values of a new frame
+    def apply(self, tydom_attributes_payload):
+        self.elem_value = tydom_attributes_payload[self.elem_name]
+
+        # init a state json
+        self.attributes = {self.elem_name: self.elem_value}
+        # print(self.attributes)
+
+        name = self.elem_name + '_' + self.namespace + '_' + '_' + \
             str(tydom_attributes_payload['name']).replace(" ", "_")
-        if 'device_class' in tydom_attributes_payload.keys():
+        if name != self.name:
+            self.name = name
+            self.config = None
+        if 'device_class' in tydom_attributes_payload:
             self.device_class = tydom_attributes_payload['device_class']
 
-        if 'unit_of_measurement' in tydom_attributes_payload.keys():
+        if 'unit_of_measurement' in tydom_attributes_payload:
             self.unit_of_measurement = tydom_attributes_payload['unit_of_measurement']
 
-        self.mqtt = mqtt
-
-        self.binary = False
+        binary = self.elem_value == False or bool(self.elem_value)
+        if binary == self.binary:
+            return
+        self.binary = binary
+        self.config = None
         # self.device_class = None
-        self.config_topic = sensor_config_topic.format(id=self.id)
-        if self.elem_value == False or self.elem_value:
-            self.binary = True
+        if self.binary:
             self.json_attributes_topic = binary_sensor_json_attributes_topic.format(
+                namespace=self.namespace,
                 id=self.id)
-            self.config_topic = binary_sensor_config_topic.format(id=self.id)
+            self.config_topic = binary_sensor_config_topic.format(
+                namespace=self.namespace, id=self.id).lower()
             # if 'efect' in self.elem_name:
             #     self.device_class = 'problem'
             # elif 'ntrusion' in self.elem_name or 'zone' in self.elem_name or 'alarm' in self.elem_name:
@@ -58,8 +82,10 @@ class sensor:
             #     self.device_class = 'signal_strength'
         else:
             self.json_attributes_topic = sensor_json_attributes_topic.format(
+                namespace=self.namespace,
                 id=self.id)
-            self.config_topic = sensor_config_topic.format(id=self.id)
+            self.config_topic = sensor_config_topic.format(
+                namespace=self.namespace, id=self.id).lower()
             # if 'emperature' in self.elem_name:
             #     self.device_class = 'temperature'
 
@@ -100,14 +126,15 @@ class sensor:
     # window: on means open, off means closed
 
     async def setup(self):
+        # Built once, again only if the name or the sensor kind changed
+        if self.config is not None:
+            return
         self.device = {}
         self.device['manufacturer'] = 'Delta Dore'
         self.device['model'] = 'Sensor'
         self.device['name'] = self.name
         self.device['identifiers'] = self.parent_device_id + '_sensors'
 
-        self.config_sensor_topic = sensor_config_topic.format(id=self.id)
-
         self.config = {}
         self.config['name'] = self.name
         self.config['unique_id'] = self.id
@@ -134,9 +161,8 @@ class sensor:
         self.config['state_topic'] = self.json_attributes_topic
 
         if (self.mqtt is not None):
-            self.mqtt.mqtt_client.publish(
-                (self.config_topic).lower(), json.dumps(
-                    self.config), qos=0, retain=True)  # sensor Config
+            self.mqtt.publish_config(
+                self.config_topic, self.config, retain=True)  # sensor Config
 
         # print("CONFIG : ",(self.config_topic).lower(), json.dumps(self.config))
     async def update(self):
@@ -147,6 +173,9 @@ class sensor:
 
         if 'name' in self.elem_name or 'device_type' in self.elem_name or self.elem_value is None:
             pass  # OOOOOOOOOH that's quick and dirty
+        elif self.states is not None and self.config is not None and \
+                not self.states.stale(self.id, self.elem_value):
+            pass
         else:
             await self.setup()  # Publish config
             # Publish state json to state topic
@@ -154,10 +183,12 @@ class sensor:
                 # print(self.json_attributes_topic, self.attributes)
                 # self.mqtt.mqtt_client.publish(self.json_attributes_topic,
                 # self.attributes, qos=0) #sensor json State
-                self.mqtt.mqtt_client.publish(
+                self.mqtt.publish(
                     self.json_attributes_topic,
                     self.elem_value,
                     qos=0)  # sensor State
+            if self.states is not None:
+                self.states.mark(self.id, self.elem_value)
             if not self.binary:
                 print(
                     "Sensor created / updated : ",
@@ -2,28 +2,29 @@ import json
 import time
 from datetime import datetime
 from sensors import sensor
+import json_codec
 
-switch_config_topic = "homeassistant/switch/tydom/{id}/config"
-switch_state_topic = "switch/tydom/{id}/state"
-switch_attributes_topic = "switch/tydom/{id}/attributes"
-switch_command_topic = "switch/tydom/{id}/set_levelCmdGate"
-switch_level_topic = "switch/tydom/{id}/current_level"
-switch_set_level_topic = "switch/tydom/{id}/set_levelGate"
+switch_config_topic = "homeassistant/switch/{namespace}/{id}/config"
+switch_state_topic = "switch/{namespace}/{id}/state"
+switch_attributes_topic = "switch/{namespace}/{id}/attributes"
+switch_command_topic = "switch/{namespace}/{id}/set_levelCmdGate"
+switch_level_topic = "switch/{namespace}/{id}/current_level"
+switch_set_level_topic = "switch/{namespace}/{id}/set_levelGate"
 
 
 class Switch:
-    def __init__(self, tydom_attributes, set_level=None, mqtt=None):
+    # Created once per switch, later frames go through apply()
+    __slots__ = ('attributes', 'device_id', 'endpoint_id', 'id', 'name',
+                 'current_level', 'set_level', 'mqtt', 'namespace',
+                 'unique_id', 'config_topic', 'level_topic', 'device',
+                 'config', 'sensors', 'states')
+
+    def __init__(self, tydom_attributes, set_level=None, mqtt=None,
+                 namespace='tydom', states=None):
         self.attributes = tydom_attributes
         self.device_id = self.attributes['device_id']
         self.endpoint_id = self.attributes['endpoint_id']
         self.id = self.attributes['id']
-        self.name = self.attributes['switch_name']
-
-        try:
-            self.current_level = self.attributes['level']
-        except Exception as e:
-            print(e)
-            self.current_level = None
         self.set_level = set_level
 
         # try:
@@ -32,25 +33,51 @@ class Switch:
         #    print(e)
         #    self.current_state = 'On'
         self.mqtt = mqtt
+        self.namespace = namespace
+        self.states = states
+        # Entities of other hubs than the default one get their own unique ids
+        self.unique_id = self.id if namespace == 'tydom' else namespace + '_' + self.id
+        self.config_topic = switch_config_topic.format(namespace=self.namespace, id=self.id)
+        self.level_topic = switch_state_topic.format(namespace=self.namespace, id=self.id)
+        self.name = None
+        self.config = None
+        self.sensors = dict()
+        self.apply(tydom_attributes)
+
+    # Attributes of a new frame, merged into the known ones
+    def apply(self, tydom_attributes):
+        if tydom_attributes is not self.attributes:
+            self.attributes.update(tydom_attributes)
+        if self.attributes['switch_name'] != self.name:
+            self.name = self.attributes['switch_name']
+            self.config = None
+        try:
+            self.current_level = self.attributes['level']
+        except Exception as e:
+            print(e)
+            self.current_level = None
 
     async def setup(self):
         # availability:
         #  - topic: "home/bedroom/switch1/available"
 
+        # Built once, again only if the name changed
+        if self.config is not None:
+            return
         self.device = {}
         self.device['manufacturer'] = 'Delta Dore'
         self.device['model'] = 'Porte'
         self.device['name'] = self.name
-        self.device['identifiers'] = self.id
+        self.device['identifiers'] = self.unique_id
 
-        self.config_topic = switch_config_topic.format(id=self.id)
         self.config = {}
         self.config['name'] = self.name
-        self.config['unique_id'] = self.id
+        self.config['unique_id'] = self.unique_id
         # self.config['attributes'] = self.attributes
-        self.config['command_topic'] = switch_command_topic.format(id=self.id)
-        self.config['state_topic'] = switch_state_topic.format(id=self.id)
+        self.config['command_topic'] = switch_command_topic.format(namespace=self.namespace, id=self.id)
+        self.config['state_topic'] = self.level_topic
         self.config['json_attributes_topic'] = switch_attributes_topic.format(
+            namespace=self.namespace,
             id=self.id)
 
         self.config['payload_on'] = "TOGGLE"
@@ -61,9 +88,7 @@ class Switch:
         # print(self.config)
 
         if (self.mqtt is not None):
-            self.mqtt.mqtt_client.publish(
-                self.config_topic, json.dumps(
-                    self.config), qos=0)
+            self.mqtt.publish_config(self.config_topic, self.config)
         # setup_pub = '(self.config_topic, json.dumps(self.config), qos=0)'
         # return(setup_pub)
 
@@ -76,17 +101,14 @@ class Switch:
             print("Switch sensors Error :")
             print(e)
 
-        self.level_topic = switch_state_topic.format(
-            id=self.id, current_level=self.current_level)
-
         if (self.mqtt is not None):
-            self.mqtt.mqtt_client.publish(
+            self.mqtt.publish(
                 self.level_topic,
                 self.current_level,
                 qos=0,
                 retain=True)  # Switch State
-            self.mqtt.mqtt_client.publish(
-                self.config['json_attributes_topic'], self.attributes, qos=0)
+            self.mqtt.publish(
+                self.config['json_attributes_topic'], json_codec.dumps(self.attributes), qos=0)
         print(
             "Switch created / updated : ",
             self.name,
@@ -102,12 +124,17 @@ class Switch:
             # sensor_name = "tydom_alarm_sensor_"+i
             # print("name "+sensor_name, "elem_name "+i, "attributes_topic_from_device ",self.config['json_attributes_topic'], "mqtt",self.mqtt)
             if not i == 'device_type' or not i == 'id':
-                new_sensor = None
-                new_sensor = sensor(
-                    elem_name=i,
-                    tydom_attributes_payload=self.attributes,
-                    attributes_topic_from_device=self.config['json_attributes_topic'],
-                    mqtt=self.mqtt)
+                new_sensor = self.sensors.get(i)
+                if new_sensor is None:
+                    new_sensor = self.sensors[i] = sensor(
+                        elem_name=i,
+                        tydom_attributes_payload=self.attributes,
+                        attributes_topic_from_device=self.config['json_attributes_topic'],
+                        mqtt=self.mqtt,
+                        namespace=self.namespace,
+                        states=self.states)
+                else:
+                    new_sensor.apply(self.attributes)
                 await new_sensor.update()
     # def __init__(self, name, elem_name, tydom_attributes_payload,
     # attributes_topic_from_device, mqtt=None):
@@ -0,0 +1,112 @@
+import asyncio
+
+
+# Orders relative to the current state (TOGGLE, STEP_UP...) are never
+# replaced by a later one, each of them is sent
+def relative(value):
+    return isinstance(value, str) and (
+        value.upper() == 'TOGGLE' or value.upper().startswith('STEP'))
+
+
+class TydomCommandScheduler():
+    '''
+        Sits between the entities put_* methods and the websocket.
+        Only the latest value per (device, endpoint, name) waiting to be sent
+        is kept, and the number of frames waiting for a hub answer is capped.
+        A slider sweep therefore ends up in a handful of frames instead of
+        one frame per MQTT message. Orders waiting for the same endpoint are
+        sent together in one PUT body, relative ones go alone, in order.
+    '''
+
+    def __init__(self, tydom_client, window=0.1, max_in_flight=2):
+        self.tydom_client = tydom_client
+        self.window = window
+        self.max_in_flight = max_in_flight
+        # (device_id, endpoint_id[, sequence]) -> {name: [value, futures
+        # waiting for it]}, sent in insertion order. Entries with a sequence
+        # are closed to later orders.
+        self.pending = dict()
+        self.sequence = 0
+        self.slots = None
+        self.task = None
+        # Counters
+        self.received = 0
+        self.coalesced = 0
+        self.sent = 0
+
+    def put(self, device_id, endpoint_id, name, value):
+        loop = asyncio.get_event_loop()
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.max_in_flight)
+        self.received += 1
+
+        waiter = loop.create_future()
+        waiter.add_done_callback(lambda f: f.cancelled() or f.exception())
+        key = (str(device_id), str(endpoint_id))
+        if relative(value):
+            # What waits for the endpoint goes before, what comes next after
+            waiting = self.pending.pop(key, None)
+            if waiting is not None:
+                self.pending[key + (self.next_sequence(),)] = waiting
+            self.pending[key + (self.next_sequence(),)] = {name: [value, [waiter]]}
+            self.start()
+            return waiter
+
+        orders = self.pending.setdefault(key, dict())
+        if name in orders:
+            # Newer value replaces the one not sent yet
+            self.coalesced += 1
+            orders[name][0] = value
+            orders[name][1].append(waiter)
+        else:
+            orders[name] = [value, [waiter]]
+        self.start()
+        return waiter
+
+    def next_sequence(self):
+        self.sequence += 1
+        return self.sequence
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        # Let the burst (slider, automation...) fill the queue first
+        await asyncio.sleep(self.window)
+        while len(self.pending) > 0:
+            await self.slots.acquire()
+            if len(self.pending) == 0:
+                self.slots.release()
+                break
+            key = next(iter(self.pending))
+            orders = self.pending.pop(key)
+            device_id, endpoint_id = key[:2]
+            items = [(name, order[0]) for name, order in orders.items()]
+            waiters = [waiter for order in orders.values()
+                       for waiter in order[1]]
+            try:
+                response = await self.tydom_client.send_devices_data(
+                    device_id, endpoint_id, items)
+            except Exception as e:
+                print('Command scheduler : sending', key, 'failed :', e)
+                self.slots.release()
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+                continue
+            self.sent += 1
+            response.add_done_callback(
+                lambda f, waiters=waiters: self.on_response(f, waiters))
+
+    def on_response(self, response, waiters):
+        self.slots.release()
+        for waiter in waiters:
+            if waiter.done():
+                continue
+            if response.cancelled():
+                waiter.cancel()
+            elif response.exception() is not None:
+                waiter.set_exception(response.exception())
+            else:
+                waiter.set_result(response.result())
@@ -0,0 +1,50 @@
+import hashlib
+import json
+import os
+
+
+class TydomConfigCache():
+    '''
+        Devices registry parsed from /configs/file, kept on disk (the add-on
+        /data volume) so data frames can be mapped right after a restart.
+        One file per hub MAC, holding the hash of the configuration it comes
+        from, to spot configuration changes.
+    '''
+
+    def __init__(self, mac, directory='/data'):
+        self.hash = None
+        self.file = None
+        if os.path.isdir(directory):
+            self.file = os.path.join(
+                directory, 'tydom_config_{}.json'.format(str(mac).lower()))
+
+    def load(self):
+        if self.file is None:
+            return None
+        try:
+            with open(self.file) as f:
+                cached = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print('Cannot read configuration cache', self.file, ':', e)
+            return None
+        self.hash = cached['hash']
+        return cached['registry']
+
+    def save(self, config_hash, registry):
+        self.hash = config_hash
+        if self.file is None:
+            return
+        try:
+            # Written aside then moved, a crash never leaves half a file
+            with open(self.file + '.tmp', 'w') as f:
+                json.dump({'hash': config_hash, 'registry': registry}, f)
+            os.replace(self.file + '.tmp', self.file)
+        except Exception as e:
+            print('Cannot write configuration cache', self.file, ':', e)
+
+
+# Hash of the /configs/file payload, as received
+def config_hash(payload):
+    return hashlib.sha1(payload).hexdigest()
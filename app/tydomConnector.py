@@ -1,7 +1,6 @@
 import asyncio
 from asyncio import exceptions
 import websockets
-import http.client
 from requests.auth import HTTPDigestAuth
 import sys
 import socket
@@ -14,145 +13,543 @@ from datetime import datetime
 import subprocess
 import platform
 
+from tydomCommandScheduler import TydomCommandScheduler
+from tydomFrames import TydomFrameBuilder, get_transac_id
+from reconnect_supervisor import ReconnectSupervisor
+from tydomConfigCache import TydomConfigCache
+from tydomStateStore import TydomStateStore
+
 # Thanks
 # https://stackoverflow.com/questions/49878953/issues-listening-incoming-messages-in-websocket-client-on-python-3-6
 
 
+class TydomRequestTracker():
+    '''
+        Gives a unique Transac-Id to every request sent to the hub and keeps
+        the futures waiting for the matching response
+    '''
+
+    def __init__(self, timeout=4):
+        self.timeout = timeout
+        self.last_id = 0
+        # transac_id -> (future, uri, sent_at, timeout handle)
+        self.pending = dict()
+        # uri -> last round trip time in seconds
+        self.latencies = dict()
+
+    def new_request(self, uri, timeout=None):
+        loop = asyncio.get_event_loop()
+        self.last_id += 1
+        transac_id = str(self.last_id)
+        future = loop.create_future()
+        # Fire and forget callers never look at the result
+        future.add_done_callback(
+            lambda f: f.cancelled() or f.exception())
+        handle = loop.call_later(
+            self.timeout if timeout is None else timeout,
+            self.expire,
+            transac_id)
+        self.pending[transac_id] = (future, uri, time.monotonic(), handle)
+        return transac_id, future
+
+    def resolve(self, transac_id, response, uri_origin=None):
+        '''
+            Resolves the request of transac_id or, when the hub did not echo
+            it (not guaranteed through mediation), the oldest request sent
+            to uri_origin
+        '''
+        entry = None
+        if transac_id is not None:
+            entry = self.pending.pop(str(transac_id), None)
+        if entry is None and uri_origin is not None:
+            transac_id = self.find_origin(uri_origin)
+            if transac_id is not None:
+                entry = self.pending.pop(transac_id)
+        if entry is None:
+            return False
+        future, uri, sent_at, handle = entry
+        handle.cancel()
+        self.latencies[uri] = time.monotonic() - sent_at
+        if not future.done():
+            future.set_result(response)
+        return True
+
+    def find_origin(self, uri_origin):
+        for transac_id, (future, uri, sent_at, handle) in self.pending.items():
+            if uri.partition(' ')[2] == uri_origin:
+                return transac_id
+        return None
+
+    def expire(self, transac_id):
+        entry = self.pending.pop(transac_id, None)
+        if entry is not None:
+            future, uri, sent_at, handle = entry
+            print('No response from tydom for', uri, '(Transac-Id', transac_id, ')')
+            if not future.done():
+                future.set_exception(asyncio.TimeoutError(
+                    'Transac-Id {} ({}) timed out'.format(transac_id, uri)))
+
+    def cancel_all(self):
+        for transac_id in list(self.pending):
+            future, uri, sent_at, handle = self.pending.pop(transac_id)
+            handle.cancel()
+            future.cancel()
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    '''
+        Unverified client context resuming the last TLS session of a host,
+        so reconnections skip the full handshake
+    '''
+
+    def __new__(cls):
+        return super().__new__(cls, ssl.PROTOCOL_TLS_CLIENT)
+
+    def __init__(self):
+        super().__init__()
+        self.check_hostname = False
+        self.verify_mode = ssl.CERT_NONE
+        # host -> ssl.SSLSession
+        self.sessions = dict()
+
+    def wrap_bio(self, incoming, outgoing, server_side=False,
+                 server_hostname=None, session=None):
+        if session is None and not server_side:
+            session = self.sessions.get(server_hostname)
+        return super().wrap_bio(incoming, outgoing, server_side=server_side,
+                                server_hostname=server_hostname, session=session)
+
+
+class TydomPath():
+    '''
+        One way to reach the hub : its local IP, or remote through
+        mediation.tydom.com. Each path has its own websocket, command prefix
+        and digest realm.
+    '''
+
+    def __init__(self, host, port=443):
+        self.host = host
+        self.port = port
+        self.remote_mode = host == 'mediation.tydom.com'
+        if self.remote_mode:
+            self.cmd_prefix = "\x02"
+            self.realm = "ServiceMedia"
+            self.ping_timeout = 40
+        else:
+            # ping_timeout=None is necessary on local connection to avoid 1006 erros
+            self.cmd_prefix = ""
+            self.realm = "protected area"
+            self.ping_timeout = None
+        self.frames = TydomFrameBuilder(self.cmd_prefix)
+        self.connection = None
+        self.reader = None
+        self.healthy = False
+        # Smoothed round trip time of GET /ping, in seconds
+        self.rtt = None
+        self.failures = 0
+        self.supervisor = ReconnectSupervisor('Tydom path ' + str(self))
+        # Last digest challenge, reused while the hub accepts it
+        self.nonce = None
+        self.nonce_count = 0
+        self.connect_time = None
+
+    def __str__(self):
+        return ('remote ' if self.remote_mode else 'local ') + self.host
+
+    def update_rtt(self, rtt):
+        self.failures = 0
+        if self.rtt is None:
+            self.rtt = rtt
+        else:
+            self.rtt = 0.7 * self.rtt + 0.3 * rtt
+
+
 class TydomWebSocketClient():
 
     def __init__(self, mac, password, alarm_pin=None,
-                 host='mediation.tydom.com'):
+                 host='mediation.tydom.com', namespace='tydom',
+                 remote_fallback=False):
         print('Initialising TydomClient Class')
 
         self.password = password
         self.mac = mac
-        self.host = host
+        # MQTT topics namespace of this hub (cover/<namespace>/...)
+        self.namespace = namespace
         self.alarm_pin = alarm_pin
-        self.connection = None
-        self.remote_mode = True
-        self.ssl_context = None
-        self.cmd_prefix = "\x02"
+        self.ssl_context = ResumingSSLContext()
+        # host -> ([addresses], expiry)
+        self.addresses = dict()
+        self.dns_ttl = 600
         self.reply_timeout = 4
-        self.ping_timeout = None
         self.refresh_timeout = 42
-        # # ping_timeout=None is necessary on local connection to avoid 1006 erros
         self.sleep_time = 2
-        self.incoming = None
-        # if not (self.host == 'mediation.tydom.com'):
-        #     test = None
-        #     testlocal = None
-        #     try:
-        #         print('Testing if local Tydom hub IP is reachable....')
-        #         testlocal = subprocess.check_output("ping -{} 1 {}".format('n' if platform.system().lower()=="windows" else 'c', self.host), shell=True)
-        #     except Exception as e:
-        #         print('Local control is down, will try to fallback to remote....')
-        #         try:
-        #             print('Testing if mediation.tydom.com is reacheable...')
-        #             test = subprocess.check_output("ping -{} 1 {}".format('n' if platform.system().lower()=="windows" else 'c', 'mediation.tydom.com'), shell=True)
-        #             print('mediation.tydom.com is reacheable ! Using it to prevent code 1006 deconnections from local ip for now.')
-        #             self.host = 'mediation.tydom.com'
-        #         except Exception as e:
-        #             print('Remote control is down !')
-
-        #             if (testlocal == None) :
-        #                 print("Exiting to ensure restart....")
-        #                 #sys.exit()
-
-        # Set Host, ssl context and prefix for remote or local connection
-        if self.host == "mediation.tydom.com":
-            print('Setting remote mode context.')
-            self.remote_mode = True
-            #self.ssl_context = None
-            self.ssl_context = ssl._create_unverified_context()
-            self.cmd_prefix = "\x02"
-            self.ping_timeout = 40
-
-        else:
-            print('Setting local mode context.')
-            self.remote_mode = False
-            self.ssl_context = ssl._create_unverified_context()
-            self.cmd_prefix = ""
-            self.ping_timeout = None
+        self.handshake_timeout = 10
+        # Set once the configuration is known (parsed or loaded from the
+        # cache), devices data is requested as soon as it is
+        self.config_parsed = asyncio.Event()
+        self.config_timeout = 15
+        self.config_cache = TydomConfigCache(mac)
+        # Last known devices data, entities are published on changes
+        self.states = TydomStateStore()
+        # Time to first published state, from the client creation
+        self.started_at = time.monotonic()
+        self.first_state_time = None
+        # Round trip of every path is measured at this interval
+        self.probe_interval = 30
+        self.probe_failures = 2
+        # Frames received on the active path, one queue for the client
+        # lifetime (the listener waits on it)
+        self.incoming = asyncio.Queue()
+        # Set by request_reconnect, for the listener to connect again
+        self.reconnect_requested = False
+        self.monitor = None
+        self.supervisor = ReconnectSupervisor('Tydom ' + namespace)
+        self.requests = TydomRequestTracker(timeout=self.reply_timeout)
+        self.commands = TydomCommandScheduler(tydom_client=self)
+
+        # Set Host, ssl context and prefix for remote or local connection,
+        # with mediation.tydom.com as fallback of the local IP if asked
+        self.paths = [TydomPath(host)]
+        if remote_fallback and host != 'mediation.tydom.com':
+            self.paths.append(TydomPath('mediation.tydom.com'))
+        self.path = self.paths[0]
+        for path in self.paths:
+            print('Setting', 'remote' if path.remote_mode else 'local',
+                  'mode context.')
+
+    # Active path attributes
+    @property
+    def connection(self):
+        return self.path.connection
+
+    @property
+    def host(self):
+        return self.path.host
+
+    @property
+    def remote_mode(self):
+        return self.path.remote_mode
+
+    @property
+    def cmd_prefix(self):
+        return self.path.cmd_prefix
+
+    @property
+    def ping_timeout(self):
+        return self.path.ping_timeout
+
+    @property
+    def frames(self):
+        return self.path.frames
 
     async def connect(self):
 
         print('""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""""')
         print('TYDOM WEBSOCKET CONNECTION INITIALISING....                     ')
 
+        await self.disconnect()
+        # Responses to requests sent on a previous connection will never come
+        self.requests.cancel_all()
+        # Frames of the previous connection are dropped
+        self.reconnect_requested = False
+        while not self.incoming.empty():
+            self.incoming.get_nowait()
+
+        results = await asyncio.gather(
+            *[self.connect_path(path) for path in self.paths],
+            return_exceptions=True)
+        for path, result in zip(self.paths, results):
+            if isinstance(result, BaseException):
+                print('Exception when trying to connect with websocket on',
+                      path, '!')
+                print(result)
+        if not any(path.healthy for path in self.paths):
+            raise ConnectionError('No way to reach the tydom hub !')
+
+        self.path = next(path for path in self.paths if path.healthy)
+        print('Active tydom path :', self.path)
+        if len(self.paths) > 1:
+            self.monitor = asyncio.ensure_future(self.monitor_paths())
+        return self.connection
+
+    async def connect_path(self, path):
+        started = time.monotonic()
+        addresses = await self.resolve(path.host)
+        # Every resolved address in turn (IPv6 and IPv4, several A records)
+        for address in addresses:
+            try:
+                await self.connect_address(path, address)
+                break
+            except Exception as e:
+                # New handshake with the next address
+                path.nonce = None
+                error = e
+                print('Tydom path', path, 'unreachable at', address, ':', e)
+        else:
+            # Resolved again next time
+            self.addresses.pop(path.host, None)
+            raise error
+        # Next connections start with the address that answered
+        if address != addresses[0]:
+            addresses.remove(address)
+            addresses.insert(0, address)
+
+        path.healthy = True
+        path.failures = 0
+        path.reader = asyncio.ensure_future(self.read_path(path))
+        path.connect_time = time.monotonic() - started
+        print('Connected to', path, 'in {:.3f}s'.format(path.connect_time),
+              '(TLS session reused)' if self.session_reused(path.connection.transport) else '')
+        return path.connection
+
+    async def connect_address(self, path, address):
+        reused_nonce = path.nonce is not None
+        if not reused_nonce:
+            await self.challenge(path, address)
+        try:
+            await self.upgrade(path, address)
+        except websockets.exceptions.InvalidStatusCode as e:
+            if not reused_nonce or e.status_code != 401:
+                raise
+            # Hub does not accept the last nonce anymore
+            print('Cached nonce refused by the hub, new handshake....')
+            await self.challenge(path, address)
+            await self.upgrade(path, address)
+
+    async def challenge(self, path, address):
         print('Building headers, getting 1st handshake and authentication....')
 
         httpHeaders = {"Connection": "Upgrade",
                        "Upgrade": "websocket",
-                       "Host": self.host + ":443",
+                       "Host": path.host + ":443",
                        "Accept": "*/*",
-                       "Sec-WebSocket-Key": self.generate_random_key(),
+                       "Sec-WebSocket-Key": self.generate_random_key().decode(),
                        "Sec-WebSocket-Version": "13"
                        }
-        conn = http.client.HTTPSConnection(
-            self.host, 443, context=self.ssl_context)
-
-        # Get first handshake
-        conn.request("GET",
-                     "/mediation/client?mac={}&appli=1".format(self.mac),
-                     None,
-                     httpHeaders)
-        res = conn.getresponse()
-        # Get authentication
-        nonce = res.headers["WWW-Authenticate"].split(',', 3)
-        # read response
-        res.read()
-        # Close HTTPS Connection
-        conn.close()
+        # Get first handshake and authentication, without blocking the loop
+        path.nonce = await asyncio.wait_for(
+            self.get_challenge(httpHeaders, path, address),
+            timeout=self.handshake_timeout)
+        path.nonce_count = 0
 
+    async def upgrade(self, path, address):
         print('Upgrading http connection to websocket....')
-        # Build websocket headers
-        websocketHeaders = {'Authorization': self.build_digest_headers(nonce)}
+        # Build websocket headers, the nonce is reused with an incremented
+        # count on warm reconnections
+        path.nonce_count += 1
+        websocketHeaders = {
+            'Authorization': self.build_digest_headers(path.nonce, path, path.nonce_count)}
 
         if self.ssl_context is not None:
             websocket_ssl_context = self.ssl_context
         else:
             websocket_ssl_context = True  # Verify certificate
 
-    # outer loop restarted every time the connection fails
         print('Attempting websocket connection with tydom hub.......................')
         print('Host Target :')
-        print(self.host)
+        print(path.host)
         '''
             Connecting to webSocket server
             websockets.client.connect returns a WebSocketClientProtocol, which is used to send and receive messages
         '''
+        path.connection = await websockets.connect('wss://{}:{}/mediation/client?mac={}&appli=1'.format(path.host, path.port, self.mac),
+                                                   extra_headers=websocketHeaders, ssl=websocket_ssl_context, ping_timeout=None,
+                                                   host=address, server_hostname=path.host)
+        self.save_session(path.host, path.connection.transport)
+
+    # Cached DNS resolution of the hub host, every address in the resolver
+    # order (the one that answered last comes first)
+    async def resolve(self, host):
+        entry = self.addresses.get(host)
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+        infos = await asyncio.get_event_loop().getaddrinfo(
+            host, None, type=socket.SOCK_STREAM)
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        self.addresses[host] = (addresses, time.monotonic() + self.dns_ttl)
+        return addresses
+
+    # TLS sessions are kept per host, to be resumed by the next connections
+    def save_session(self, host, transport):
+        ssl_object = transport.get_extra_info('ssl_object')
+        if ssl_object is not None and ssl_object.session is not None:
+            self.ssl_context.sessions[host] = ssl_object.session
+
+    def session_reused(self, transport):
+        ssl_object = transport.get_extra_info('ssl_object')
+        return ssl_object is not None and ssl_object.session_reused
+
+    async def disconnect(self):
+        if self.monitor is not None:
+            self.monitor.cancel()
+            self.monitor = None
+        for path in self.paths:
+            await self.close_path(path)
+
+    async def close_path(self, path):
+        path.healthy = False
+        if path.reader is not None:
+            path.reader.cancel()
+            path.reader = None
+        if path.connection is not None:
+            try:
+                await path.connection.close()
+            except Exception:
+                pass
+
+    async def recv(self):
+        '''
+            Next frame received on the active path. Raises ConnectionError
+            when every path is down.
+        '''
+        frame = await self.incoming.get()
+        if frame is None:
+            if self.reconnect_requested:
+                raise ConnectionError('Reconnection requested')
+            raise ConnectionError('Every path to the tydom hub is down')
+        return frame
+
+    # The listener connects again (then runs setup) as soon as it reads
+    # what is already queued
+    def request_reconnect(self):
+        self.reconnect_requested = True
+        self.incoming.put_nowait(None)
+
+    async def read_path(self, path):
         try:
-            self.connection = await websockets.connect('wss://{}:443/mediation/client?mac={}&appli=1'.format(self.host, self.mac),
-                                                       extra_headers=websocketHeaders, ssl=websocket_ssl_context, ping_timeout=None)
-
-            return self.connection
+            while True:
+                frame = await path.connection.recv()
+                if path is self.path:
+                    self.incoming.put_nowait(frame)
+                else:
+                    # Standby path, only answers to our probes matter
+                    transac_id = get_transac_id(frame)
+                    if transac_id is not None:
+                        self.requests.resolve(transac_id, frame)
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            print('Exception when trying to connect with websocket !')
-            print(e)
-            print(
-                'wss://{}:443/mediation/client?mac={}&appli=1'.format(self.host, self.mac))
-            print(websocketHeaders)
-            exit()
+            print('Tydom path', path, 'is down :', e)
+            path.healthy = False
+            self.failover()
+
+    def failover(self):
+        if self.path.healthy:
+            return
+        for path in self.paths:
+            if path.healthy:
+                self.switch_path(path)
+                return
+        # Nothing left, let the listener reconnect everything
+        self.incoming.put_nowait(None)
+
+    def switch_path(self, path):
+        print('Switching tydom path from', self.path, 'to', path)
+        self.path = path
+        # Catch up with what may have been pushed during the switch
+        asyncio.ensure_future(self.get_devices_data())
+
+    async def probe_path(self, path):
+        # Timed here, probes of the paths may overlap
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(
+                self.request('GET', '/ping', path=path),
+                timeout=self.reply_timeout)
+            path.update_rtt(time.monotonic() - started)
+        except Exception as e:
+            path.failures += 1
+            print('Tydom path', path, 'ping failed :', e)
+            if path.failures >= self.probe_failures:
+                await self.close_path(path)
+
+    async def monitor_paths(self):
+        '''
+            Measures the round trip of every path, sends commands over the
+            fastest healthy one and brings back the paths that went down.
+        '''
+        while True:
+            await asyncio.sleep(self.probe_interval)
+            for path in self.paths:
+                if not path.healthy:
+                    if not path.supervisor.ready():
+                        continue
+                    try:
+                        await self.connect_path(path)
+                    except Exception as e:
+                        path.supervisor.failure(e)
+                        continue
+                    path.supervisor.success()
+                await self.probe_path(path)
+
+            self.failover()
+            candidates = [path for path in self.paths
+                          if path.healthy and path.rtt is not None]
+            if len(candidates) == 0 or not self.path.healthy:
+                continue
+            fastest = min(candidates, key=lambda path: path.rtt)
+            # Only switch for a clear gain
+            if fastest is not self.path and (
+                    self.path.rtt is None or fastest.rtt < 0.7 * self.path.rtt):
+                self.switch_path(fastest)
 
 # Utils
 
+    async def get_challenge(self, headers, path, address):
+        '''
+            1st handshake done with asyncio streams, so MQTT keeps running
+            while the hub answers. Returns the splitted WWW-Authenticate header
+        '''
+        reader, writer = await asyncio.open_connection(
+            address, path.port, ssl=self.ssl_context,
+            server_hostname=path.host)
+        try:
+            request = "GET /mediation/client?mac={}&appli=1 HTTP/1.1\r\n".format(
+                self.mac)
+            for key, value in headers.items():
+                request += "{}: {}\r\n".format(key, value)
+            writer.write(bytes(request + "\r\n", "ascii"))
+            await writer.drain()
+
+            head = await reader.readuntil(b"\r\n\r\n")
+            response_headers = {}
+            for line in head.decode("latin-1").split("\r\n")[1:]:
+                if ':' in line:
+                    key, value = line.split(':', 1)
+                    response_headers[key.strip().lower()] = value.strip()
+            # read response
+            length = int(response_headers.get("content-length", 0))
+            if length > 0:
+                await reader.readexactly(length)
+            self.save_session(path.host, writer.transport)
+        finally:
+            # Close HTTPS Connection
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+        return response_headers["www-authenticate"].split(',', 3)
+
     # Generate 16 bytes random key for Sec-WebSocket-Keyand convert it to
     # base64
     def generate_random_key(self):
         return base64.b64encode(os.urandom(16))
 
     # Build the headers of Digest Authentication
-    def build_digest_headers(self, nonce):
+    def build_digest_headers(self, nonce, path, nonce_count=1):
         digestAuth = HTTPDigestAuth(self.mac, self.password)
         chal = dict()
         chal["nonce"] = nonce[2].split('=', 1)[1].split('"')[1]
-        chal["realm"] = "ServiceMedia" if self.remote_mode is True else "protected area"
+        chal["realm"] = path.realm
         chal["qop"] = "auth"
         digestAuth._thread_local.chal = chal
-        digestAuth._thread_local.last_nonce = nonce
-        digestAuth._thread_local.nonce_count = 1
+        # build_digest_header increments the count for the same nonce
+        digestAuth._thread_local.last_nonce = chal["nonce"]
+        digestAuth._thread_local.nonce_count = nonce_count - 1
         return digestAuth.build_digest_header(
-            'GET', "https://{}:443/mediation/client?mac={}&appli=1".format(self.host, self.mac))
+            'GET', "https://{}:443/mediation/client?mac={}&appli=1".format(path.host, self.mac))
 
     async def notify_alive(self, msg='OK'):
         # print('Connection Still Alive !')
@@ -171,12 +568,13 @@ class TydomWebSocketClient():
 
     # Send Generic  message
 
-    async def send_message(self, method, msg):
+    async def send_message(self, method, msg, timeout=None, path=None):
         # print(method, msg)
-
-        str = self.cmd_prefix + method + ' ' + msg + \
-            " HTTP/1.1\r\nContent-Length: 0\r\nContent-Type: application/json; charset=UTF-8\r\nTransac-Id: 0\r\n\r\n"
-        a_bytes = bytes(str, "ascii")
+        if path is None:
+            path = self.path
+        transac_id, future = self.requests.new_request(
+            method + ' ' + msg, timeout=timeout)
+        a_bytes = path.frames.request(method, msg, transac_id)
         if 'pwd' not in msg:
             print('>>>>>>>>>> Sending to tydom client.....', method, msg)
         else:
@@ -185,24 +583,38 @@ class TydomWebSocketClient():
                 method,
                 'secret msg')
 
-        await self.connection.send(a_bytes)
+        await path.connection.send(a_bytes)
         # print(a_bytes)
-        return 0
-
-    # Give order (name + value) to endpoint
+        return future
+
+    # Send a message and wait for the matching response, a str (the raw body
+    # bytes for /configs/file and /devices/data, which can be large)
+    # (never from the listener loop, which is the one reading the responses)
+    async def request(self, method, msg, timeout=None, path=None):
+        future = await self.send_message(
+            method, msg, timeout=timeout, path=path)
+        return await future
+
+    # Give order (name + value) to endpoint, through the command scheduler
+    # (orders still waiting for the same endpoint data are replaced)
     async def put_devices_data(self, device_id, endpoint_id, name, value):
+        return self.commands.put(device_id, endpoint_id, name, value)
+
+    # Send the orders [(name, value), ...] to endpoint right away, in one
+    # frame
+    async def send_devices_data(self, device_id, endpoint_id, items):
 
         # For shutter, value is the percentage of closing
-        body = "[{\"name\":\"" + name + "\",\"value\":\"" + value + "\"}]"
         # endpoint_id is the endpoint = the device (shutter in this case) to
         # open.
-        str_request = self.cmd_prefix + "PUT /devices/{}/endpoints/{}/data HTTP/1.1\r\nContent-Length: ".format(str(device_id), str(
-            endpoint_id)) + str(len(body)) + "\r\nContent-Type: application/json; charset=UTF-8\r\nTransac-Id: 0\r\n\r\n" + body + "\r\n\r\n"
-        a_bytes = bytes(str_request, "ascii")
+        transac_id, future = self.requests.new_request(
+            'PUT /devices/{}/endpoints/{}/data'.format(device_id, endpoint_id))
+        a_bytes = self.frames.put_devices_data(
+            device_id, endpoint_id, items, transac_id)
         # print(a_bytes)
-        print('Sending to tydom client.....', 'PUT data', body)
+        print('Sending to tydom client.....', 'PUT data', device_id, endpoint_id, items)
         await self.connection.send(a_bytes)
-        return 0
+        return future
 
     async def put_alarm_cdata(self, device_id, alarm_id=None, value=None, zone_id=None):
 
@@ -229,24 +641,22 @@ class TydomWebSocketClient():
 
             if zone_id is None:
                 Cmd = 'alarmCmd'
-                body = "{\"value\":\"" + \
-                    str(value) + "\",\"pwd\":\"" + str(self.alarm_pin) + "\"}"
+                body = {"value": str(value), "pwd": str(self.alarm_pin)}
                 # body= {"value":"OFF","pwd":"123456"}
             else:
                 Cmd = 'zoneCmd'
-                body = "{\"value\":\"" + str(value) + "\",\"pwd\":\"" + str(
-                    self.alarm_pin) + "\",\"zones\":\"[" + str(zone_id) + "]\"}"
+                body = {"value": str(value), "pwd": str(self.alarm_pin),
+                        "zones": "[" + str(zone_id) + "]"}
 
-            # str_request = self.cmd_prefix + "PUT /devices/{}/endpoints/{}/cdata?name={},".format(str(alarm_id),str(alarm_id),str(cmd)) + body +");"
-            str_request = self.cmd_prefix + "PUT /devices/{}/endpoints/{}/cdata?name={} HTTP/1.1\r\nContent-Length: ".format(str(device_id), str(
-                alarm_id), str(Cmd)) + str(len(body)) + "\r\nContent-Type: application/json; charset=UTF-8\r\nTransac-Id: 0\r\n\r\n" + body + "\r\n\r\n"
-
-            a_bytes = bytes(str_request, "ascii")
+            transac_id, future = self.requests.new_request(
+                'PUT /devices/{}/endpoints/{}/cdata?name={}'.format(device_id, alarm_id, Cmd))
+            a_bytes = self.frames.put_devices_cdata(
+                device_id, alarm_id, Cmd, body, transac_id)
             # print(a_bytes)
             print('Sending to tydom client.....', 'PUT cdata', body)
 
             await self.connection.send(a_bytes)
-            return 0
+            return future
         except Exception as e:
             print('put_alarm_cdata ERROR !')
             print(e)
@@ -257,7 +667,7 @@ class TydomWebSocketClient():
     async def get_info(self):
         msg_type = '/info'
         req = 'GET'
-        await self.send_message(method=req, msg=msg_type)
+        return await self.send_message(method=req, msg=msg_type)
 
     # Refresh (all)
     async def post_refresh(self):
@@ -265,62 +675,67 @@ class TydomWebSocketClient():
         # print("Refresh....")
         msg_type = '/refresh/all'
         req = 'POST'
-        await self.send_message(method=req, msg=msg_type)
+        return await self.send_message(method=req, msg=msg_type)
 
     # Get the moments (programs)
     async def get_moments(self):
         msg_type = '/moments/file'
         req = 'GET'
-        await self.send_message(method=req, msg=msg_type)
+        return await self.send_message(method=req, msg=msg_type)
 
     # Get the scenarios
     async def get_scenarii(self):
         msg_type = '/scenarios/file'
         req = 'GET'
-        await self.send_message(method=req, msg=msg_type)
+        return await self.send_message(method=req, msg=msg_type)
 
     # Get a ping (pong should be returned)
 
     async def get_ping(self):
         msg_type = '/ping'
         req = 'GET'
-        await self.send_message(method=req, msg=msg_type)
+        future = await self.send_message(method=req, msg=msg_type)
         print('****** ping !')
+        return future
 
     # Get all devices metadata
 
     async def get_devices_meta(self):
         msg_type = '/devices/meta'
         req = 'GET'
-        await self.send_message(method=req, msg=msg_type)
+        return await self.send_message(method=req, msg=msg_type)
 
     # Get all devices data
 
     async def get_devices_data(self):
         msg_type = '/devices/data'
         req = 'GET'
-        await self.send_message(method=req, msg=msg_type)
+        return await self.send_message(method=req, msg=msg_type)
 
     # List the device to get the endpoint id
 
     async def get_configs_file(self):
         msg_type = '/configs/file'
         req = 'GET'
-        await self.send_message(method=req, msg=msg_type)
+        return await self.send_message(method=req, msg=msg_type)
 
     async def get_data(self):
         await self.get_configs_file()
-        await asyncio.sleep(5)
+        # Devices data can only be mapped once the configuration is known,
+        # with a cached one it is checked for changes in the background
+        if not self.config_parsed.is_set():
+            try:
+                await asyncio.wait_for(self.config_parsed.wait(), timeout=self.config_timeout)
+            except asyncio.TimeoutError:
+                print('No configuration from the hub after',
+                      self.config_timeout, 's, requesting devices data anyway')
         await self.get_devices_data()
 
     # Give order to endpoint
     async def get_device_data(self, id):
         # 10 here is the endpoint = the device (shutter in this case) to open.
-        str_request = self.cmd_prefix + \
-            "GET /devices/{}/endpoints/{}/data HTTP/1.1\r\nContent-Length: 0\r\nContent-Type: application/json; charset=UTF-8\r\nTransac-Id: 0\r\n\r\n".format(
-                str(id), str(id))
-        a_bytes = bytes(str_request, "ascii")
-        await self.connection.send(a_bytes)
+        return await self.send_message(
+            method='GET', msg="/devices/{}/endpoints/{}/data".format(str(id), str(id)))
         # name = await self.recv()
         # parse_response(name)
 
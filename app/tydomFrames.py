@@ -0,0 +1,197 @@
+import json
+from json.encoder import encode_basestring_ascii
+
+# HTTP over websocket frames exchanged with the Tydom hub
+#
+# GET /devices/data HTTP/1.1\r\n
+# Content-Length: 0\r\n
+# Content-Type: application/json; charset=UTF-8\r\n
+# Transac-Id: 12\r\n
+# \r\n
+# [body\r\n\r\n]
+
+frame_content_type = b"\r\nContent-Type: application/json; charset=UTF-8\r\nTransac-Id: "
+frame_headers_end = b"\r\n\r\n"
+
+
+class TydomFrameBuilder():
+    '''
+        Builds the request frames sent to the hub straight to bytes.
+        Static part of the frame is cached per (method, path template), path
+        templates use %s placeholders (/devices/%s/endpoints/%s/data), and
+        per filled path for the endpoints we talk to.
+    '''
+
+    def __init__(self, cmd_prefix=''):
+        self.prefix = cmd_prefix.encode('ascii')
+        # (method, path template) -> b"<prefix>METHOD <template> HTTP/1.1\r\nContent-Length: "
+        self.heads = dict()
+        # (method, path template, path args) -> same, with the path filled
+        self.paths = dict()
+        # data names are a small set (position, level, setpoint...)
+        self.names = dict()
+
+    def head(self, method, template, args=()):
+        key = (method, template, args)
+        head = self.paths.get(key)
+        if head is None:
+            template_key = (method, template)
+            head = self.heads.get(template_key)
+            if head is None:
+                head = self.prefix + method.encode('ascii') + b' ' + \
+                    template.encode('ascii') + b' HTTP/1.1\r\nContent-Length: '
+                self.heads[template_key] = head
+            if len(args) > 0:
+                head = head % tuple(str(arg).encode('ascii') for arg in args)
+                self.paths[key] = head
+        return head
+
+    def request(self, method, template, transac_id, args=(), body=None):
+        head = self.head(method, template, args)
+        if body is None:
+            return b''.join((head, b'0', frame_content_type,
+                             transac_id.encode('ascii'), frame_headers_end))
+        return b''.join((head, str(len(body)).encode('ascii'), frame_content_type,
+                         transac_id.encode('ascii'), frame_headers_end, body,
+                         frame_headers_end))
+
+    # PUT /devices/{device}/endpoints/{endpoint}/data, several (name, value)
+    # can go in the same body
+    def put_devices_data(self, device_id, endpoint_id, items, transac_id):
+        if len(items) == 1:
+            name, value = items[0]
+            body = b'[{"name":' + self.encode_name(name) + \
+                b',"value":' + encode_value(value) + b'}]'
+        else:
+            body = b'[' + b','.join([b'{"name":' + self.encode_name(name) + b',"value":' + encode_value(value) + b'}'
+                                     for name, value in items]) + b']'
+        return self.request('PUT', '/devices/%s/endpoints/%s/data', transac_id,
+                            args=(device_id, endpoint_id), body=body)
+
+    def put_devices_cdata(self, device_id, endpoint_id, cmd, data, transac_id):
+        return self.request('PUT', '/devices/%s/endpoints/%s/cdata?name=%s', transac_id,
+                            args=(device_id, endpoint_id, cmd), body=encode_body(data))
+
+    def encode_name(self, name):
+        encoded = self.names.get(name)
+        if encoded is None:
+            encoded = self.names[name] = encode_value(name)
+        return encoded
+
+
+# Values are sent as json strings, like the Tydom app does
+def encode_value(value):
+    if isinstance(value, str):
+        return encode_basestring_ascii(value).encode('ascii')
+    return encode_body(value)
+
+
+def encode_body(data):
+    return json.dumps(data, separators=(',', ':')).encode('ascii')
+
+
+class TydomFrame():
+    '''
+        Request (PUT /devices/data pushed by the hub) or response frame.
+        Header names are lower case, body is the dechunked payload.
+        received_at is when the frame was read from the hub (monotonic).
+    '''
+    __slots__ = ('method', 'uri', 'status', 'reason', 'headers', 'body', 'received_at')
+
+    def __init__(self, method, uri, status, reason, headers, body, received_at=None):
+        self.method = method
+        self.uri = uri
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+        self.received_at = received_at
+
+    @property
+    def transac_id(self):
+        return self.headers.get('transac-id')
+
+    @property
+    def uri_origin(self):
+        return self.headers.get('uri-origin')
+
+
+def parse_frame(frame):
+    '''
+        Single pass parser of the hub HTTP over websocket framing, remote
+        frames start with \x02. Only the headers are decoded, chunks are
+        sliced through a memoryview and joined once.
+    '''
+    start = 1 if frame[:1] == b'\x02' else 0
+    end = frame.find(frame_headers_end, start)
+    if end < 0:
+        end = len(frame)
+    lines = frame[start:end].decode('latin-1').split('\r\n')
+
+    method = uri = status = reason = None
+    first = lines[0].split(' ', 2)
+    if first[0].startswith('HTTP/'):
+        status = int(first[1]) if len(first) > 1 and first[1].isdigit() else None
+        reason = first[2] if len(first) > 2 else ''
+    else:
+        method = first[0]
+        uri = first[1] if len(first) > 1 else None
+
+    headers = dict()
+    for line in lines[1:]:
+        name, sep, value = line.partition(':')
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+
+    body_start = end + 4
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        body = dechunk(frame, body_start)
+    elif 'content-length' in headers:
+        body = frame[body_start:body_start + int(headers['content-length'])]
+    else:
+        body = frame[body_start:]
+    return TydomFrame(method, uri, status, reason, headers, body)
+
+
+def dechunk(frame, position):
+    view = memoryview(frame)
+    chunks = []
+    length = len(frame)
+    while position < length:
+        line_end = frame.find(b'\r\n', position)
+        if line_end < 0:
+            break
+        try:
+            size = int(frame[position:line_end].split(b';', 1)[0], 16)
+        except ValueError:
+            # Not a chunk size, the hub sometimes ends a frame oddly
+            break
+        if size == 0:
+            break
+        position = line_end + 2
+        chunks.append(view[position:position + size])
+        position += size + 2
+    if len(chunks) == 1:
+        return chunks[0].tobytes()
+    return b''.join(chunks)
+
+
+# Transac-Id header of a hub frame, None if there is none
+def get_transac_id(frame):
+    end = frame.find(b'\r\n\r\n')
+    for line in frame[:end].split(b'\r\n'):
+        if line[:11].lower() == b'transac-id:':
+            return line[11:].strip().decode("ascii")
+    return None
+
+
+# Handled before the other frames : command acknowledgements (responses
+# with a /devices/<id>/endpoints/<id>/... Uri-Origin) and alarm pushes
+def is_priority(frame):
+    end = frame.find(frame_headers_end)
+    if end < 0:
+        end = len(frame)
+    start = 1 if frame[:1] == b'\x02' else 0
+    if frame[start:start + 5] == b'HTTP/':
+        return frame.find(b'/endpoints/', start, end) >= 0
+    return frame.find(b'"alarm', end) >= 0
@@ -4,14 +4,16 @@ from boiler import Boiler
 from alarm_control_panel import Alarm
 from sensors import sensor
 from switch import Switch
+from tydomFrames import parse_frame
+from tydomConfigCache import config_hash
+import json_codec
 
 
 from http.server import BaseHTTPRequestHandler
-from http.client import HTTPResponse
-import urllib3
-from io import BytesIO
+import asyncio
 import json
 import sys
+import time
 import logging
 
 _LOGGER = logging.getLogger(__name__)
@@ -183,108 +185,421 @@ device_conso_unit_of_measurement = {
     'energyTotIndexWatt': 'Wh'}
 device_conso_keywords = device_conso_classes.keys()
 
-# Device dict for parsing
+
+# Entity factories, called with the handler and the attributes gathered
+# for one endpoint. Entities are created once and kept by the handler,
+# later frames only update them.
+def get_entity(handler, key, attributes, create):
+    entity = handler.entities.get(key)
+    if entity is None:
+        entity = handler.entities[key] = create()
+    else:
+        entity.apply(attributes)
+    return entity
+
+
+async def publish_cover(handler, attributes):
+    await get_entity(handler, ('cover', attributes['id']), attributes, lambda: Cover(
+        tydom_attributes=attributes,
+        mqtt=handler.mqtt_client,
+        namespace=handler.namespace,
+        states=handler.tydom_client.states)).update()
+
+
+async def publish_light(handler, attributes):
+    await get_entity(handler, ('light', attributes['id']), attributes, lambda: Light(
+        tydom_attributes=attributes,
+        mqtt=handler.mqtt_client,
+        namespace=handler.namespace,
+        states=handler.tydom_client.states)).update()
+
+
+async def publish_switch(handler, attributes):
+    await get_entity(handler, ('switch', attributes['id']), attributes, lambda: Switch(
+        tydom_attributes=attributes,
+        mqtt=handler.mqtt_client,
+        namespace=handler.namespace,
+        states=handler.tydom_client.states)).update()
+
+
+async def publish_boiler(handler, attributes):
+    await get_entity(handler, ('boiler', attributes['id']), attributes, lambda: Boiler(
+        tydom_attributes=attributes,
+        tydom_client=handler.tydom_client,
+        mqtt=handler.mqtt_client,
+        namespace=handler.namespace)).update()
+
+
+async def publish_sensor(handler, attributes):
+    element_name = attributes['element_name']
+    await get_entity(handler, ('sensor', attributes['id'], element_name), attributes, lambda: sensor(
+        elem_name=element_name,
+        tydom_attributes_payload=attributes,
+        attributes_topic_from_device='useless',
+        mqtt=handler.mqtt_client,
+        namespace=handler.namespace)).update()
+
+
+async def publish_conso(handler, attributes):
+    element_name = attributes['element_name']
+    if element_name in device_conso_classes:
+        attributes['device_class'] = device_conso_classes[element_name]
+    if element_name in device_conso_unit_of_measurement:
+        attributes['unit_of_measurement'] = device_conso_unit_of_measurement[element_name]
+    await publish_sensor(handler, attributes)
+
+
+async def publish_alarm(handler, attributes):
+    state = None
+    sos_state = False
+    try:
+        # {
+        # "name": "alarmState",
+        # "type": "string",
+        # "permission": "r",
+        # "enum_values": ["OFF", "DELAYED", "ON", "QUIET"]
+        # },
+        # {
+        # "name": "alarmMode",
+        # "type": "string",
+        # "permission": "r",
+        # "enum_values": ["OFF", "ON", "TEST", "ZONE", "MAINTENANCE"]
+        # }
+        alarm_state = attributes.get('alarmState')
+        alarm_mode = attributes.get('alarmMode')
+        if alarm_state == "ON" or alarm_state == "QUIET":
+            state = "triggered"
+        elif alarm_state == "DELAYED":
+            state = "pending"
+
+        if attributes.get('alarmSOS') == "true":
+            state = "triggered"
+            sos_state = True
+        elif alarm_mode == "ON":
+            state = "armed_away"
+        elif alarm_mode == "ZONE":
+            state = "armed_home"
+        elif alarm_mode == "OFF" or alarm_mode == "MAINTENANCE":
+            state = "disarmed"
+
+        if (sos_state):
+            print("SOS !")
+
+        if not (state is None):
+            key = ('alarm', attributes['id'])
+            alarm = handler.entities.get(key)
+            if alarm is None:
+                alarm = handler.entities[key] = Alarm(
+                    current_state=state,
+                    alarm_pin=handler.tydom_client.alarm_pin,
+                    tydom_attributes=attributes,
+                    mqtt=handler.mqtt_client,
+                    namespace=handler.namespace,
+                    states=handler.tydom_client.states)
+            else:
+                alarm.apply(attributes, state)
+            await alarm.update()
+
+    except Exception as e:
+        print("Error in alarm parsing !")
+        print(e)
+
+
+class DeviceType():
+    '''
+        What we do with one kind of endpoint (last_usage in the hub
+        configuration) : type kept in device_type, data names to keep, and
+        the entity published from them. Sensor types remember the data name
+        (element_name) they are built from, per element types publish one
+        of them per data name.
+    '''
+
+    def __init__(self, device_type, keywords, factory, entity_type,
+                 name_key=None, name=None, sensor=False, per_element=False):
+        self.device_type = device_type
+        self.keywords = frozenset(keywords)
+        self.factory = factory
+        self.entity_type = entity_type
+        # Attribute holding the entity name (cover_name...), if any
+        self.name_key = name_key
+        # Fixed name, instead of the one from the configuration
+        self.name = name
+        self.sensor = sensor
+        self.per_element = per_element
+
+    def attributes(self, device_id, endpoint_id, print_id):
+        name = self.name if self.name is not None else print_id
+        attributes = {
+            'device_id': device_id,
+            'endpoint_id': endpoint_id,
+            'id': str(device_id) + '_' + str(endpoint_id),
+            'name': name,
+            'device_type': self.entity_type}
+        if self.name_key is not None:
+            attributes[self.name_key] = name
+        return attributes
+
+
+def cover_type(usage):
+    return DeviceType(usage, deviceCoverKeywords, publish_cover, 'cover',
+                      name_key='cover_name')
+
+
+def opening_type(usage):
+    return DeviceType(usage, deviceDoorKeywords, publish_sensor, 'sensor',
+                      name_key='door_name', sensor=True)
+
+
+def switch_type(usage):
+    return DeviceType(usage, deviceSwitchKeywords, publish_switch, 'switch',
+                      name_key='switch_name')
+
+
+boiler_type = DeviceType('boiler', deviceBoilerKeywords, publish_boiler,
+                         'climate')
+
+# last_usage -> DeviceType, a new kind of device only needs an entry here
+device_types = {
+    'shutter': cover_type('shutter'),
+    'klineShutter': cover_type('klineShutter'),
+    'light': DeviceType('light', deviceLightKeywords, publish_light, 'light',
+                        name_key='light_name'),
+    'window': opening_type('window'),
+    'windowFrench': opening_type('windowFrench'),
+    'klineWindowFrench': opening_type('klineWindowFrench'),
+    'klineWindowSliding': opening_type('klineWindowSliding'),
+    'belmDoor': opening_type('belmDoor'),
+    'klineDoor': opening_type('klineDoor'),
+    'garage_door': switch_type('garage_door'),
+    'gate': switch_type('gate'),
+    'boiler': boiler_type,
+    'electric': boiler_type,
+    'conso': DeviceType('conso', device_conso_keywords, publish_conso,
+                        'sensor', sensor=True, per_element=True),
+    'alarm': DeviceType('alarm', deviceAlarmKeywords, publish_alarm,
+                        'alarm_control_panel', name_key='alarm_name',
+                        name="Tyxal Alarm"),
+}
+
+# Device dict for parsing, one dict per hub namespace
 device_name = dict()
 device_endpoint = dict()
 device_type = dict()
 # Thanks @Max013 !
 
 
+# Warm start from the configuration cached by the last run
+def load_cached_config(tydom_client):
+    registry = tydom_client.config_cache.load()
+    if registry is None:
+        return False
+    device_name.setdefault(tydom_client.namespace, dict()).update(
+        registry['device_name'])
+    device_endpoint.setdefault(tydom_client.namespace, dict()).update(
+        registry['device_endpoint'])
+    device_type.setdefault(tydom_client.namespace, dict()).update(
+        registry['device_type'])
+    tydom_client.config_parsed.set()
+    print('Configuration loaded from cache :',
+          len(registry['device_type']), 'devices')
+    return True
+
+
+# Frame kinds, from the request line of the frames pushed by the hub...
+request_routes = {
+    ('PUT', '/devices/data'): 'devices_data',
+    ('PUT', '/devices/cdata'): 'cdata',
+}
+# ...and from the Uri-Origin of the responses
+origin_routes = {
+    '/refresh/all': 'refresh',
+    '/configs/file': 'config',
+    '/devices/data': 'data',
+    '/info': 'info',
+    '/scenarios/file': 'scenarios',
+}
+frame_kinds = ('refresh', 'devices_data', 'cdata', 'post', 'config', 'data',
+               'info', 'scenarios', 'html', 'response', 'unknown')
+
+
 class TydomMessageHandler():
+    '''
+        One per hub, lives as long as the process. Frames are parsed once,
+        routed by kind to the handler registered for it, and counted.
+    '''
 
-    def __init__(self, incoming_bytes, tydom_client, mqtt_client):
-        # print('New tydom incoming message')
-        self.incoming_bytes = incoming_bytes
+    def __init__(self, tydom_client, mqtt_client):
         self.tydom_client = tydom_client
-        self.cmd_prefix = tydom_client.cmd_prefix
         self.mqtt_client = mqtt_client
-
-    async def incomingTriage(self):
-        bytes_str = self.incoming_bytes
+        self.namespace = tydom_client.namespace
+        self.device_name = device_name.setdefault(self.namespace, dict())
+        self.device_endpoint = device_endpoint.setdefault(
+            self.namespace, dict())
+        self.device_type = device_type.setdefault(self.namespace, dict())
+        # (kind, id[, data name]) -> entity published for it
+        self.entities = dict()
+
+        self.routes = dict()
+        self.register('refresh', self.on_refresh)
+        self.register('devices_data', self.on_push)
+        self.register('cdata', self.on_push)
+        self.register('post', self.on_push)
+        self.register('config', self.on_config)
+        self.register('data', self.on_data)
+        self.register('info', self.on_info)
+        self.register('scenarios', self.on_scenarios)
+        self.register('html', self.on_html)
+        self.register('response', self.on_response)
+        self.register('unknown', self.on_unknown)
+
+        # Frames per kind, published under tydom2mqtt/metrics/
+        self.counters = dict.fromkeys(frame_kinds, 0)
+        self.counters['errors'] = 0
+        self.metrics_interval = 60
+        self.metrics_at = time.monotonic() + self.metrics_interval
+
+    def register(self, kind, handler):
+        self.routes[kind] = handler
+
+    def get_kind(self, frame):
+        if frame.status is None:
+            path = frame.uri.split('?', 1)[0] if frame.uri else None
+            kind = request_routes.get((frame.method, path))
+            if kind is None:
+                kind = 'post' if frame.method == 'POST' else 'unknown'
+            return kind
+        if 'html' in frame.headers.get('content-type', ''):
+            return 'html'
+        return origin_routes.get(frame.uri_origin, 'response')
+
+    # received_at is when the frame was read from the hub (monotonic)
+    async def incomingTriage(self, bytes_str, received_at=None):
         # If not MQTT client, return incoming message to use it with anything.
         if self.mqtt_client is None:
             return bytes_str
-        else:
-            incoming = None
-            first = str(bytes_str[:40])  # Scanning 1st characters
-            try:
-                if ("Uri-Origin: /refresh/all" in first in first):
-                    pass
-                elif ("PUT /devices/data" in first) or ("/devices/cdata" in first):
-                    # print('PUT /devices/data message detected !')
-                    try:
-                        incoming = self.parse_put_response(bytes_str)
-                        await self.parse_response(incoming)
-                    except BaseException:
-                        print(">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>")
-                        print('RAW INCOMING :')
-                        print(bytes_str)
-                        print('END RAW')
-                        print(">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>")
-                elif ("scn" in first):
-                    try:
-                        incoming = get(bytes_str)
-                        await self.parse_response(incoming)
-                        print('Scenarii message processed !')
-                        print("##################################")
-                    except BaseException:
-                        print(">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>")
-                        print('RAW INCOMING :')
-                        print(bytes_str)
-                        print('END RAW')
-                        print(">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>")
-                elif ("POST" in first):
-                    try:
-                        incoming = self.parse_put_response(bytes_str)
-                        await self.parse_response(incoming)
-                        print('POST message processed !')
-                    except BaseException:
-                        print(">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>")
-                        print('RAW INCOMING :')
-                        print(bytes_str)
-                        print('END RAW')
-                        print(">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>")
-                elif ("HTTP/1.1" in first):  # (bytes_str != 0) and
-                    response = self.response_from_bytes(
-                        bytes_str[len(self.cmd_prefix):])
-                    incoming = response.data.decode("utf-8")
-                    try:
-                        await self.parse_response(incoming)
-                    except BaseException:
-                        print(">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>")
-                        print('RAW INCOMING :')
-                        print(bytes_str)
-                        print('END RAW')
-                        print(">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>")
-                else:
-                    print("Didn't detect incoming type, here it is :")
-                    print(">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>")
-                    print('RAW INCOMING :')
-                    print(bytes_str)
-                    print('END RAW')
-                    print(">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>")
 
-            except Exception as e:
-                print("!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!")
-                print('receiveMessage error')
-                print('RAW :')
-                print(bytes_str)
-                print("Incoming payload :")
-                print(incoming)
-                print("Error :")
-                print(e)
-                print('Exiting to ensure systemd restart....')
-                sys.exit()  # Exit all to ensure systemd restart
+        try:
+            frame = parse_frame(bytes_str)
+            frame.received_at = received_at
+            kind = self.get_kind(frame)
+        except Exception as e:
+            print("Cannot parse frame :", e)
+            frame = None
+            kind = 'unknown'
+        self.counters[kind] += 1
+
+        try:
+            await self.routes[kind](frame, bytes_str)
+        except Exception as e:
+            self.counters['errors'] += 1
+            print("!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!")
+            print('receiveMessage error')
+            print('RAW :')
+            print(bytes_str)
+            print("Error :")
+            print(e)
+            print('Exiting to ensure systemd restart....')
+            sys.exit()  # Exit all to ensure systemd restart
+
+        if time.monotonic() > self.metrics_at:
+            self.metrics_at = time.monotonic() + self.metrics_interval
+            self.mqtt_client.publish_metrics(
+                'frames_' + self.namespace, self.counters)
+
+    def print_raw(self, bytes_str):
+        print(">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>")
+        print('RAW INCOMING :')
+        print(bytes_str)
+        print('END RAW')
+        print(">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>")
+
+    async def on_refresh(self, frame, bytes_str):
+        self.resolve_request(frame, '')
+
+    # PUT /devices/data, PUT /devices/cdata and POST pushed by the hub
+    async def on_push(self, frame, bytes_str):
+        try:
+            if b'id_catalog' in frame.body:
+                # Pushed configuration, streamed from its raw body like the
+                # /configs/file responses
+                print('Incoming message type : config detected')
+                await self.parse_config_data(frame.body)
+            else:
+                await self.parse_response(self.parse_put_response(frame), frame.body,
+                                          frame.received_at)
+            if frame.method == 'POST':
+                print('POST message processed !')
+        except BaseException:
+            self.print_raw(bytes_str)
+
+    # /configs/file and /devices/data responses can be large, they are
+    # decoded one endpoint (or device) at a time and their requests resolved
+    # with the raw body, never decoded as a whole
+    async def on_config(self, frame, bytes_str):
+        try:
+            print(">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>")
+            print('Incoming message type : config detected')
+            await self.parse_config_data(frame.body)
+        except BaseException:
+            self.print_raw(bytes_str)
+        finally:
+            self.resolve_request(frame, frame.body)
+
+    async def on_data(self, frame, bytes_str):
+        try:
+            print(">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>")
+            print('Incoming message type : data detected')
+            await self.parse_devices_data(json_codec.iter_items(frame.body), frame.received_at)
+            # Every entity of the hub had its chance to publish its config
+            self.mqtt_client.report_orphans(self.namespace, self.known_ids())
+        except BaseException:
+            self.print_raw(bytes_str)
+        finally:
+            self.resolve_request(frame, frame.body)
+
+    async def on_info(self, frame, bytes_str):
+        print(">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>")
+        print('Incoming message type : Info detected')
+        self.resolve_request(frame, frame.body.decode("utf-8"))
+
+    async def on_scenarios(self, frame, bytes_str):
+        self.resolve_request(frame, frame.body.decode("utf-8"))
+        print('Scenarii message processed !')
+        print("##################################")
+
+    async def on_html(self, frame, bytes_str):
+        incoming = frame.body.decode("utf-8", "replace")
+        print('Incoming message type : html detected (probable 404)')
+        print(incoming)
+        self.resolve_request(frame, incoming)
+
+    async def on_response(self, frame, bytes_str):
+        incoming = frame.body.decode("utf-8")
+        try:
+            await self.parse_response(incoming)
+        except BaseException:
+            self.print_raw(bytes_str)
+        finally:
+            self.resolve_request(frame, incoming)
+
+    async def on_unknown(self, frame, bytes_str):
+        print("Didn't detect incoming type, here it is :")
+        self.print_raw(bytes_str)
 
     # Basic response parsing. Typically GET responses + instanciate covers and
-    # alarm class for updating data
-    async def parse_response(self, incoming):
+    # alarm class for updating data. Pushed frames come already decoded,
+    # with their raw body and the time they were read.
+    async def parse_response(self, incoming, body=None, received_at=None):
         data = incoming
         msg_type = None
-
-        first = str(data[:40])
-        # Detect type of incoming data
-        if (data != ''):
+        parsed = None
+
+        if isinstance(data, (list, dict)):
+            parsed = data
+            msg_type = self.get_msg_type(parsed)
+        elif (data != ''):
+            first = str(data[:40])
+            # Detect type of incoming data
             # search for id_catalog in all data to be sure to get configuration
             # detected
             if ("id_catalog" in data):
@@ -307,93 +622,110 @@ class TydomMessageHandler():
             else:
                 print('Incoming message type : no type detected')
                 print(data)
+        else:
+            return
 
-            if not (msg_type is None):
-                try:
-                    if (msg_type == 'msg_config'):
-                        parsed = json.loads(data)
-                        # print(parsed)
-                        await self.parse_config_data(parsed=parsed)
-
-                    elif (msg_type == 'msg_data'):
-                        parsed = json.loads(data)
-                        # print(parsed)
-                        await self.parse_devices_data(parsed=parsed)
-                    elif (msg_type == 'msg_html'):
-                        print("HTML Response ?")
-                    elif (msg_type == 'msg_info'):
-                        pass
-                    else:
-                        # Default json dump
-                        print()
-                        print(
-                            json.dumps(
-                                parsed,
-                                sort_keys=True,
-                                indent=4,
-                                separators=(
-                                    ',',
-                                    ': ')))
-                except Exception as e:
-                    print('Cannot parse response !')
-                    # print('Response :')
-                    # print(data)
-                    if (e != 'Expecting value: line 1 column 1 (char 0)'):
-                        print("Error : ", e)
-                        print(parsed)
-            print('Incoming data parsed successfully !')
-            return(0)
-
-    async def parse_config_data(self, parsed):
-        for i in parsed["endpoints"]:
+        if not (msg_type is None):
+            try:
+                if (msg_type == 'msg_config'):
+                    if body is None:
+                        body = data.encode('utf-8')
+                    await self.parse_config_data(body)
+
+                elif (msg_type == 'msg_data'):
+                    if parsed is None:
+                        parsed = json_codec.loads(data)
+                    # print(parsed)
+                    await self.parse_devices_data(parsed=parsed, received_at=received_at)
+                elif (msg_type == 'msg_html'):
+                    print("HTML Response ?")
+                elif (msg_type == 'msg_info'):
+                    pass
+                else:
+                    # Default json dump
+                    print()
+                    print(
+                        json.dumps(
+                            parsed,
+                            sort_keys=True,
+                            indent=4,
+                            separators=(
+                                ',',
+                                ': ')))
+            except Exception as e:
+                print('Cannot parse response !')
+                # print('Response :')
+                # print(data)
+                if (e != 'Expecting value: line 1 column 1 (char 0)'):
+                    print("Error : ", e)
+                    print(parsed)
+        print('Incoming data parsed successfully !')
+        return(0)
+
+    # Same types as parse_response, from the decoded payload
+    def get_msg_type(self, parsed):
+        if isinstance(parsed, list):
+            print(">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>")
+            print('Incoming message type : data detected')
+            return 'msg_data'
+        if isinstance(parsed, dict) and 'endpoints' in parsed:
+            print(">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>")
+            print('Incoming message type : config detected')
+            return 'msg_config'
+        if isinstance(parsed, dict) and 'productName' in parsed:
+            print(">>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>")
+            print('Incoming message type : Info detected')
+            return 'msg_info'
+        print('Incoming message type : no type detected')
+        print(parsed)
+        return None
+
+    async def parse_config_data(self, payload):
+        new_hash = config_hash(payload)
+        config_cache = self.tydom_client.config_cache
+        if new_hash == config_cache.hash:
+            print('Configuration unchanged')
+            self.tydom_client.config_parsed.set()
+            return
+        known = self.tydom_client.config_parsed.is_set()
+
+        for count, i in enumerate(json_codec.iter_items(payload, 'endpoints'), 1):
+            if count % 20 == 0:
+                # Let the other tasks run during a large configuration
+                await asyncio.sleep(0)
             # Get list of shutter
             # print(i)
             device_unique_id = str(i["id_endpoint"]) + \
                 "_" + str(i["id_device"])
 
-            if i["last_usage"] == 'shutter' or i["last_usage"] == 'klineShutter' or i["last_usage"] == 'light' or i["last_usage"] == 'window' or i["last_usage"] == 'windowFrench' or i["last_usage"] == 'belmDoor' or i[
-                    "last_usage"] == 'klineDoor' or i["last_usage"] == 'klineWindowFrench' or i["last_usage"] == 'klineWindowSliding' or i["last_usage"] == 'garage_door' or i["last_usage"] == 'gate':
-
-                # print('{} {}'.format(i["id_endpoint"],i["name"]))
-                # device_name[i["id_endpoint"]] = i["name"]
-                device_name[device_unique_id] = i["name"]
-                device_type[device_unique_id] = i["last_usage"]
-                device_endpoint[device_unique_id] = i["id_endpoint"]
-
-            if i["last_usage"] == 'boiler' or i["last_usage"] == 'conso':
-                # print('{} {}'.format(i["id_endpoint"],i["name"]))
-                device_name[device_unique_id] = i["name"]
-                device_type[device_unique_id] = i["last_usage"]
-                device_endpoint[device_unique_id] = i["id_endpoint"]
-
-            if i["last_usage"] == 'alarm':
-                # print('{} {}'.format(i["id_endpoint"], i["name"]))
-                device_name[device_unique_id] = "Tyxal Alarm"
-                device_type[device_unique_id] = 'alarm'
-                device_endpoint[device_unique_id] = i["id_endpoint"]
-
-            if i["last_usage"] == 'electric':
-                device_name[device_unique_id] = i["name"]
-                device_type[device_unique_id] = 'boiler'
-                device_endpoint[device_unique_id] = i["id_endpoint"]
+            descriptor = device_types.get(i["last_usage"])
+            if descriptor is not None:
+                self.device_name[device_unique_id] = descriptor.name or i["name"]
+                self.device_type[device_unique_id] = descriptor.device_type
+                self.device_endpoint[device_unique_id] = i["id_endpoint"]
 
         print('Configuration updated')
-
-    async def parse_devices_data(self, parsed):
-        for i in parsed:
+        config_cache.save(new_hash, {
+            'device_name': self.device_name,
+            'device_endpoint': self.device_endpoint,
+            'device_type': self.device_type})
+        self.tydom_client.config_parsed.set()
+        if known:
+            # Cached configuration was outdated, map everything again
+            await self.tydom_client.get_devices_data()
+
+    # parsed is any iterable of devices, decoded on the fly or not. Values a
+    # frame read after received_at already set are left alone.
+    async def parse_devices_data(self, parsed, received_at=None):
+        states = self.tydom_client.states
+        for count, i in enumerate(parsed, 1):
+            if count % 20 == 0:
+                # Let the other tasks run during a large frame
+                await asyncio.sleep(0)
             for endpoint in i["endpoints"]:
                 if endpoint["error"] == 0 and len(endpoint["data"]) > 0:
+                    attributes = None
                     try:
-                        attr_alarm = {}
-                        attr_alarm_details = {}
-                        attr_cover = {}
-                        attr_cover_details = {}
-                        attr_door = {}
-                        attr_window = {}
-                        attr_light = {}
-                        attr_gate = {}
-                        attr_boiler = {}
-                        attr_light_details = {}
                         device_id = i["id"]
                         endpoint_id = endpoint["id"]
                         unique_id = str(endpoint_id) + "_" + str(device_id)
@@ -407,275 +739,86 @@ class TydomMessageHandler():
                         _LOGGER.debug("Type {}".format(type_of_id))
                         _LOGGER.debug("==========================")
 
+                        descriptor = device_types.get(type_of_id)
+                        if descriptor is None:
+                            continue
+                        if len(name_of_id) != 0:
+                            print_id = name_of_id
+                        else:
+                            print_id = device_id
+                        keywords = descriptor.keywords
+                        changed = False
+
                         for elem in endpoint["data"]:
                             _LOGGER.debug("CURRENT ELEM={}".format(elem))
-                            # endpoint_id = None
-
-                            # Element name
                             elementName = elem["name"]
-                            # Element value
-                            elementValue = elem["value"]
-                            elementValidity = elem["validity"]
-                            print_id = None
-                            if len(name_of_id) != 0:
-                                print_id = name_of_id
-                            #    endpoint_id = device_endpoint[device_id]
+                            if not states.newer(device_id, endpoint_id, elementName, received_at):
+                                continue
+                            element_changed = states.set(
+                                device_id, endpoint_id, elementName, elem["value"], elem["validity"],
+                                received_at)
+                            if elementName not in keywords or elem["validity"] != 'upToDate':
+                                continue
+
+                            if attributes is None:
+                                attributes = descriptor.attributes(
+                                    device_id, endpoint_id, print_id)
+                            attributes[elementName] = elem["value"]
+                            if descriptor.sensor:
+                                attributes['element_name'] = elementName
+                            if descriptor.per_element:
+                                key = (device_id, endpoint_id, elementName)
+                                if element_changed or states.due(key):
+                                    await descriptor.factory(self, attributes)
+                                    states.mark(key)
+                                attributes = None
                             else:
-                                print_id = device_id
-                            #    endpoint_id = device_endpoint[device_id]
-
-                            if type_of_id == 'light':
-                                if elementName in deviceLightKeywords and elementValidity == 'upToDate':  # NEW METHOD
-                                    attr_light['device_id'] = device_id
-                                    attr_light['endpoint_id'] = endpoint_id
-                                    attr_light['id'] = str(
-                                        device_id) + '_' + str(endpoint_id)
-                                    attr_light['light_name'] = print_id
-                                    attr_light['name'] = print_id
-                                    attr_light['device_type'] = 'light'
-                                    attr_light[elementName] = elementValue
-
-                            if type_of_id == 'shutter' or type_of_id == 'klineShutter':
-                                if elementName in deviceCoverKeywords and elementValidity == 'upToDate':  # NEW METHOD
-                                    attr_cover['device_id'] = device_id
-                                    attr_cover['endpoint_id'] = endpoint_id
-                                    attr_cover['id'] = str(
-                                        device_id) + '_' + str(endpoint_id)
-                                    attr_cover['cover_name'] = print_id
-                                    attr_cover['name'] = print_id
-                                    attr_cover['device_type'] = 'cover'
-                                    attr_cover[elementName] = elementValue
-
-                            if type_of_id == 'belmDoor' or type_of_id == 'klineDoor':
-                                if elementName in deviceDoorKeywords and elementValidity == 'upToDate':  # NEW METHOD
-                                    attr_door['device_id'] = device_id
-                                    attr_door['endpoint_id'] = endpoint_id
-                                    attr_door['id'] = str(
-                                        device_id) + '_' + str(endpoint_id)
-                                    attr_door['door_name'] = print_id
-                                    attr_door['name'] = print_id
-                                    attr_door['device_type'] = 'sensor'
-                                    attr_door['element_name'] = elementName
-                                    attr_door[elementName] = elementValue
-
-                            if type_of_id == 'windowFrench' or type_of_id == 'window' or type_of_id == 'klineWindowFrench' or type_of_id == 'klineWindowSliding':
-                                if elementName in deviceDoorKeywords and elementValidity == 'upToDate':  # NEW METHOD
-                                    attr_window['device_id'] = device_id
-                                    attr_window['endpoint_id'] = endpoint_id
-                                    attr_window['id'] = str(
-                                        device_id) + '_' + str(endpoint_id)
-                                    attr_window['door_name'] = print_id
-                                    attr_window['name'] = print_id
-                                    attr_window['device_type'] = 'sensor'
-                                    attr_window['element_name'] = elementName
-                                    attr_window[elementName] = elementValue
-
-                            if type_of_id == 'boiler':
-                                if elementName in deviceBoilerKeywords and elementValidity == 'upToDate':  # NEW METHOD
-                                    attr_boiler['device_id'] = device_id
-                                    attr_boiler['endpoint_id'] = endpoint_id
-                                    attr_boiler['id'] = str(
-                                        device_id) + '_' + str(endpoint_id)
-                                    # attr_boiler['boiler_name'] = print_id
-                                    attr_boiler['name'] = print_id
-                                    attr_boiler['device_type'] = 'climate'
-                                    attr_boiler[elementName] = elementValue
-
-                            if type_of_id == 'alarm':
-                                if elementName in deviceAlarmKeywords and elementValidity == 'upToDate':
-                                    attr_alarm['device_id'] = device_id
-                                    attr_alarm['endpoint_id'] = endpoint_id
-                                    attr_alarm['id'] = str(
-                                        device_id) + '_' + str(endpoint_id)
-                                    attr_alarm['alarm_name'] = "Tyxal Alarm"
-                                    attr_alarm['name'] = "Tyxal Alarm"
-                                    attr_alarm['device_type'] = 'alarm_control_panel'
-                                    attr_alarm[elementName] = elementValue
-
-                            if type_of_id == 'garage_door' or type_of_id == 'gate':
-                                if elementName in deviceSwitchKeywords and elementValidity == 'upToDate':  # NEW METHOD
-                                    attr_gate['device_id'] = device_id
-                                    attr_gate['endpoint_id'] = endpoint_id
-                                    attr_gate['id'] = str(
-                                        device_id) + '_' + str(endpoint_id)
-                                    attr_gate['switch_name'] = print_id
-                                    attr_gate['name'] = print_id
-                                    attr_gate['device_type'] = 'switch'
-                                    attr_gate[elementName] = elementValue
-
-                            if type_of_id == 'conso':
-                                if elementName in device_conso_keywords and elementValidity == "upToDate":
-                                    attr_conso = {
-                                        'device_id': device_id,
-                                        'endpoint_id': endpoint_id,
-                                        'id': str(device_id) + '_' + str(endpoint_id),
-                                        'name': print_id,
-                                        'device_type': 'sensor',
-                                        elementName: elementValue}
-
-                                    if elementName in device_conso_classes:
-                                        attr_conso['device_class'] = device_conso_classes[elementName]
-
-                                    if elementName in device_conso_unit_of_measurement:
-                                        attr_conso['unit_of_measurement'] = device_conso_unit_of_measurement[elementName]
-
-                                    new_conso = sensor(
-                                        elem_name=elementName,
-                                        tydom_attributes_payload=attr_conso,
-                                        attributes_topic_from_device='useless',
-                                        mqtt=self.mqtt_client)
-                                    await new_conso.update()
+                                changed = changed or element_changed
 
                     except Exception as e:
                         print('msg_data error in parsing !')
                         print(e)
 
-                    if 'device_type' in attr_cover and attr_cover['device_type'] == 'cover':
-                        # print(attr_cover)
-                        new_cover = "cover_tydom_" + str(device_id)
-                        new_cover = Cover(
-                            tydom_attributes=attr_cover,
-                            mqtt=self.mqtt_client)  # NEW METHOD
-                        # new_cover = Cover(id=endpoint_id,name=print_id, current_position=elementValue, attributes=i, mqtt=self.mqtt_client)
-                        await new_cover.update()
-                    elif 'device_type' in attr_door and attr_door['device_type'] == 'sensor':
-                        # print(attr_cover)
-                        new_door = "door_tydom_" + str(device_id)
-                        new_door = sensor(
-                            elem_name=attr_door['element_name'],
-                            tydom_attributes_payload=attr_door,
-                            attributes_topic_from_device='useless',
-                            mqtt=self.mqtt_client)
-                        # new_cover = Cover(id=endpoint_id,name=print_id, current_position=elementValue, attributes=i, mqtt=self.mqtt_client)
-                        await new_door.update()
-                    elif 'device_type' in attr_window and attr_window['device_type'] == 'sensor':
-                        # print(attr_cover)
-                        new_window = "window_tydom_" + str(device_id)
-                        new_window = sensor(
-                            elem_name=attr_window['element_name'],
-                            tydom_attributes_payload=attr_window,
-                            attributes_topic_from_device='useless',
-                            mqtt=self.mqtt_client)
-                        # new_cover = Cover(id=endpoint_id,name=print_id, current_position=elementValue, attributes=i, mqtt=self.mqtt_client)
-                        await new_window.update()
-                    elif 'device_type' in attr_light and attr_light['device_type'] == 'light':
-                        # print(attr_cover)
-                        new_light = "light_tydom_" + str(device_id)
-                        new_light = Light(
-                            tydom_attributes=attr_light,
-                            mqtt=self.mqtt_client)  # NEW METHOD
-                        # new_cover = Cover(id=endpoint_id,name=print_id, current_position=elementValue, attributes=i, mqtt=self.mqtt_client)
-                        await new_light.update()
-                    elif 'device_type' in attr_boiler and attr_boiler['device_type'] == 'climate':
-                        # print(attr_boiler)
-                        new_boiler = "boiler_tydom_" + str(device_id)
-                        new_boiler = Boiler(
-                            tydom_attributes=attr_boiler,
-                            tydom_client=self.tydom_client,
-                            mqtt=self.mqtt_client)  # NEW METHOD
-                        # new_cover = Cover(id=endpoint_id,name=print_id, current_position=elementValue, attributes=i, mqtt=self.mqtt_client)
-                        await new_boiler.update()
-                    elif 'device_type' in attr_gate and attr_gate['device_type'] == 'switch':
-                        # print(attr_gate)
-                        new_gate = "gate_door_tydom_" + str(endpoint_id)
-                        new_gate = Switch(
-                            tydom_attributes=attr_gate,
-                            mqtt=self.mqtt_client)  # NEW METHOD
-                        # new_cover = Cover(id=endpoint_id,name=print_id, current_position=elementValue, attributes=i, mqtt=self.mqtt_client)
-                        await new_gate.update()
-
-                   # Get last known state (for alarm) # NEW METHOD
-                    elif 'device_type' in attr_alarm and attr_alarm['device_type'] == 'alarm_control_panel':
-                        # print(attr_alarm)
-                        state = None
-                        sos_state = False
-                        maintenance_mode = False
-                        out = None
-                        try:
-                            # {
-                            # "name": "alarmState",
-                            # "type": "string",
-                            # "permission": "r",
-                            # "enum_values": ["OFF", "DELAYED", "ON", "QUIET"]
-                            # },
-                            # {
-                            # "name": "alarmMode",
-                            # "type": "string",
-                            # "permission": "r",
-                            # "enum_values": ["OFF", "ON", "TEST", "ZONE", "MAINTENANCE"]
-                            # }
-
-                            if ('alarmState' in attr_alarm and attr_alarm['alarmState'] == "ON") or (
-                                    'alarmState' in attr_alarm and attr_alarm['alarmState']) == "QUIET":
-                                state = "triggered"
-
-                            elif 'alarmState' in attr_alarm and attr_alarm['alarmState'] == "DELAYED":
-                                state = "pending"
-
-                            if 'alarmSOS' in attr_alarm and attr_alarm['alarmSOS'] == "true":
-                                state = "triggered"
-                                sos_state = True
-
-                            elif 'alarmMode' in attr_alarm and attr_alarm["alarmMode"] == "ON":
-                                state = "armed_away"
-                            elif 'alarmMode' in attr_alarm and attr_alarm["alarmMode"] == "ZONE":
-                                state = "armed_home"
-                            elif 'alarmMode' in attr_alarm and attr_alarm["alarmMode"] == "OFF":
-                                state = "disarmed"
-                            elif 'alarmMode' in attr_alarm and attr_alarm["alarmMode"] == "MAINTENANCE":
-                                maintenance_mode = True
-                                state = "disarmed"
-
-                            if 'outTemperature' in attr_alarm:
-                                out = attr_alarm["outTemperature"]
-
-                            if (sos_state):
-                                print("SOS !")
-
-                            if not (state is None):
-                                # print(state)
-                                alarm = "alarm_tydom_" + str(endpoint_id)
-                                # print("Alarm created / updated : "+alarm)
-                                alarm = Alarm(
-                                    current_state=state,
-                                    alarm_pin=self.tydom_client.alarm_pin,
-                                    tydom_attributes=attr_alarm,
-                                    mqtt=self.mqtt_client)
-                                await alarm.update()
-
-                        except Exception as e:
-                            print("Error in alarm parsing !")
-                            print(e)
-                            pass
-                    else:
-                        pass
-
-    # PUT response DIRTY parsing
-    def parse_put_response(self, bytes_str):
-        # TODO : Find a cooler way to parse nicely the PUT HTTP response
-        resp = bytes_str[len(self.cmd_prefix):].decode("utf-8")
-        fields = resp.split("\r\n")
-        fields = fields[6:]  # ignore the PUT / HTTP/1.1
-        end_parsing = False
-        i = 0
-        output = str()
-        while not end_parsing:
-            field = fields[i]
-            if len(field) == 0 or field == '0':
-                end_parsing = True
-            else:
-                output += field
-                i = i + 2
-        parsed = json.loads(output)
-        return json.dumps(parsed)
+                    if attributes is not None:
+                        key = (device_id, endpoint_id)
+                        if changed or states.due(key):
+                            # Values missing from this frame (pushes only
+                            # carry what changed) come from the store
+                            for name, value in states.values(device_id, endpoint_id, keywords).items():
+                                attributes.setdefault(name, value)
+                            await descriptor.factory(self, attributes)
+                            states.mark(key)
+
+        states.touch()
+        if self.tydom_client.first_state_time is None:
+            self.tydom_client.first_state_time = time.monotonic() - \
+                self.tydom_client.started_at
+            print('First state published {:.3f}s after start'.format(
+                self.tydom_client.first_state_time))
+            self.mqtt_client.publish_metrics(
+                'startup_' + self.namespace,
+                {'first_state': round(self.tydom_client.first_state_time, 3)})
+
+    # Body of the frames pushed by the hub (PUT /devices/data, POST...),
+    # decoded once and handed as is to parse_response
+    def parse_put_response(self, frame):
+        return json_codec.loads(frame.body)
 
     # FUNCTIONS
 
-    def response_from_bytes(self, data):
-        sock = BytesIOSocket(data)
-        response = HTTPResponse(sock)
-        response.begin()
-        return urllib3.HTTPResponse.from_httplib(response)
+    # Entity ids (<device>_<endpoint>) of the devices in the configuration
+    def known_ids(self):
+        ids = []
+        for unique_id in self.device_type:
+            endpoint_id, device_id = unique_id.split('_', 1)
+            ids.append(device_id + '_' + endpoint_id)
+        return ids
+
+    # Wake up the caller waiting for this response (matched on Transac-Id,
+    # or on Uri-Origin when there is none)
+    def resolve_request(self, frame, response):
+        self.tydom_client.requests.resolve(
+            frame.transac_id, response, frame.uri_origin)
 
     def put_response_from_bytes(self, data):
         request = HTTPRequest(data)
@@ -683,8 +826,8 @@ class TydomMessageHandler():
 
     def get_type_from_id(self, id):
         deviceType = ""
-        if len(device_type) != 0 and id in device_type.keys():
-            deviceType = device_type[id]
+        if len(self.device_type) != 0 and id in self.device_type.keys():
+            deviceType = self.device_type[id]
         else:
             print('{} not in dic device_type'.format(id))
 
@@ -693,21 +836,13 @@ class TydomMessageHandler():
     # Get pretty name for a device id
     def get_name_from_id(self, id):
         name = ""
-        if len(device_name) != 0 and id in device_name.keys():
-            name = device_name[id]
+        if len(self.device_name) != 0 and id in self.device_name.keys():
+            name = self.device_name[id]
         else:
             print('{} not in dic device_name'.format(id))
         return name
 
 
-class BytesIOSocket:
-    def __init__(self, content):
-        self.handle = BytesIO(content)
-
-    def makefile(self, mode):
-        return self.handle
-
-
 class HTTPRequest(BaseHTTPRequestHandler):
     def __init__(self, request_text):
         #self.rfile = StringIO(request_text)
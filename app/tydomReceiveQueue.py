@@ -0,0 +1,116 @@
+import asyncio
+import time
+
+from tydomFrames import is_priority
+
+
+class TydomReceiveQueue():
+    '''
+        Frames read from a hub, waiting to be handled. The listener only
+        puts frames here and goes back reading, two consumer tasks handle
+        them in order : one for the priority lane (command acknowledgements,
+        alarm pushes), one for everything else. Both lanes run concurrently,
+        frames come with the time they were put so that an older frame
+        never overwrites what a newer one of the other lane set.
+        The normal lane holds maxsize frames. When it is full the oldest
+        frame is dropped, and on_overflow is awaited once the lane is empty
+        again (devices data is requested, to catch up with what was lost).
+    '''
+
+    def __init__(self, name, handle, maxsize=200, on_overflow=None,
+                 on_metrics=None, metrics_interval=60, on_priority=None):
+        self.name = name
+        # Coroutine function called with every frame and the time it was put
+        self.handle = handle
+        # Called after every priority frame (publish buffer flush)
+        self.on_priority = on_priority
+        self.maxsize = maxsize
+        self.on_overflow = on_overflow
+        # Called with metrics() every metrics_interval
+        self.on_metrics = on_metrics
+        self.metrics_interval = metrics_interval
+        self.metrics_at = time.monotonic() + metrics_interval
+        # lane -> asyncio.Queue of (put time, frame)
+        self.lanes = {
+            'priority': asyncio.Queue(),
+            'normal': asyncio.Queue(maxsize)}
+        self.workers = []
+        self.overflowed = False
+        # Counters, wait times are reset with every metrics publication
+        self.received = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.waits = dict.fromkeys(self.lanes, 0)
+        self.max_waits = dict.fromkeys(self.lanes, 0)
+        self.handled = dict.fromkeys(self.lanes, 0)
+
+    def put(self, frame):
+        self.received += 1
+        lane = self.lanes['priority' if is_priority(frame) else 'normal']
+        if lane.full():
+            lane.get_nowait()
+            lane.task_done()
+            self.dropped += 1
+            if not self.overflowed:
+                print(self.name, 'receive queue is full, dropping the oldest frames')
+            self.overflowed = True
+        lane.put_nowait((time.monotonic(), frame))
+        self.max_depth = max(self.max_depth, self.lanes['normal'].qsize())
+
+    def start(self):
+        self.workers = [asyncio.ensure_future(self.consume(lane))
+                        for lane in self.lanes]
+
+    async def consume(self, name):
+        lane = self.lanes[name]
+        while True:
+            put_at, frame = await lane.get()
+            wait = time.monotonic() - put_at
+            self.waits[name] += wait
+            self.max_waits[name] = max(self.max_waits[name], wait)
+            self.handled[name] += 1
+            try:
+                await self.handle(frame, put_at)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(self.name, 'frame handling error :', e)
+            finally:
+                lane.task_done()
+            if name == 'priority' and self.on_priority is not None:
+                self.on_priority()
+
+            if self.overflowed and self.lanes['normal'].empty():
+                self.overflowed = False
+                if self.on_overflow is not None:
+                    try:
+                        await self.on_overflow()
+                    except Exception as e:
+                        print(self.name, 'overflow recovery error :', e)
+            if time.monotonic() > self.metrics_at:
+                self.publish_metrics()
+
+    def publish_metrics(self):
+        self.metrics_at = time.monotonic() + self.metrics_interval
+        if self.on_metrics is not None:
+            try:
+                self.on_metrics(self.metrics())
+            except Exception as e:
+                print('Receive queue metrics error :', e)
+        self.max_depth = self.lanes['normal'].qsize()
+        for name in self.lanes:
+            self.waits[name] = 0
+            self.max_waits[name] = 0
+            self.handled[name] = 0
+
+    def metrics(self):
+        metrics = {
+            'received': self.received,
+            'dropped': self.dropped,
+            'max_depth': self.max_depth}
+        for name, lane in self.lanes.items():
+            metrics[name + '_depth'] = lane.qsize()
+            metrics[name + '_max_wait_ms'] = round(self.max_waits[name] * 1000, 1)
+            metrics[name + '_avg_wait_ms'] = round(
+                self.waits[name] * 1000 / self.handled[name], 1) if self.handled[name] else 0
+        return metrics
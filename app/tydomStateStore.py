@@ -0,0 +1,96 @@
+import time
+
+
+class TydomStateStore():
+    '''
+        Last known value of every data of every endpoint of a hub, as
+        (device_id, endpoint_id) -> {name: [value, validity, timestamp,
+        received_at]}, received_at being when the frame that set it was read
+        (monotonic).
+        Entities are only published again when one of their values changed,
+        or when republish_interval is over since their last publication.
+        The sensors of an entity are tracked one by one, with the value they
+        last published.
+    '''
+
+    def __init__(self, republish_interval=3600):
+        self.republish_interval = republish_interval
+        self.endpoints = dict()
+        # entity key -> last publication time
+        self.published = dict()
+        # sensor key -> last published value
+        self.sent = dict()
+        # Last devices data handled
+        self.updated_at = None
+        # Counters
+        self.changes = 0
+        self.unchanged = 0
+        self.outdated = 0
+
+    # False if a frame read after received_at already set the value (the
+    # receive queue lanes are handled concurrently)
+    def newer(self, device_id, endpoint_id, name, received_at):
+        entry = self.endpoints.get((device_id, endpoint_id), dict()).get(name)
+        if received_at is None or entry is None or entry[3] <= received_at:
+            return True
+        self.outdated += 1
+        return False
+
+    # Returns True if the value or its validity changed
+    def set(self, device_id, endpoint_id, name, value, validity, received_at=None):
+        if received_at is None:
+            received_at = time.monotonic()
+        values = self.endpoints.get((device_id, endpoint_id))
+        if values is None:
+            values = self.endpoints[(device_id, endpoint_id)] = dict()
+        entry = values.get(name)
+        if entry is not None and entry[0] == value and entry[1] == validity:
+            entry[3] = max(entry[3], received_at)
+            self.unchanged += 1
+            return False
+        values[name] = [value, validity, time.time(), received_at]
+        self.changes += 1
+        return True
+
+    def get(self, device_id, endpoint_id, name, default=None):
+        entry = self.endpoints.get((device_id, endpoint_id), dict()).get(name)
+        return default if entry is None else entry[0]
+
+    # Up to date values of an endpoint among names
+    def values(self, device_id, endpoint_id, names):
+        return {name: entry[0]
+                for name, entry in self.endpoints.get((device_id, endpoint_id), dict()).items()
+                if name in names and entry[1] == 'upToDate'}
+
+    def due(self, key):
+        published = self.published.get(key)
+        return published is None or time.monotonic() - published > self.republish_interval
+
+    # Per value due, for a sensor whose value may not have changed while
+    # another value of its entity did
+    def stale(self, key, value):
+        return key not in self.sent or self.sent[key] != value or self.due(key)
+
+    def mark(self, key, value=None):
+        self.published[key] = time.monotonic()
+        if value is not None:
+            self.sent[key] = value
+
+    def touch(self):
+        self.updated_at = time.monotonic()
+
+    # True if devices data was handled less than max_age seconds ago
+    def fresh(self, max_age):
+        return self.updated_at is not None and time.monotonic() - self.updated_at < max_age
+
+    # Everything is published again with the next data (broker or Home
+    # Assistant restarted)
+    def force(self):
+        self.published.clear()
+
+    def metrics(self):
+        return {
+            'endpoints': len(self.endpoints),
+            'changes': self.changes,
+            'unchanged': self.unchanged,
+            'outdated': self.outdated}
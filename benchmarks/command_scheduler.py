@@ -0,0 +1,94 @@
+'''
+    Slider sweep through app/tydomCommandScheduler.py, against a hub
+    stand-in answering every PUT after a fixed latency.
+
+    python benchmarks/command_scheduler.py [steps step_interval_ms hub_latency_ms]
+
+    Compares one frame per MQTT message (send_devices_data) with the
+    scheduler, for a hub echoing the Transac-Id and for one answering with
+    the Uri-Origin only.
+'''
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+from tydomConnector import TydomWebSocketClient  # noqa: E402
+from tydomFrames import parse_frame  # noqa: E402
+
+
+class HubConnection():
+
+    def __init__(self, requests, latency, echo_transac_id):
+        self.requests = requests
+        self.latency = latency
+        self.echo_transac_id = echo_transac_id
+        self.frames = 0
+        # Last value of the sweep applied by the hub
+        self.done = None
+        self.last = None
+
+    async def send(self, data):
+        frame = parse_frame(data)
+        self.frames += 1
+        transac_id = frame.transac_id if self.echo_transac_id else None
+        asyncio.get_event_loop().call_later(
+            self.latency, self.answer, transac_id, frame.uri, json.loads(frame.body))
+
+    def answer(self, transac_id, uri, body):
+        self.requests.resolve(transac_id, '', uri)
+        if body[-1]['value'] == self.last:
+            self.done.set()
+
+
+async def sweep(scheduled, echo_transac_id, steps, interval, latency):
+    client = TydomWebSocketClient(mac='001A25123456', password='secret',
+                                  host='192.168.1.20')
+    hub = HubConnection(client.requests, latency, echo_transac_id)
+    hub.done = asyncio.Event()
+    hub.last = steps
+    client.path.connection = hub
+    send = client.put_devices_data if scheduled else \
+        lambda device_id, endpoint_id, name, value: client.send_devices_data(
+            device_id, endpoint_id, [(name, value)])
+    started = time.monotonic()
+    waiters = []
+    for level in range(1, steps + 1):
+        waiters.append(await send(1000, 1000, 'level', level))
+        await asyncio.sleep(interval)
+    try:
+        await asyncio.wait_for(hub.done.wait(), timeout=30)
+        elapsed = '{:.2f} s'.format(time.monotonic() - started)
+    except asyncio.TimeoutError:
+        elapsed = 'never'
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+    failed = sum(isinstance(result, BaseException) for result in results)
+    return hub.frames, elapsed, failed
+
+
+def main():
+    steps, interval, latency = 50, 20, 80
+    if len(sys.argv) == 4:
+        steps, interval, latency = (int(arg) for arg in sys.argv[1:])
+    print('{} steps {} ms apart, hub answering in {} ms'.format(steps, interval, latency))
+    print('{:10} {:16} {:>7} {:>12} {:>8}'.format(
+        'sender', 'hub answers', 'frames', 'last value', 'failed'))
+    for scheduled in (False, True):
+        for echo_transac_id in (True, False):
+            # The client logs every frame
+            with contextlib.redirect_stdout(io.StringIO()):
+                frames, elapsed, failed = asyncio.run(sweep(
+                    scheduled, echo_transac_id, steps, interval / 1000, latency / 1000))
+            print('{:10} {:16} {:>7} {:>12} {:>8}'.format(
+                'scheduler' if scheduled else 'direct',
+                'Transac-Id' if echo_transac_id else 'Uri-Origin only',
+                frames, elapsed, failed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+'''
+    Devices data frames of a synthetic installation through
+    app/tydomMessagehandler.py parse_devices_data, with the entities kept
+    by the handler, and built again on every frame as before.
+
+    python benchmarks/entity_memory.py [endpoints frames]
+
+    The state store is forced before every frame, so every entity is
+    published each time. Publishing itself is stubbed out. Time is measured
+    with and without tracemalloc, peak traced memory is per frame.
+'''
+import asyncio
+import contextlib
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+import tydomMessagehandler  # noqa: E402
+from alarm_control_panel import Alarm  # noqa: E402
+from boiler import Boiler  # noqa: E402
+from cover import Cover  # noqa: E402
+from light import Light  # noqa: E402
+from sensors import sensor  # noqa: E402
+from switch import Switch  # noqa: E402
+from tydomConnector import TydomWebSocketClient  # noqa: E402
+
+# last_usage -> data of its endpoints, one usage per endpoint in turn
+usages = {
+    'shutter': [('position', 50), ('onFavPos', False), ('thermicDefect', False),
+                ('obstacleDefect', False), ('intrusion', False), ('battDefect', False)],
+    'light': [('level', 30), ('onFavPos', False), ('thermicDefect', False),
+              ('battDefect', False), ('loadDefect', False), ('cmdDefect', False)],
+    'window': [('openState', 'LOCKED'), ('intrusionDetect', False)],
+    'gate': [('level', 0), ('onFavPos', False)],
+    'electric': [('setpoint', 19.5), ('temperature', 20.1), ('thermicLevel', 'ECO'),
+                 ('hvacMode', 'NORMAL'), ('authorization', 'HEATING')],
+}
+constructed = [0]
+
+
+class MqttClient():
+    def publish(self, topic, payload, qos=0, retain=False, immediate=False):
+        pass
+
+    def publish_config(self, topic, config, retain=False):
+        return True
+
+    def publish_metrics(self, name, metrics):
+        pass
+
+    def report_orphans(self, namespace, known_ids=None):
+        pass
+
+
+# Counts the entity objects built
+def counted(cls):
+    init = cls.__init__
+
+    def __init__(self, *args, **kwargs):
+        constructed[0] += 1
+        init(self, *args, **kwargs)
+    cls.__init__ = __init__
+
+
+def installation(endpoints):
+    names = list(usages)
+    registry = dict()
+    data = []
+    for i in range(endpoints):
+        usage = names[i % len(names)]
+        device_id, endpoint_id = 1000 + i, i
+        registry[str(endpoint_id) + '_' + str(device_id)] = usage
+        data.append({'id': device_id, 'endpoints': [{
+            'id': endpoint_id, 'error': 0, 'data': [
+                {'name': name, 'value': value, 'validity': 'upToDate'}
+                for name, value in usages[usage]]}]})
+    return registry, data
+
+
+def handler(registry):
+    client = TydomWebSocketClient(mac='001A25123456', password='secret',
+                                  host='192.168.1.20', namespace='benchmark')
+    client.config_cache.file = None
+    client.first_state_time = 0
+    handler = tydomMessagehandler.TydomMessageHandler(
+        tydom_client=client, mqtt_client=MqttClient())
+    for unique_id, usage in registry.items():
+        handler.device_type[unique_id] = tydomMessagehandler.device_types[usage].device_type
+        handler.device_name[unique_id] = 'Device ' + unique_id
+    return handler
+
+
+async def frames(handler, data, count, pooled, traced):
+    elapsed = []
+    peaks = []
+    built = []
+    for _ in range(count):
+        constructed[0] = 0
+        handler.tydom_client.states.force()
+        if not pooled:
+            handler.entities.clear()
+        if traced:
+            tracemalloc.start()
+        started = time.perf_counter()
+        await handler.parse_devices_data(data)
+        elapsed.append(time.perf_counter() - started)
+        if traced:
+            peaks.append(tracemalloc.get_traced_memory()[1] / 1024)
+            tracemalloc.stop()
+        built.append(constructed[0])
+    return built, elapsed, peaks
+
+
+def run(registry, data, count, pooled, traced):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        return asyncio.run(frames(handler(registry), data, count, pooled, traced))
+
+
+def main():
+    endpoints, count = 300, 10
+    if len(sys.argv) == 3:
+        endpoints, count = (int(arg) for arg in sys.argv[1:])
+    for cls in (Cover, Light, Switch, Boiler, Alarm, sensor):
+        counted(cls)
+    registry, data = installation(endpoints)
+    print('{} endpoints, {} frames'.format(endpoints, count))
+    print('{:20} {:>18} {:>11} {:>10} {:>18}'.format(
+        'entities', 'built first/next', 'ms/frame', 'traced ms', 'peak kB first/next'))
+    for pooled in (False, True):
+        built, elapsed, _ = run(registry, data, count, pooled, False)
+        _, traced, peaks = run(registry, data, count, pooled, True)
+        print('{:20} {:>9} / {:>6} {:>11.1f} {:>10.1f} {:>9.1f} / {:>6.1f}'.format(
+            'kept by the handler' if pooled else 'built every frame',
+            built[0], max(built[1:] or [0]),
+            min(elapsed[1:] or elapsed) * 1e3, min(traced[1:] or traced) * 1e3,
+            peaks[0], max(peaks[1:] or [0])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+'''
+    Builds 10k hub command frames with app/tydomFrames.py
+    TydomFrameBuilder, and with the string formatting they replaced.
+
+    python benchmarks/frame_builder.py [frames]
+'''
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+from tydomFrames import TydomFrameBuilder  # noqa: E402
+
+endpoints = 300
+
+
+# Previous TydomWebSocketClient.put_devices_data
+def string_put(cmd_prefix, device_id, endpoint_id, name, value, transac_id):
+    body = "[{\"name\":\"" + name + "\",\"value\":\"" + value + "\"}]"
+    str_request = cmd_prefix + "PUT /devices/{}/endpoints/{}/data HTTP/1.1\r\nContent-Length: ".format(str(device_id), str(
+        endpoint_id)) + str(len(body)) + "\r\nContent-Type: application/json; charset=UTF-8\r\nTransac-Id: " + \
+        transac_id + "\r\n\r\n" + body + "\r\n\r\n"
+    return bytes(str_request, "ascii")
+
+
+# Previous TydomWebSocketClient.send_message
+def string_get(cmd_prefix, method, msg, transac_id):
+    str_request = cmd_prefix + method + ' ' + msg + \
+        " HTTP/1.1\r\nContent-Length: 0\r\nContent-Type: application/json; charset=UTF-8\r\nTransac-Id: " + \
+        transac_id + "\r\n\r\n"
+    return bytes(str_request, "ascii")
+
+
+# (device, endpoint, name, value, transac id) of every frame
+def orders(count):
+    return [(1000 + i % endpoints, 1000 + i % endpoints, 'position', str(i % 101), str(i))
+            for i in range(count)]
+
+
+def best(function, number):
+    return min(timeit.repeat(function, number=1, repeat=5)) / number * 1e6
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) == 2 else 10000
+    items = orders(count)
+    print('{} frames, {} endpoints'.format(count, endpoints))
+    print('{:8} {:>22} {:>22}'.format('prefix', 'PUT string / builder', 'GET string / builder'))
+    for prefix in ('', '\x02'):
+        builder = TydomFrameBuilder(prefix)
+        for device_id, endpoint_id, name, value, transac_id in items[:endpoints]:
+            built = builder.put_devices_data(device_id, endpoint_id, [(name, value)], transac_id)
+            assert built == string_put(prefix, device_id, endpoint_id, name, value, transac_id)
+            assert builder.request('GET', '/devices/data', transac_id) == \
+                string_get(prefix, 'GET', '/devices/data', transac_id)
+
+        def put_string():
+            for device_id, endpoint_id, name, value, transac_id in items:
+                string_put(prefix, device_id, endpoint_id, name, value, transac_id)
+
+        def put_builder():
+            for device_id, endpoint_id, name, value, transac_id in items:
+                builder.put_devices_data(device_id, endpoint_id, [(name, value)], transac_id)
+
+        def get_string():
+            for item in items:
+                string_get(prefix, 'GET', '/devices/data', item[4])
+
+        def get_builder():
+            for item in items:
+                builder.request('GET', '/devices/data', item[4])
+
+        print('{:8} {:>8.2f} / {:>6.2f} µs {:>8.2f} / {:>6.2f} µs'.format(
+            repr(prefix),
+            best(put_string, count), best(put_builder, count),
+            best(get_string, count), best(get_builder, count)))
+
+
+if __name__ == '__main__':
+    main()
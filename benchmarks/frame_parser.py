@@ -0,0 +1,106 @@
+'''
+    Parses hub frames with app/tydomFrames.py parse_frame, and with the
+    http.client + urllib3 chain it replaced.
+
+    python benchmarks/frame_parser.py
+
+    Frames are shaped like the hub's : chunked bodies, \x02 prefix on the
+    remote path, Uri-Origin and Transac-Id headers.
+'''
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+from http.client import HTTPResponse
+from io import BytesIO
+
+import urllib3
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+from tydomFrames import parse_frame  # noqa: E402
+
+endpoints = 40
+
+
+class BytesIOSocket:
+    def __init__(self, content):
+        self.handle = BytesIO(content)
+
+    def makefile(self, mode):
+        return self.handle
+
+
+# Previous TydomMessageHandler.response_from_bytes, body only
+def httplib_body(data):
+    prefix = 1 if data[:1] == b'\x02' else 0
+    response = HTTPResponse(BytesIOSocket(data[prefix:]))
+    response.begin()
+    if hasattr(urllib3.HTTPResponse, 'from_httplib'):
+        return urllib3.HTTPResponse.from_httplib(response).data
+    # urllib3 2 dropped from_httplib
+    return response.read()
+
+
+def parse_frame_body(data):
+    return parse_frame(data).body
+
+
+def chunked(body, count):
+    step = max(1, len(body) // count)
+    out = b''
+    for i in range(0, len(body), step):
+        chunk = body[i:i + step]
+        out += b'%x\r\n' % len(chunk) + chunk + b'\r\n'
+    return out + b'0\r\n\r\n'
+
+
+def frames():
+    config = json.dumps({'id_catalog': 'x', 'endpoints': [
+        {'id_endpoint': i, 'id_device': i + 1000, 'name': 'Volet %d' % i,
+         'last_usage': 'shutter', 'picto': 'p'} for i in range(endpoints)]}).encode()
+    data = json.dumps([{'id': i, 'endpoints': [{'id': i, 'error': 0, 'data': [
+        {'name': name, 'value': 50, 'validity': 'upToDate'}
+        for name in ('position', 'onFavPos', 'thermicDefect', 'obstacleDefect', 'intrusion', 'battDefect')]}]}
+        for i in range(endpoints)]).encode()
+    push = json.dumps([{'id': 1, 'endpoints': [{'id': 1, 'error': 0, 'data': [
+        {'name': 'position', 'value': 42, 'validity': 'upToDate'}]}]}]).encode()
+    head = b'HTTP/1.1 200 OK\r\nServer: Tydom-001A25\r\nUri-Origin: %s\r\n' \
+        b'Content-Type: application/json\r\nTransfer-Encoding: chunked\r\nTransac-Id: 1234\r\n\r\n'
+    info = b'{"productName":"TYDOM"}'
+    return [
+        ('config', head % b'/configs/file' + chunked(config, 8)),
+        ('devices data', b'\x02' + head % b'/devices/data' + chunked(data, 20)),
+        ('data push', head % b'/devices/1/endpoints/1/data' + chunked(push, 1)),
+        ('info', b'HTTP/1.1 200 OK\r\nUri-Origin: /info\r\nContent-Length: %d\r\n'
+         b'Transac-Id: 1\r\n\r\n' % len(info) + info),
+    ]
+
+
+def peak(function, frame):
+    tracemalloc.start()
+    function(frame)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 1024
+
+
+def best(function, frame, number):
+    return min(timeit.repeat(lambda: function(frame), number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    print('{:14} {:>8} {:>24} {:>20}'.format(
+        'frame', 'size', 'old / new µs per frame', 'old / new peak kB'))
+    for name, frame in frames():
+        assert httplib_body(frame) == parse_frame_body(frame), name
+        number = 20000 if len(frame) < 2000 else 3000
+        print('{:14} {:>6} B {:>11.1f} / {:>8.1f} {:>11.1f} / {:>6.1f}'.format(
+            name, len(frame),
+            best(httplib_body, frame, number), best(parse_frame_body, frame, number),
+            peak(httplib_body, frame), peak(parse_frame_body, frame)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+'''
+    Compares the json backends of app/json_codec.py on hub payloads.
+
+    python benchmarks/json_backends.py [configs_file.json devices_data.json]
+
+    Without arguments, payloads shaped like the ones of a 300 endpoints
+    installation are generated. Bodies of /configs/file and /devices/data
+    captured on a real hub can be given instead.
+'''
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+import json_codec  # noqa: E402
+
+endpoints = 300
+usages = ['shutter', 'light', 'window', 'belmDoor', 'boiler', 'conso', 'plug']
+
+
+def configs_file():
+    return {
+        'id_catalog': 'F2C6F3BAC1E8C2A4E9F5D1A5A4D2E6B1',
+        'version_application': '4.5.2 - 0 - 0',
+        'os': 'android',
+        'endpoints': [{
+            'id_endpoint': 1000 + i,
+            'id_device': 1000 + i,
+            'name': 'Endpoint {} séjour'.format(i),
+            'picto': 'picto_{}'.format(usages[i % len(usages)]),
+            'first_usage': usages[i % len(usages)],
+            'last_usage': usages[i % len(usages)],
+            'anticipation_start': False,
+            'widget_behavior': {'detector_confirmed': False}}
+            for i in range(endpoints)],
+        'groups': [{'id': i, 'name': 'Group {}'.format(i), 'devices': []}
+                   for i in range(10)],
+        'scenarios': [{'id': i, 'name': 'Scenario {}'.format(i), 'picto': 'picto_scenario'}
+                      for i in range(20)],
+    }
+
+
+def devices_data():
+    return [{
+        'id': 1000 + i,
+        'endpoints': [{
+            'id': 1000 + i,
+            'error': 0,
+            'data': [
+                {'name': 'position', 'validity': 'upToDate', 'value': random.randint(0, 100)},
+                {'name': 'onFavPos', 'validity': 'upToDate', 'value': False},
+                {'name': 'thermicDefect', 'validity': 'upToDate', 'value': False},
+                {'name': 'obstacleDefect', 'validity': 'upToDate', 'value': False},
+                {'name': 'intrusion', 'validity': 'upToDate', 'value': False},
+                {'name': 'battDefect', 'validity': 'upToDate', 'value': False},
+                {'name': 'energyIndex', 'validity': 'upToDate',
+                 'value': {'dest': 'ELEC', 'value': random.random() * 1e5}},
+            ]}]}
+        for i in range(endpoints)]
+
+
+# Payloads published to MQTT for every entity
+def entity_attributes():
+    return {'device_id': 1000, 'endpoint_id': 1000, 'id': '1000_1000',
+            'cover_name': 'Endpoint 0 séjour', 'position': 42,
+            'onFavPos': False, 'thermicDefect': False, 'obstacleDefect': False,
+            'intrusion': False, 'battDefect': False}
+
+
+def discovery_config():
+    return {'name': 'Endpoint 0 séjour', 'unique_id': '1000_1000',
+            'command_topic': 'cover/tydom/1000_1000/set_positionCmd',
+            'position_topic': 'cover/tydom/1000_1000/current_position',
+            'set_position_topic': 'cover/tydom/1000_1000/set_position',
+            'payload_open': 'UP', 'payload_close': 'DOWN', 'payload_stop': 'STOP',
+            'retain': 'false',
+            'device': {'manufacturer': 'Delta Dore', 'model': 'Volet',
+                       'name': 'Endpoint 0 séjour', 'identifiers': '1000_1000'},
+            'json_attributes_topic': 'cover/tydom/1000_1000/attributes'}
+
+
+def best(statement, number):
+    return min(timeit.repeat(statement, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    if len(sys.argv) == 3:
+        with open(sys.argv[1], 'rb') as f:
+            configs = f.read()
+        with open(sys.argv[2], 'rb') as f:
+            data = f.read()
+    else:
+        configs = json_codec.json_dumps(configs_file())
+        data = json_codec.json_dumps(devices_data())
+    attributes = entity_attributes()
+    config = discovery_config()
+    print('/configs/file {} bytes, /devices/data {} bytes'.format(len(configs), len(data)))
+    print('{:8} {:>16} {:>16} {:>16} {:>16}'.format(
+        'backend', 'configs loads', 'data loads', 'attrs dumps', 'config dumps'))
+    for name in json_codec.backends:
+        try:
+            backend, loads, dumps = json_codec.select_backend(name)
+        except Exception as e:
+            print(name, 'unavailable :', e)
+            continue
+        if backend != name:
+            print('{:8} not installed'.format(name))
+            continue
+        print('{:8} {:>13.1f} µs {:>13.1f} µs {:>13.2f} µs {:>13.2f} µs'.format(
+            name,
+            best(lambda: loads(configs), 50),
+            best(lambda: loads(data), 50),
+            best(lambda: dumps(attributes), 20000),
+            best(lambda: dumps(config), 20000)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+'''
+    Messages the broker sends back to app/mqtt_client.py MQTT_Hassio while
+    it publishes the states of a synthetic installation, through the
+    broker stand-in of tests/mqtt_broker.py (qos 0 routing, MQTT 5).
+
+    python benchmarks/mqtt_no_local.py [endpoints frames commands]
+
+    Compares the previous +/<namespace>/# subscription with the command
+    and request topics, each with MQTT 5 no-local off and on. Commands
+    come from another client, like Home Assistant.
+'''
+import asyncio
+import contextlib
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tests'))
+
+from gmqtt import Client as MQTTClient  # noqa: E402
+from gmqtt import Subscription  # noqa: E402
+from mqtt_broker import Broker  # noqa: E402
+from mqtt_client import MQTT_Hassio  # noqa: E402
+from tydomStateStore import TydomStateStore  # noqa: E402
+
+
+class Tydom():
+    namespace = 'tydom'
+
+    def __init__(self):
+        self.states = TydomStateStore()
+        self.orders = 0
+
+    async def put_devices_data(self, device_id, endpoint_id, name, value):
+        self.orders += 1
+
+
+class Hassio(MQTT_Hassio):
+    '''Subscribes as asked, counts the messages it gets'''
+
+    def __init__(self, port, previous, no_local):
+        super().__init__('127.0.0.1', port, '', '', False, flush_interval=0)
+        self.previous = previous
+        self.no_local = no_local
+        self.received = 0
+
+    def mqtt5(self, client):
+        return self.no_local
+
+    def on_connect(self, client, flags, rc, properties):
+        if not self.previous:
+            return super().on_connect(client, flags, rc, properties)
+        # Subscription before the command topics were listed
+        client.subscribe([Subscription(topic, qos=0, no_local=self.no_local)
+                          for topic in ('homeassistant/status', '+/tydom/#')])
+
+    async def on_message(self, client, topic, payload, qos, properties):
+        self.received += 1
+        await super().on_message(client, topic, payload, qos, properties)
+
+
+async def run(previous, no_local, endpoints, frames, commands):
+    broker = Broker(route=True)
+    port = await broker.start()
+    hassio = Hassio(port, previous, no_local)
+    tydom = Tydom()
+    hassio.add_tydom(tydom)
+    await hassio.connect()
+    home_assistant = MQTTClient('home-assistant')
+    await home_assistant.connect('127.0.0.1', port)
+    await asyncio.sleep(0.2)
+
+    for frame in range(frames):
+        for i in range(endpoints):
+            hassio.publish('cover/tydom/{}_{}/current_position'.format(1000 + i, i), frame)
+            hassio.publish('cover/tydom/{}_{}/attributes'.format(1000 + i, i),
+                           '{"position": %d, "thermicDefect": false}' % frame)
+            hassio.publish('binary_sensor/tydom/thermicDefect_tydom_{}_{}/state'.format(1000 + i, i),
+                           'false')
+        await asyncio.sleep(0)
+    for i in range(commands):
+        home_assistant.publish('cover/tydom/{}_{}/set_position'.format(1000 + i, i), b'50')
+    # Everything delivered
+    for _ in range(100):
+        await asyncio.sleep(0.05)
+        if tydom.orders == commands and hassio.received >= commands:
+            break
+    await asyncio.sleep(0.2)
+
+    messages, size = broker.delivered.get(hassio.mqtt_client._client_id, [0, 0])
+    result = (messages, size, hassio.received - tydom.orders, tydom.orders)
+    await home_assistant.disconnect()
+    await hassio.mqtt_client.disconnect()
+    await broker.stop()
+    # Connections handlers see their end
+    await asyncio.sleep(0.1)
+    return result
+
+
+def main():
+    endpoints, frames, commands = 300, 3, 20
+    if len(sys.argv) == 4:
+        endpoints, frames, commands = (int(arg) for arg in sys.argv[1:])
+    print('{} endpoints, {} frames ({} publishes), {} commands'.format(
+        endpoints, frames, 3 * endpoints * frames, commands))
+    print('{:22} {:>9} {:>10} {:>10} {:>10} {:>8}'.format(
+        'subscription', 'no-local', 'messages', 'kB', 'useless', 'orders'))
+    for previous in (True, False):
+        for no_local in (False, True):
+            # The client logs every message
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                messages, size, useless, orders = asyncio.run(
+                    run(previous, no_local, endpoints, frames, commands))
+            print('{:22} {:>9} {:>10} {:>10.1f} {:>10} {:>8}'.format(
+                '+/tydom/#' if previous else 'commands and requests',
+                'on' if no_local else 'off', messages, size / 1024, useless, orders))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+'''
+    Routing cost of incoming MQTT messages through app/mqtt_client.py
+    MQTT_Hassio.on_message, and through the if/elif chain it replaced.
+
+    python benchmarks/mqtt_router.py [messages]
+
+    Handlers are stubbed out on both sides, what is measured is the topic
+    matching, the ids extraction, the payload decoding and the logging
+    (to /dev/null).
+'''
+import asyncio
+import contextlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+import json_codec  # noqa: E402
+from mqtt_client import MQTT_Hassio  # noqa: E402
+
+messages = {
+    'command': ('cover/tydom/1001_1000/set_position', b'42'),
+    'text command': ('switch/tydom/1005_1000/set_levelCmdGate', b'TOGGLE'),
+    'request': ('homeassistant/requests/tydom/refresh', b''),
+    'ignored topic': ('cover/tydom/1001_1000/current_position', b'42'),
+}
+
+
+class Tydom():
+    namespace = 'tydom'
+
+
+async def handled(*args):
+    pass
+
+
+# Previous MQTT_Hassio.on_message, handlers stubbed out
+async def chain_route(tydoms, topic, payload):
+    tydom = None
+    for namespace in topic.split('/')[1:3]:
+        if namespace in tydoms:
+            tydom = tydoms[namespace]
+            break
+    if tydom is None:
+        return
+    if ('update' in str(topic)):
+        print('Incoming MQTT update request : ', topic, payload)
+        await handled(tydom)
+    elif ('kill' in str(topic)):
+        print('Incoming MQTT kill request : ', topic, payload)
+        await handled(tydom)
+    elif (topic == "homeassistant/requests/{namespace}/refresh".format(namespace=tydom.namespace)):
+        print('Incoming MQTT refresh request : ', topic, payload)
+        await handled(tydom)
+    elif (topic == "homeassistant/requests/{namespace}/scenarii".format(namespace=tydom.namespace)):
+        print('Incoming MQTT scenarii request : ', topic, payload)
+        await handled(tydom)
+    elif (topic == "/{namespace}/init".format(namespace=tydom.namespace)):
+        print('Incoming MQTT init request : ', topic, payload)
+        await handled(tydom)
+    elif 'set_positionCmd' in str(topic):
+        print('Incoming MQTT set_positionCmd request : ', topic, payload)
+        value = str(payload).strip('b').strip("'")
+        get_id = (topic.split("/"))[2]
+        print(str(get_id), 'positionCmd', value)
+        await handled(tydom, (get_id.split("_"))[0], (get_id.split("_"))[1], str(value))
+    elif ('set_position' in str(topic)) and not ('set_positionCmd' in str(topic)):
+        print('Incoming MQTT set_position request : ', topic, json_codec.loads(payload))
+        value = json_codec.loads(payload)
+        get_id = (topic.split("/"))[2]
+        await handled(tydom, (get_id.split("_"))[0], (get_id.split("_"))[1], str(value))
+    elif 'set_levelCmd' in str(topic):
+        print('Incoming MQTT set_levelCmd request : ', topic, payload)
+        value = str(payload).strip('b').strip("'")
+        get_id = (topic.split("/"))[2]
+        print(str(get_id), 'levelCmd', value)
+        await handled(tydom, (get_id.split("_"))[0], (get_id.split("_"))[1], str(value))
+    elif ('set_level' in str(topic)) and not ('set_levelCmd' in str(topic)):
+        print('Incoming MQTT set_level request : ', topic, json_codec.loads(payload))
+        value = json_codec.loads(payload)
+        get_id = (topic.split("/"))[2]
+        await handled(tydom, (get_id.split("_"))[0], (get_id.split("_"))[1], str(value))
+    elif ('set_alarm_state' in str(topic)) and not ('homeassistant' in str(topic)):
+        value = str(payload).strip('b').strip("'")
+        get_id = (topic.split("/"))[2]
+        await handled(tydom, (get_id.split("_"))[0], (get_id.split("_"))[1], value)
+    elif ('set_setpoint' in str(topic)):
+        value = str(payload).strip('b').strip("'")
+        print('Incoming MQTT setpoint request : ', topic, value)
+        value = json_codec.loads(payload)
+        get_id = (topic.split("/"))[2]
+        await handled(tydom, (get_id.split("_"))[0], (get_id.split("_"))[1], str(value))
+    elif ('set_hvacMode' in str(topic)):
+        value = str(payload).strip('b').strip("'")
+        print('Incoming MQTT set_hvacMode request : ', topic, value)
+        get_id = (topic.split("/"))[2]
+        await handled(tydom, (get_id.split("_"))[0], (get_id.split("_"))[1], str(value))
+    elif ('set_thermicLevel' in str(topic)):
+        value = str(payload).strip('b').strip("'")
+        print('Incoming MQTT set_thermicLevel request : ', topic, value)
+        get_id = (topic.split("/"))[2]
+        await handled(tydom, (get_id.split("_"))[0], (get_id.split("_"))[1], str(value))
+    elif ('set_switch_state' in str(topic)) and not ('homeassistant' in str(topic)):
+        value = str(payload).strip('b').strip("'")
+        get_id = (topic.split("/"))[2]
+        await handled(tydom, (get_id.split("_"))[0], (get_id.split("_"))[1], value)
+    elif 'set_levelCmdGate' in str(topic):
+        print('Incoming MQTT set_levelCmdGate request : ', topic, payload)
+        value = str(payload).strip('b').strip("'")
+        get_id = (topic.split("/"))[2]
+        print(str(get_id), 'levelCmd', value)
+        await handled(tydom, (get_id.split("_"))[0], (get_id.split("_"))[1], str(value))
+    elif ('set_levelGate' in str(topic)) and not ('set_levelCmd' in str(topic)):
+        print('Incoming MQTT set_levelGate request : ', topic, json_codec.loads(payload))
+        value = json_codec.loads(payload)
+        get_id = (topic.split("/"))[2]
+        await handled(tydom, (get_id.split("_"))[0], (get_id.split("_"))[1], str(value))
+
+
+def router():
+    hassio = MQTT_Hassio('127.0.0.1', 1883, None, None, False)
+    hassio.add_tydom(Tydom())
+    for command, (decode, handler) in hassio.commands.items():
+        hassio.register(command, decode, handled)
+    for request in hassio.requests:
+        hassio.requests[request] = handled
+    return hassio
+
+
+async def run(route, topic, payload, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        await route(topic, payload)
+    return time.perf_counter() - started
+
+
+def best(route, topic, payload, count):
+    return min(asyncio.run(run(route, topic, payload, count))
+               for _ in range(5)) / count * 1e6
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) == 2 else 20000
+    hassio = router()
+    tydoms = {'tydom': Tydom()}
+
+    async def dict_route(topic, payload):
+        await hassio.on_message(None, topic, payload, 0, {})
+
+    async def previous_route(topic, payload):
+        await chain_route(tydoms, topic, payload)
+
+    print('{} messages per topic'.format(count))
+    print('{:16} {:>26}'.format('message', 'if/elif / dict µs per msg'))
+    for name, (topic, payload) in messages.items():
+        # Both log the routed messages
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            previous = best(previous_route, topic, payload, count)
+            current = best(dict_route, topic, payload, count)
+        print('{:16} {:>14.2f} / {:>6.2f}'.format(name, previous, current))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+'''
+    /refresh/all like burst through app/mqtt_client.py MQTT_Hassio.publish,
+    published right away (MQTT_FLUSH_INTERVAL 0) and through the buffer
+    (0.1 s). The broker stand-in of tests/mqtt_broker.py runs in its own
+    process with a '#' subscriber, its CPU time is measured there.
+
+    python benchmarks/publish_buffer.py [endpoints pushes]
+
+    Every endpoint pushes its data pushes times in a row, each push
+    publishing the states of a cover and of its sensors, 10 ms between
+    every 10 endpoints.
+'''
+import asyncio
+import contextlib
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tests'))
+
+from gmqtt import Client as MQTTClient  # noqa: E402
+from mqtt_broker import Broker  # noqa: E402
+from mqtt_client import MQTT_Hassio  # noqa: E402
+
+sensors = ('onFavPos', 'thermicDefect', 'obstacleDefect', 'intrusion', 'battDefect', 'position')
+
+
+# Broker process : sends its port, then publications received and CPU ms
+# once asked to stop
+def serve(pipe):
+    async def run():
+        broker = Broker(route=True)
+        pipe.send(await broker.start())
+        started = time.process_time()
+        await asyncio.get_event_loop().run_in_executor(None, pipe.recv)
+        pipe.send((broker.published, (time.process_time() - started) * 1e3))
+        await broker.stop()
+    asyncio.run(run())
+
+
+async def burst(port, flush_interval, endpoints, pushes):
+    received = [0]
+    subscriber = MQTTClient('home-assistant')
+    subscriber.on_message = lambda client, topic, payload, qos, properties: received.__setitem__(
+        0, received[0] + 1)
+    await subscriber.connect('127.0.0.1', port)
+    subscriber.subscribe('#')
+    hassio = MQTT_Hassio('127.0.0.1', port, '', '', False, flush_interval=flush_interval)
+    await hassio.connect()
+    await asyncio.sleep(0.2)
+
+    started = time.monotonic()
+    for i in range(endpoints):
+        cover = '{}_{}'.format(1000 + i, i)
+        # The hub pushes the same endpoint again while it moves
+        for push in range(pushes):
+            hassio.publish('cover/tydom/{}/current_position'.format(cover), push, retain=True)
+            hassio.publish('cover/tydom/{}/attributes'.format(cover),
+                           '{"position": %d, "thermicDefect": false}' % push)
+            for name in sensors:
+                hassio.publish('binary_sensor/tydom/{}_tydom_{}/state'.format(name, cover),
+                               push if name == 'position' else 'false')
+            await asyncio.sleep(0)
+        if i % 10 == 9:
+            await asyncio.sleep(0.01)
+    hassio.flush()
+    elapsed = time.monotonic() - started
+    # Everything delivered to the subscriber
+    await asyncio.sleep(0.5)
+    result = (hassio.sent, hassio.coalesced, elapsed, received[0])
+    await subscriber.disconnect()
+    await hassio.mqtt_client.disconnect()
+    return result
+
+
+def main():
+    endpoints, pushes = 300, 5
+    if len(sys.argv) == 3:
+        endpoints, pushes = (int(arg) for arg in sys.argv[1:])
+    print('{} endpoints pushing {} times, {} states'.format(
+        endpoints, pushes, endpoints * pushes * (2 + len(sensors))))
+    print('{:16} {:>10} {:>10} {:>10} {:>10} {:>12}'.format(
+        'flush interval', 'publishes', 'coalesced', 'msgs/s', 'delivered', 'broker CPU'))
+    for flush_interval in (0, 0.1):
+        pipe, broker_pipe = multiprocessing.Pipe()
+        broker = multiprocessing.Process(target=serve, args=(broker_pipe,))
+        broker.start()
+        port = pipe.recv()
+        # The client logs its connection
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            sent, coalesced, elapsed, delivered = asyncio.run(burst(port, flush_interval, endpoints, pushes))
+        pipe.send('stop')
+        published, cpu = pipe.recv()
+        broker.join()
+        assert published >= sent
+        print('{:>14} s {:>10} {:>10} {:>10.0f} {:>10} {:>9.0f} ms'.format(
+            flush_interval, sent, coalesced, sent / elapsed, delivered, cpu))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+'''
+    Regression benchmark of pushed frames (PUT /devices/data) through
+    app/tydomMessagehandler.py, entities publishing stubbed out.
+
+    python benchmarks/push_stream.py [pushes]
+
+    The payloads handed to parse_devices_data are compared with the ones
+    of the previous decoding (loads, dumps, then loads again).
+'''
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'app'))
+
+import json_codec  # noqa: E402
+import tydomMessagehandler  # noqa: E402
+from tydomFrames import parse_frame  # noqa: E402
+from tydomStateStore import TydomStateStore  # noqa: E402
+
+endpoints = 30
+
+
+class TydomClient():
+    namespace = 'tydom'
+
+    def __init__(self):
+        self.states = TydomStateStore()
+
+
+class MqttClient():
+    def publish_metrics(self, name, metrics):
+        pass
+
+
+def chunked(body):
+    return b'%x\r\n' % len(body) + body + b'\r\n0\r\n\r\n'
+
+
+def pushes(count):
+    frames = []
+    for i in range(count):
+        body = json.dumps([{'id': 1000 + i % endpoints, 'endpoints': [{
+            'id': i % endpoints, 'error': 0, 'data': [
+                {'name': 'position', 'value': i % 100, 'validity': 'upToDate'},
+                {'name': 'thermicDefect', 'value': False, 'validity': 'upToDate'}]}]}]).encode()
+        frames.append(b'PUT /devices/data HTTP/1.1\r\nServer: Tydom-001A25\r\n'
+                      b'Content-Type: application/json\r\nTransfer-Encoding: chunked\r\n\r\n' + chunked(body))
+    return frames
+
+
+# Previous parse_put_response + parse_response decoding
+def decode_twice(body):
+    return json.loads(json.dumps(json.loads(body)))
+
+
+async def handle(frames):
+    received = []
+
+    async def parse_devices_data(parsed, received_at=None):
+        received.append(parsed)
+
+    handler = tydomMessagehandler.TydomMessageHandler(
+        tydom_client=TydomClient(), mqtt_client=MqttClient())
+    handler.parse_devices_data = parse_devices_data
+    started = time.perf_counter()
+    for frame in frames:
+        await handler.incomingTriage(frame)
+    return time.perf_counter() - started, received
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) == 2 else 2000
+    frames = pushes(count)
+    best = None
+    for _ in range(3):
+        # The handler logs every frame
+        with contextlib.redirect_stdout(io.StringIO()):
+            elapsed, received = asyncio.run(handle(frames))
+        best = elapsed if best is None else min(best, elapsed)
+    bodies = [parse_frame(frame).body for frame in frames]
+    assert received == [decode_twice(body) for body in bodies]
+    print('{} pushes, {} endpoints'.format(count, endpoints))
+    print('{:28} {:6.1f} µs per push'.format('handler, logging included', best / count * 1e6))
+    for name, decode in (('decode twice (previous)', decode_twice),
+                         ('decode once, json', json.loads),
+                         ('decode once, ' + json_codec.backend, json_codec.loads)):
+        started = time.perf_counter()
+        for body in bodies:
+            decode(body)
+        print('{:28} {:6.1f} µs per push'.format(
+            name, (time.perf_counter() - started) / count * 1e6))
+
+
+if __name__ == '__main__':
+    main()
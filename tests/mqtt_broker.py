@@ -0,0 +1,151 @@
+import asyncio
+import struct
+
+
+def varint(n):
+    out = bytearray()
+    while True:
+        byte = n % 128
+        n //= 128
+        out.append(byte | (128 if n else 0))
+        if not n:
+            return bytes(out)
+
+
+def read_varint(body, position):
+    value, multiplier = 0, 1
+    while True:
+        byte = body[position]
+        position += 1
+        value += (byte & 127) * multiplier
+        multiplier *= 128
+        if not byte & 128:
+            return value, position
+
+
+def read_string(body, position):
+    length = struct.unpack('!H', body[position:position + 2])[0]
+    return body[position + 2:position + 2 + length].decode(), position + 2 + length
+
+
+def matches(topic_filter, topic):
+    filters, levels = topic_filter.split('/'), topic.split('/')
+    for i, level in enumerate(filters):
+        if level == '#':
+            return True
+        if i >= len(levels) or (level != '+' and level != levels[i]):
+            return False
+    return len(filters) == len(levels)
+
+
+class Broker():
+    '''
+        MQTT broker stand-in : accepts connections, subscriptions and qos 0
+        publications (counted in published). With route, publications are
+        delivered to the matching subscriptions (MQTT 5 no-local honoured)
+        and counted per client id in delivered, as [messages, bytes].
+        Connections can be dropped and new ones refused, like during a
+        broker outage.
+    '''
+
+    def __init__(self, route=False):
+        self.server = None
+        self.port = 0
+        self.connections = 0
+        self.writers = []
+        self.route = route
+        self.published = 0
+        self.delivered = dict()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.serve, '127.0.0.1', self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        for writer in self.writers:
+            writer.close()
+        self.writers = []
+
+    async def serve(self, reader, writer):
+        self.writers.append(writer)
+        try:
+            while True:
+                header = (await reader.readexactly(1))[0]
+                length, multiplier = 0, 1
+                while True:
+                    byte = (await reader.readexactly(1))[0]
+                    length += (byte & 127) * multiplier
+                    multiplier *= 128
+                    if not byte & 128:
+                        break
+                body = await reader.readexactly(length)
+                self.handle(writer, header >> 4, body, header & 15)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if writer in self.writers:
+                self.writers.remove(writer)
+            writer.close()
+
+    def handle(self, writer, kind, body, flags=0):
+        if kind == 1:
+            name_length = struct.unpack('!H', body[:2])[0]
+            writer.v5 = body[2 + name_length] == 5
+            writer.subscriptions = []
+            position = 2 + name_length + 4
+            if writer.v5:
+                length, position = read_varint(body, position)
+                position += length
+            writer.client_id = read_string(body, position)[0]
+            self.connections += 1
+            writer.write(b'\x20\x03\x00\x00\x00' if writer.v5 else b'\x20\x02\x00\x00')
+        elif kind == 8:
+            position = 2
+            if writer.v5:
+                # Subscribe properties, none expected
+                position += 1 + body[2]
+            topics = 0
+            while position < len(body):
+                topic_filter, position = read_string(body, position)
+                # No-local is bit 2 of the MQTT 5 subscription options
+                no_local = writer.v5 and bool(body[position] & 4)
+                writer.subscriptions.append((topic_filter, no_local))
+                position += 1
+                topics += 1
+            payload = body[:2] + (b'\x00' if writer.v5 else b'') + b'\x00' * topics
+            writer.write(b'\x90' + varint(len(payload)) + payload)
+        elif kind == 3:
+            self.published += 1
+            topic, position = read_string(body, 0)
+            qos = (flags >> 1) & 3
+            if qos > 0:
+                packet_id = body[position:position + 2]
+                position += 2
+                writer.write(b'\x40\x02' + packet_id)
+            if writer.v5:
+                length, position = read_varint(body, position)
+                position += length
+            if self.route:
+                self.deliver(writer, topic, body[position:])
+        elif kind == 12:
+            writer.write(b'\xd0\x00')
+        elif kind == 14:
+            writer.close()
+
+    def deliver(self, sender, topic, payload):
+        for writer in self.writers:
+            for topic_filter, no_local in writer.subscriptions:
+                if not matches(topic_filter, topic) or (no_local and writer is sender):
+                    continue
+                name = topic.encode()
+                body = struct.pack('!H', len(name)) + name + \
+                    (b'\x00' if writer.v5 else b'') + payload
+                packet = b'\x30' + varint(len(body)) + body
+                writer.write(packet)
+                counts = self.delivered.setdefault(writer.client_id, [0, 0])
+                counts[0] += 1
+                counts[1] += len(packet)
+                break
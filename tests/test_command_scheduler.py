@@ -0,0 +1,71 @@
+import asyncio
+import json
+import time
+
+from tydomConnector import TydomWebSocketClient
+from tydomFrames import parse_frame
+
+
+class HubConnection():
+    '''
+        Websocket stand-in, the hub answers every PUT after latency, with
+        the Transac-Id or only the Uri-Origin
+    '''
+
+    def __init__(self, requests, latency=0.02, echo_transac_id=True):
+        self.requests = requests
+        self.latency = latency
+        self.echo_transac_id = echo_transac_id
+        # Bodies received, decoded
+        self.orders = []
+
+    async def send(self, data):
+        frame = parse_frame(data)
+        self.orders.append(json.loads(frame.body))
+        transac_id = frame.transac_id if self.echo_transac_id else None
+        asyncio.get_event_loop().call_later(
+            self.latency, self.requests.resolve, transac_id, '', frame.uri)
+
+
+def hub_client(**kwargs):
+    client = TydomWebSocketClient(mac='001A25123456', password='secret',
+                                  host='192.168.1.20')
+    client.path.connection = HubConnection(client.requests, **kwargs)
+    return client
+
+
+def test_slots_are_freed_without_transac_id():
+    async def run():
+        client = hub_client(echo_transac_id=False)
+        client.requests.timeout = 0.5
+        started = time.monotonic()
+        waiters = [await client.put_devices_data(1000 + i, 1000 + i, 'position', 50)
+                   for i in range(6)]
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        return time.monotonic() - started, results
+
+    elapsed, results = asyncio.run(run())
+    assert not any(isinstance(result, BaseException) for result in results)
+    assert elapsed < 0.5
+
+
+def test_latest_value_wins():
+    async def run():
+        client = hub_client()
+        waiters = [await client.put_devices_data(1000, 1000, 'level', level)
+                   for level in range(0, 101, 10)]
+        await asyncio.gather(*waiters)
+        return client.connection.orders
+
+    assert asyncio.run(run()) == [[{'name': 'level', 'value': 100}]]
+
+
+def test_toggles_are_all_sent_in_order():
+    async def run():
+        client = hub_client()
+        waiters = [await client.put_devices_data(1000, 1000, 'levelCmd', value)
+                   for value in ('ON', 'TOGGLE', 'TOGGLE', 'OFF', 'ON')]
+        await asyncio.gather(*waiters)
+        return [order[0]['value'] for order in client.connection.orders]
+
+    assert asyncio.run(run()) == ['ON', 'TOGGLE', 'TOGGLE', 'ON']
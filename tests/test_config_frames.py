@@ -0,0 +1,71 @@
+'''
+    Configurations are hashed from the raw body of the frame, whether the
+    hub answered GET /configs/file or pushed it. Requests of the large
+    responses are resolved with the raw body, never decoded as a whole.
+'''
+import asyncio
+import contextlib
+import io
+import json
+
+import tydomMessagehandler
+from tydomConnector import TydomWebSocketClient
+from tydomConfigCache import config_hash
+
+
+class MqttClient():
+    def publish_metrics(self, name, metrics):
+        pass
+
+
+config = json.dumps({'id_catalog': 'x', 'endpoints': [
+    {'id_endpoint': i, 'id_device': 1000 + i, 'name': 'Volet %d' % i,
+     'last_usage': 'shutter', 'picto': 'p'} for i in range(3)]},
+    separators=(',', ':'), indent=1).encode()
+
+
+def frame(head, body):
+    return head + b'Content-Type: application/json\r\nContent-Length: %d\r\n\r\n' % len(body) + body
+
+
+def client():
+    tydom_client = TydomWebSocketClient(mac='001A25123456', password='secret',
+                                        host='192.168.1.20')
+    tydom_client.config_cache.file = None
+    return tydom_client
+
+
+def test_pushed_config_is_hashed_from_its_raw_body():
+    async def run():
+        tydom_client = client()
+        handler = tydomMessagehandler.TydomMessageHandler(
+            tydom_client=tydom_client, mqtt_client=MqttClient())
+        with contextlib.redirect_stdout(io.StringIO()):
+            await handler.incomingTriage(frame(b'POST /configs/file HTTP/1.1\r\n', config))
+        return tydom_client.config_cache.hash, handler.device_type
+
+    cached_hash, types = asyncio.run(run())
+    # Not the hash of a re-encoded payload
+    assert cached_hash == config_hash(config)
+    assert types['0_1000'] == 'shutter'
+
+
+def test_config_and_data_requests_resolve_with_raw_body():
+    async def run():
+        tydom_client = client()
+        handler = tydomMessagehandler.TydomMessageHandler(
+            tydom_client=tydom_client, mqtt_client=MqttClient())
+        responses = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            for uri, body in ((b'/configs/file', config), (b'/devices/data', b'[]'),
+                              (b'/info', b'{"productName":"TYDOM"}')):
+                transac_id, future = tydom_client.requests.new_request('GET ' + uri.decode())
+                await handler.incomingTriage(frame(
+                    b'HTTP/1.1 200 OK\r\nUri-Origin: ' + uri +
+                    b'\r\nTransac-Id: ' + transac_id.encode() + b'\r\n', body))
+                responses.append(await future)
+        return responses
+
+    responses = asyncio.run(run())
+    assert [type(response) for response in responses] == [bytes, bytes, str]
+    assert responses[0] == config
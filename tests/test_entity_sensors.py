@@ -0,0 +1,55 @@
+'''
+    The sensors of an entity only publish the values that changed, the
+    other ones wait for the republish interval of the state store.
+'''
+import asyncio
+
+from cover import Cover
+from tydomStateStore import TydomStateStore
+
+
+class MqttClient():
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.published.append((topic, payload))
+
+    def publish_config(self, topic, config, retain=False):
+        pass
+
+
+def attributes(position):
+    return {'device_id': 1000, 'endpoint_id': 1001, 'id': '1001_1000',
+            'name': 'Volet salon', 'cover_name': 'Volet salon', 'position': position,
+            'thermicDefect': False, 'obstacleDefect': False}
+
+
+def sensor_states(mqtt):
+    return sorted(topic for topic, payload in mqtt.published
+                  if topic.startswith(('sensor/', 'binary_sensor/')))
+
+
+def test_only_changed_sensors_are_published():
+    async def run():
+        mqtt = MqttClient()
+        states = TydomStateStore()
+        cover = Cover(tydom_attributes=attributes(10), mqtt=mqtt, states=states)
+        await cover.update()
+        first = sensor_states(mqtt)
+
+        mqtt.published.clear()
+        cover.apply(attributes(20))
+        await cover.update()
+        changed = sensor_states(mqtt)
+
+        mqtt.published.clear()
+        states.force()
+        await cover.update()
+        forced = sensor_states(mqtt)
+        return first, changed, forced
+
+    first, changed, forced = asyncio.run(run())
+    assert 'binary_sensor/tydom/thermicDefect_tydom_1001_1000/state' in first
+    assert changed == ['binary_sensor/tydom/position_tydom_1001_1000/state']
+    assert forced == first
@@ -0,0 +1,42 @@
+import asyncio
+
+from mqtt_broker import Broker
+from mqtt_client import MQTT_Hassio
+
+
+def test_broker_outage_goes_through_the_supervisor():
+    async def run():
+        broker = Broker()
+        port = await broker.start()
+        hassio = MQTT_Hassio('127.0.0.1', port, '', '', False)
+        hassio.supervisor.base_delay = 0.1
+        hassio.supervisor.jitter = 0
+        hassio.supervisor.failure_threshold = 10
+        metrics = []
+        hassio.supervisor.on_change = metrics.append
+        first = await hassio.connect()
+
+        # Outage : connection dropped, new ones refused for a while
+        await broker.stop()
+        await asyncio.sleep(1)
+        failures = hassio.supervisor.failures
+        await broker.start()
+        for _ in range(50):
+            await asyncio.sleep(0.1)
+            if hassio.mqtt_client is not first and hassio.mqtt_client.is_connected:
+                break
+        # gmqtt made no attempt of its own on the lost client
+        await asyncio.sleep(0.5)
+        result = (failures, hassio.supervisor.failures, broker.connections,
+                  len(broker.writers), [m['state'] for m in metrics])
+        await hassio.mqtt_client.disconnect()
+        await broker.stop()
+        return result
+
+    failures, failures_after, connections, open_connections, states = asyncio.run(run())
+    # 0.1, 0.2, 0.4 s backoff during the 1 s outage
+    assert 3 <= failures <= 5
+    assert failures_after == 0
+    assert connections == 2
+    assert open_connections == 1
+    assert states[-1] == 'closed'
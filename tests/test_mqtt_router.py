@@ -0,0 +1,144 @@
+'''
+    MQTT_Hassio.on_message routes every command and request topic shape to
+    the hub of its namespace, and ignores the rest.
+'''
+import asyncio
+import contextlib
+import io
+
+import pytest
+
+from mqtt_client import MQTT_Hassio
+
+
+class Tydom():
+    '''Hub stand-in, records the calls'''
+
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.calls = []
+
+    def __getattr__(self, name):
+        # Awaited or not
+        def call(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+            done = asyncio.get_event_loop().create_future()
+            done.set_result(None)
+            return done
+        return call
+
+
+class MqttClient():
+    is_connected = True
+
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.published.append((topic, payload, retain))
+
+
+def route(topic, payload=b''):
+    hassio = MQTT_Hassio('127.0.0.1', 1883, None, None, False,
+                         home_zone=1, night_zone=2, flush_interval=0)
+    hassio.mqtt_client = MqttClient()
+    tydoms = {namespace: Tydom(namespace) for namespace in ('tydom', 'garage')}
+    for tydom in tydoms.values():
+        hassio.add_tydom(tydom)
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(hassio.on_message(None, topic, payload, 0, {}))
+    return hassio, tydoms
+
+
+def put(device_id, endpoint_id, name, value):
+    return ('put_devices_data', (device_id, endpoint_id, name, value), {})
+
+
+@pytest.mark.parametrize('topic, payload, calls', [
+    ('cover/tydom/1001_1000/set_positionCmd', b'DOWN',
+     [put('1001', '1000', 'positionCmd', 'DOWN')]),
+    ('cover/tydom/1001_1000/set_position', b'42',
+     [put('1001', '1000', 'position', '42')]),
+    ('light/tydom/1002_1000/set_levelCmd', b'TOGGLE',
+     [put('1002', '1000', 'levelCmd', 'TOGGLE')]),
+    ('light/tydom/1002_1000/set_level', b'30',
+     [put('1002', '1000', 'level', '30')]),
+    ('alarm_control_panel/tydom/1003_1000/set_alarm_state', b'ARM_HOME',
+     [('put_alarm_cdata', (), {'device_id': '1003', 'alarm_id': '1000',
+                               'value': 'ON', 'zone_id': 1})]),
+    ('climate/tydom/1004_1000/set_setpoint', b'19.5',
+     [put('1004', '1000', 'setpoint', '19.5')]),
+    ('climate/tydom/1004_1000/set_hvacMode', b'off',
+     [put('1004', '1000', 'thermicLevel', 'STOP')]),
+    ('climate/tydom/1004_1000/set_thermicLevel', b'ECO',
+     [put('1004', '1000', 'thermicLevel', 'ECO')]),
+    ('switch/tydom/1005_1000/set_levelCmdGate', b'TOGGLE',
+     [put('1005', '1000', 'levelCmd', 'TOGGLE')]),
+    ('switch/tydom/1005_1000/set_levelGate', b'100',
+     [put('1005', '1000', 'level', '100')]),
+])
+def test_commands(topic, payload, calls):
+    hassio, tydoms = route(topic, payload)
+    assert tydoms['tydom'].calls == calls
+    assert tydoms['garage'].calls == []
+
+
+def test_command_goes_to_the_hub_of_its_namespace():
+    hassio, tydoms = route('cover/garage/1001_1000/set_position', b'0')
+    assert tydoms['tydom'].calls == []
+    assert tydoms['garage'].calls == [put('1001', '1000', 'position', '0')]
+
+
+@pytest.mark.parametrize('topic, call', [
+    ('homeassistant/requests/tydom/update', 'get_data'),
+    ('cover/tydom/update', 'get_data'),
+    ('homeassistant/requests/tydom/refresh', 'post_refresh'),
+    ('homeassistant/requests/tydom/scenarii', 'get_scenarii'),
+    ('/tydom/init', 'request_reconnect'),
+])
+def test_requests(topic, call):
+    hassio, tydoms = route(topic)
+    assert tydoms['tydom'].calls == [(call, (), {})]
+    assert tydoms['garage'].calls == []
+
+
+def test_kill_request():
+    with pytest.raises(SystemExit):
+        route('cover/tydom/kill')
+
+
+def test_cleanup_request_removes_orphans_of_its_namespace():
+    config = 'homeassistant/cover/{}/1001_1000/config'
+    hassio = MQTT_Hassio('127.0.0.1', 1883, None, None, False, flush_interval=0)
+    hassio.mqtt_client = MqttClient()
+    for namespace in ('tydom', 'garage'):
+        hassio.add_tydom(Tydom(namespace))
+        hassio.seeded_configs[config.format(namespace)] = '{}'
+        # Full devices data handled, no device in the configuration
+        hassio.known_ids[namespace] = set()
+    with contextlib.redirect_stdout(io.StringIO()):
+        asyncio.run(hassio.on_message(
+            None, 'homeassistant/requests/tydom/cleanup', b'', 0, {}))
+    assert hassio.mqtt_client.published == [(config.format('tydom'), b'', True)]
+    assert list(hassio.seeded_configs) == [config.format('garage')]
+
+
+@pytest.mark.parametrize('topic', [
+    # States we publish under the same namespace
+    'cover/tydom/1001_1000/current_position',
+    'sensor/tydom/position_tydom_1001_1000/state',
+    # Commands this tree has no handler for
+    'climate/tydom/1004_1000/set_authorization',
+    'climate/tydom/1004_1000/set_preset',
+    'cover/tydom/1001_1000/set_position_cmd',
+    # Unknown namespace, missing ids, discovery configs
+    'cover/other/1001_1000/set_position',
+    'cover/tydom/1001/set_position',
+    'homeassistant/cover/tydom/1001_1000/config',
+    'homeassistant/requests/other/update',
+    'homeassistant/requests/tydom/unknown',
+])
+def test_ignored_topics(topic):
+    hassio, tydoms = route(topic, b'1')
+    assert tydoms['tydom'].calls == []
+    assert tydoms['garage'].calls == []
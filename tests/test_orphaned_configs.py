@@ -0,0 +1,80 @@
+'''
+    Retained discovery configs are only orphans once a full devices data
+    response is handled, and never when their device is in the hub
+    configuration.
+'''
+import asyncio
+import contextlib
+import io
+import json
+
+import tydomMessagehandler
+from mqtt_client import MQTT_Hassio
+from tydomConnector import TydomWebSocketClient
+
+namespace = 'orphans'
+config = 'homeassistant/{}/' + namespace + '/{}/config'
+
+
+class MqttClient():
+    is_connected = True
+
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.published.append((topic, payload, retain))
+
+
+def devices_data(*devices):
+    return json.dumps([{'id': device_id, 'endpoints': [{
+        'id': endpoint_id, 'error': error, 'data': [
+            {'name': 'position', 'value': 50, 'validity': 'upToDate'}]}]}
+        for device_id, endpoint_id, error in devices]).encode()
+
+
+def frame(head, body):
+    return head + b'Content-Type: application/json\r\nContent-Length: %d\r\n\r\n' % len(body) + body
+
+
+def test_orphans_wait_for_full_devices_data():
+    async def run():
+        tydom_client = TydomWebSocketClient(mac='001A25123456', password='secret',
+                                            host='192.168.1.20', namespace=namespace)
+        hassio = MQTT_Hassio('127.0.0.1', 1883, None, None, False, flush_interval=0)
+        hassio.mqtt_client = MqttClient()
+        hassio.add_tydom(tydom_client)
+        hassio.seeded = True
+        handler = tydomMessagehandler.TydomMessageHandler(
+            tydom_client=tydom_client, mqtt_client=hassio)
+        # Configuration : two covers, 1002 answers with an error
+        for unique_id in ('1_1001', '2_1002'):
+            handler.device_type[unique_id] = 'shutter'
+            handler.device_name[unique_id] = 'Volet ' + unique_id
+        hassio.seeded_configs = {topic: '{}' for topic in (
+            config.format('cover', '1001_1'),
+            config.format('cover', '1002_2'),
+            config.format('binary_sensor', 'thermicdefect_orphans_1002_2'),
+            config.format('cover', '1003_3'))}
+        steps = []
+        with contextlib.redirect_stdout(io.StringIO()):
+            # Single device push, before the devices data response
+            await handler.incomingTriage(frame(
+                b'PUT /devices/data HTTP/1.1\r\n', devices_data((1001, 1, 0))))
+            steps.append(hassio.orphaned_configs(namespace))
+            await hassio.request_cleanup(tydom_client)
+            steps.append(list(hassio.seeded_configs))
+
+            transac_id, future = tydom_client.requests.new_request('GET /devices/data')
+            await handler.incomingTriage(frame(
+                b'HTTP/1.1 200 OK\r\nUri-Origin: /devices/data\r\nTransac-Id: ' +
+                transac_id.encode() + b'\r\n', devices_data((1001, 1, 0), (1002, 2, 1))))
+            await future
+            steps.append(hassio.orphaned_configs(namespace))
+        return steps
+
+    after_push, after_cleanup, after_data = asyncio.run(run())
+    assert after_push == []
+    # Nothing removed while the orphans are not known
+    assert config.format('cover', '1002_2') in after_cleanup
+    assert after_data == [config.format('cover', '1003_3')]
@@ -0,0 +1,67 @@
+'''
+    The receive queue lanes are handled concurrently : a devices data frame
+    waiting in the normal lane must not overwrite the state a newer alarm
+    push of the priority lane set.
+'''
+import asyncio
+import contextlib
+import io
+import json
+
+import tydomMessagehandler
+from mqtt_client import MQTT_Hassio
+from tydomConnector import TydomWebSocketClient
+from tydomReceiveQueue import TydomReceiveQueue
+
+state_topic = 'alarm_control_panel/tydom/1001_1/state'
+
+
+class MqttClient():
+    is_connected = True
+
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.published.append((topic, payload, retain))
+
+
+def frame(head, alarm_mode):
+    body = json.dumps([{'id': 1001, 'endpoints': [{'id': 1, 'error': 0, 'data': [
+        {'name': 'alarmMode', 'value': alarm_mode, 'validity': 'upToDate'},
+        {'name': 'alarmState', 'value': 'OFF', 'validity': 'upToDate'}]}]}]).encode()
+    return head + b'Content-Type: application/json\r\nContent-Length: %d\r\n\r\n' % len(body) + body
+
+
+def test_older_normal_frame_does_not_overwrite_priority_frame():
+    async def run():
+        tydom_client = TydomWebSocketClient(mac='001A25123456', password='secret',
+                                            host='192.168.1.20')
+        tydom_client.config_cache.file = None
+        hassio = MQTT_Hassio('127.0.0.1', 1883, None, None, False, flush_interval=0)
+        hassio.mqtt_client = MqttClient()
+        hassio.add_tydom(tydom_client)
+        handler = tydomMessagehandler.TydomMessageHandler(
+            tydom_client=tydom_client, mqtt_client=hassio)
+        handler.device_type['1_1001'] = 'alarm'
+        handler.device_name['1_1001'] = 'Alarme'
+        queue = TydomReceiveQueue('Tydom', handler.incomingTriage)
+        # Devices data response read just before the alarm was armed
+        transac_id, future = tydom_client.requests.new_request('GET /devices/data')
+        queue.put(frame(b'HTTP/1.1 200 OK\r\nUri-Origin: /devices/data\r\nTransac-Id: ' +
+                        transac_id.encode() + b'\r\n', 'OFF'))
+        queue.put(frame(b'PUT /devices/data HTTP/1.1\r\n', 'ON'))
+        assert queue.lanes['priority'].qsize() == 1
+        with contextlib.redirect_stdout(io.StringIO()):
+            queue.start()
+            await future
+            for worker in queue.workers:
+                worker.cancel()
+        states = [payload for topic, payload, retain in hassio.mqtt_client.published
+                  if topic == state_topic]
+        return tydom_client.states.get(1001, 1, 'alarmMode'), states, tydom_client.states.outdated
+
+    alarm_mode, states, outdated = asyncio.run(run())
+    assert alarm_mode == 'ON'
+    assert states == ['armed_away']
+    assert outdated == 2
@@ -0,0 +1,125 @@
+'''
+    The hub handshake (digest challenge, then websocket upgrade) must not
+    block the event loop : MQTT shares it and keeps working meanwhile.
+'''
+import asyncio
+import os
+import ssl
+import time
+from http import HTTPStatus
+
+import websockets
+
+from tydomConnector import TydomWebSocketClient
+
+certificate = os.path.join(os.path.dirname(__file__), 'hub.pem')
+hub_delay = 0.5
+challenge = ('Digest realm="protected area", qop="auth", '
+             'nonce="f0e1d2c3b4a59687", opaque="0123456789abcdef"')
+
+
+# Tydom hub stand-in, answering each step of the handshake after delay
+async def slow_hub(delay=hub_delay):
+    async def process_request(path, headers):
+        await asyncio.sleep(delay)
+        if 'Authorization' not in headers:
+            return HTTPStatus.UNAUTHORIZED, [('WWW-Authenticate', challenge)], b''
+        return None
+
+    async def handler(websocket, path):
+        await websocket.wait_closed()
+
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certificate)
+    return await websockets.serve(handler, '127.0.0.1', 0, ssl=context,
+                                  process_request=process_request)
+
+
+# Stands for the MQTT client, which runs on the same loop
+async def ticker(ticks, interval=0.01):
+    while True:
+        ticks.append(time.monotonic())
+        await asyncio.sleep(interval)
+
+
+def test_connect_does_not_block_the_loop():
+    async def run():
+        server = await slow_hub()
+        port = server.sockets[0].getsockname()[1]
+        client = TydomWebSocketClient(mac='001A25123456', password='secret',
+                                      host='127.0.0.1')
+        client.path.port = port
+        ticks = []
+        task = asyncio.ensure_future(ticker(ticks))
+        started = time.monotonic()
+        try:
+            await client.connect()
+            elapsed = time.monotonic() - started
+        finally:
+            task.cancel()
+            await client.disconnect()
+            server.close()
+            await server.wait_closed()
+        return elapsed, ticks
+
+    elapsed, ticks = asyncio.run(run())
+    # Challenge and upgrade both waited for the hub
+    assert elapsed >= 2 * hub_delay
+    gaps = [b - a for a, b in zip(ticks, ticks[1:])]
+    assert len(ticks) > elapsed / 0.01 / 2
+    assert max(gaps) < hub_delay / 2
+
+
+def test_connect_tries_every_resolved_address():
+    async def run():
+        server = await slow_hub(delay=0)
+        port = server.sockets[0].getsockname()[1]
+        client = TydomWebSocketClient(mac='001A25123456', password='secret',
+                                      host='tydom.local')
+        client.path.port = port
+        # First address refuses connections, like an unreachable IPv6 one
+        client.addresses['tydom.local'] = (['127.0.0.3', '127.0.0.1'], time.monotonic() + 600)
+        try:
+            await client.connect()
+        finally:
+            await client.disconnect()
+            server.close()
+            await server.wait_closed()
+        return client.addresses['tydom.local'][0]
+
+    addresses = asyncio.run(run())
+    # The next connections start with the address that answered
+    assert addresses == ['127.0.0.1', '127.0.0.3']
+
+
+def test_reconnect_request_keeps_the_queue():
+    async def run():
+        server = await slow_hub(delay=0)
+        port = server.sockets[0].getsockname()[1]
+        client = TydomWebSocketClient(mac='001A25123456', password='secret',
+                                      host='127.0.0.1')
+        client.path.port = port
+        try:
+            await client.connect()
+            queue = client.incoming
+            # What the listener reads after an MQTT init request
+            client.request_reconnect()
+            try:
+                await client.recv()
+                requested = False
+            except ConnectionError:
+                requested = client.reconnect_requested
+            client.incoming.put_nowait(b'stale frame')
+            await client.connect()
+        finally:
+            await client.disconnect()
+            server.close()
+            await server.wait_closed()
+        return requested, client.incoming is queue, client.incoming.qsize(), client.reconnect_requested
+
+    requested, same_queue, queued, still_requested = asyncio.run(run())
+    assert requested
+    # The listener keeps waiting on the queue it already holds
+    assert same_queue
+    assert queued == 0
+    assert not still_requested
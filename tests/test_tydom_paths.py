@@ -0,0 +1,42 @@
+import asyncio
+
+from tydomConnector import TydomWebSocketClient
+from tydomFrames import get_transac_id
+
+
+class BatchedConnection():
+    '''
+        Websocket stand-in, the answers of every frame sent come together
+        once the hub replies
+    '''
+
+    def __init__(self, replies):
+        self.replies = replies
+
+    async def send(self, frame):
+        self.replies.append(get_transac_id(frame))
+
+
+def test_overlapping_pings_do_not_mix_path_rtts():
+    async def run():
+        client = TydomWebSocketClient(mac='001A25123456', password='secret',
+                                      host='192.168.1.20', remote_fallback=True)
+        local, remote = client.paths
+        replies = []
+        local.connection = BatchedConnection(replies)
+        remote.connection = BatchedConnection(replies)
+
+        def reply():
+            for transac_id in replies:
+                client.requests.resolve(transac_id, b'HTTP/1.1 200 OK')
+
+        probe = asyncio.ensure_future(client.probe_path(remote))
+        await asyncio.sleep(0.15)
+        # Another GET /ping, on the active path
+        ping = await client.send_message('GET', '/ping', path=local)
+        await asyncio.sleep(0.05)
+        reply()
+        await asyncio.gather(probe, ping)
+        return remote.rtt
+
+    assert 0.2 <= asyncio.run(run()) < 0.3